@@ -1,8 +1,37 @@
+import argparse
 import base64
+import sys
+import numpy as np
 import pandas as pd
-import json
+import pyarrow.parquet as pq
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "notebooks" / "analysis"))
+from historico_store import PAIS_PRIORITARIO, PODA_EXPLORADOR, evolucion_panel
+from manifiesto import Manifiesto
+from stream_writer import EscritorJSON, escribir_arrow, filas_redondeadas, memoria_pico_mb
+
+parser = argparse.ArgumentParser(description="Empaqueta historico/ en index.html (escritura en flujo)")
+parser.add_argument('--decimales', type=int, default=4, help="Decimales de los floats del payload")
+parser.add_argument('--arrow', action='store_true', help="Escribe también el sidecar Arrow IPC en data_arrow/")
+args = parser.parse_args()
+
+# Umbrales de poda (forman parte de la huella de cada año en el manifiesto)
+PODA = {
+    'top_hubs': 100,                # Hubs: solo top 100
+    'min_dep_critica': 0.7,         # Contador global de relaciones muy críticas
+    'top_dependencias': 10,         # Treemap: top 10 por país
+    'min_criticidad_bilateral': 0,  # Bilateral: solo criticidad real (> umbral)
+    # Explorador: 1% para España, 5% para el resto y top 10 proveedores por importador/industria.
+    # ise_architect ya marca esas filas (columna dashboard); aquí solo se aplican a explorer antiguos
+    'min_dep_esp': PODA_EXPLORADOR['min_dep_esp'],
+    'min_dep_mundo': PODA_EXPLORADOR['min_dep_mundo'],
+    'top_proveedores': PODA_EXPLORADOR['top_proveedores'],
+}
+PARAMETROS = {**PODA, 'decimales': args.decimales}
+TABLAS_ANIO = ['profiles', 'hubs', 'dependencies', 'bilateral', 'explorer']
+BLOQUE_FILAS = 50_000  # Filas del explorador convertidas a listas a la vez
+
 # 1. Logo as base64
 logo_path = Path('logo_elcano.png')
 if logo_path.exists():
@@ -12,8 +41,10 @@ else:
     logo_b64 = ""
 
 # 2. Data as JSON
-datasets = {}
 hist_path = Path('../data/processed/historico')
+manifiesto_dir = hist_path.parent / '_manifiesto'
+cache_dir = Path('_cache')
+arrow_dir = Path('data_arrow')
 
 # Detectar años disponibles
 available_years = sorted([int(f.stem.split('_')[1]) for f in hist_path.glob("profiles_*.parquet")])
@@ -23,107 +54,195 @@ if not available_years:
 
 latest_year = available_years[-1]
 
-datasets['meta'] = {
-    'latest_year': latest_year,
-    'available_years': available_years
-}
+def tablas_anio(year):
+    """Tablas ya podadas de un año (mismas columnas que los year_XXXX.json de data_dist)."""
+    tablas = {}
 
-# Cargar datos por año
-multi_year = {}
-all_profiles_list = []
-all_critical_list = []
-
-for year in available_years:
-    print(f"[*] Optimizando y empaquetando datos de {year}...")
-    year_data = {}
-    
     # PROFILES: Solo columnas necesarias
     df_p = pd.read_parquet(hist_path / f"profiles_{year}.parquet")
     # Asegurar que todas las columnas existen
     p_cols = ['country', 'vulnerability', 'importance', 'global_rank']
     if 'indirect_share' in df_p.columns: p_cols.append('indirect_share')
     if 'num_suppliers_effective' in df_p.columns: p_cols.append('num_suppliers_effective')
-    
-    year_data['profiles'] = df_p[p_cols].to_dict(orient='records')
-    all_profiles_list.append(df_p[['country', 'year', 'vulnerability', 'importance']])
-    
+    tablas['profiles'] = df_p[p_cols]
+
     # HUBS: Solo top 100 para no saturar el JSON pero mantener lo principal
-    df_h = pd.read_parquet(hist_path / f"hubs_{year}.parquet")
-    year_data['hubs'] = df_h.head(100).to_dict(orient='records')
-    
-    # CRITICAL: Para el grafico de evolucion global
-    df_c = pd.read_parquet(hist_path / f"critical_{year}.parquet")
-    # Filtramos solo las muy criticas (>= 70%) para el contador global como pide el usuario
-    df_c_filtered = df_c[df_c['dependencia_total'] >= 0.7]
-    all_critical_list.append(df_c_filtered[['year', 'dependencia_total']])
-    
+    tablas['hubs'] = pd.read_parquet(hist_path / f"hubs_{year}.parquet").head(PODA['top_hubs'])
+
     # DEPENDENCIES: Solo top 10 por país para el Treemap
     df_d = pd.read_parquet(hist_path / f"dependencies_{year}.parquet")
-    df_d = df_d.sort_values('dependency_value', ascending=False).groupby('dependent_country').head(10)
-    year_data['dependencies'] = df_d.to_dict(orient='records')
-    
+    tablas['dependencies'] = df_d.sort_values('dependency_value', ascending=False) \
+        .groupby('dependent_country').head(PODA['top_dependencias'])
+
     # BILATERAL: Filtrar solo los que tienen criticidad real
-    df_b = pd.read_parquet(hist_path / f"bilateral_{year}.parquet")
-    df_b = df_b[df_b['criticidad'] > 0]
-    year_data['bilateral'] = df_b.to_dict(orient='records')
-    
+    df_b = pd.read_parquet(hist_path / f"bilateral_{year}.parquet",
+                           filters=[('criticidad', '>', PODA['min_criticidad_bilateral'])])
+    tablas['bilateral'] = df_b
+
     # EXPLORER: Quitar restricción de España, pero aplicar filtro de significancia
     f_exp = hist_path / f"explorer_{year}.parquet"
-    if f_exp.exists():
-        df_e = pd.read_parquet(f_exp)
-        
-        # FILTRO AGRESIVO: 
-        # Mantener 1% para España (prioridad usuario)
-        # Mantener 5% para el resto del mundo (para no matar la memoria del navegador)
-        esp_mask = (df_e['importer'] == 'ESP') & (df_e['dep_total'] >= 0.01)
-        world_mask = (df_e['importer'] != 'ESP') & (df_e['dep_total'] >= 0.05)
-        df_e = df_e[esp_mask | world_mask]
-        
+    if f_exp.exists() and 'dashboard' in pq.read_schema(f_exp).names:
+        # El arquitecto ya aplicó la poda al construir el explorador: solo se leen las
+        # filas marcadas, ya ordenadas por importador, industria y dependencia total
+        tablas['explorer'] = pq.read_table(f_exp, filters=[('dashboard', '==', True)]) \
+            .drop_columns(['dashboard']).to_pandas()
+    elif f_exp.exists():
+        # Se poda row group a row group (importadores completos, ver historico_store.py) para
+        # no tener nunca el explorador completo del año en memoria
+        parquet_exp = pq.ParquetFile(f_exp)
+        trozos = []
+        for k in range(parquet_exp.num_row_groups):
+            df_e = parquet_exp.read_row_group(k).to_pandas()
+
+            # FILTRO AGRESIVO:
+            # Mantener 1% para España (prioridad usuario)
+            # Mantener 5% para el resto del mundo (para no matar la memoria del navegador)
+            esp_mask = (df_e['importer'] == PAIS_PRIORITARIO) & (df_e['dep_total'] >= PODA['min_dep_esp'])
+            world_mask = (df_e['importer'] != PAIS_PRIORITARIO) & (df_e['dep_total'] >= PODA['min_dep_mundo'])
+            df_e = df_e[esp_mask | world_mask]
+            trozos.append(df_e.sort_values('dep_total', ascending=False, kind='stable')
+                          .groupby(['importer', 'industry']).head(PODA['top_proveedores']))
+
         # Además, nos quedamos solo con el Top 10 de proveedores por industria/importador
-        df_e = df_e.sort_values('dep_total', ascending=False).groupby(['importer', 'industry']).head(10)
-        
-        # Indexación por importador e industria para búsqueda instantánea en JS
-        indexed = {}
-        for imp, group in df_e.groupby('importer'):
-            indexed[imp] = {}
-            for ind, sub in group.groupby('industry'):
-                indexed[imp][ind] = sub.to_dict(orient='records')
-        year_data['explorer_indexed'] = indexed
-        
-    multi_year[year] = year_data
-
-datasets['multi_year'] = multi_year
-
-# 3. Datos consolidados para graficos de evolucion
-if all_profiles_list:
-    datasets['evolution'] = pd.concat(all_profiles_list).to_dict(orient='records')
-
-if all_critical_list:
-    df_glob_all = pd.concat(all_critical_list)
-    risk_evol = df_glob_all.groupby('year').size().reset_index(name='count')
-    datasets['critical_evolution'] = risk_evol.to_dict(orient='records')
-
-# 4. Catálogos
+        # (de nuevo sobre la unión, por si un grupo ocupa varios row groups)
+        df_e = pd.concat(trozos, ignore_index=True)
+        del trozos
+        tablas['explorer'] = df_e.sort_values('dep_total', ascending=False, kind='stable') \
+            .groupby(['importer', 'industry']).head(PODA['top_proveedores'])
+    return tablas
+
+def escribir_anio(year, destino):
+    """Serializa un año en flujo: tablas por columnas y explorador indexado por filas."""
+    tablas = tablas_anio(year)
+    with open(destino, 'w', encoding='utf-8') as f:
+        w = EscritorJSON(f, args.decimales)
+        w.abrir()
+        for nombre in ['profiles', 'hubs', 'dependencies', 'bilateral']:
+            w.clave(nombre)
+            w.tabla(tablas[nombre])
+
+        if 'explorer' in tablas:
+            # Orden estable por importador e industria: cada grupo queda contiguo y conserva
+            # el orden por dep_total; las filas se convierten por bloques de BLOQUE_FILAS
+            df_e = tablas['explorer'].sort_values(['importer', 'industry'], kind='stable')
+            imps = df_e['importer'].to_numpy()
+            inds = df_e['industry'].to_numpy()
+            cortes = np.flatnonzero((imps[1:] != imps[:-1]) | (inds[1:] != inds[:-1])) + 1
+            inicios = np.concatenate([[0], cortes]).tolist()
+            fines = np.concatenate([cortes, [len(df_e)]]).tolist()
+
+            w.clave('explorer_cols')
+            w.valor(df_e.columns.tolist())
+            # Indexación por importador e industria para búsqueda instantánea en JS
+            w.clave('explorer_indexed')
+            w.abrir()
+            actual = None
+            bloque, inicio_bloque = [], 0
+            for a, b in zip(inicios, fines):
+                if b > inicio_bloque + len(bloque):
+                    # Siguiente bloque de filas ya redondeadas (los grupos nunca se parten)
+                    inicio_bloque = a
+                    bloque = filas_redondeadas(df_e.iloc[a:max(b, a + BLOQUE_FILAS)], args.decimales)
+                if imps[a] != actual:
+                    if actual is not None:
+                        w.cerrar()
+                    actual = imps[a]
+                    w.clave(actual)
+                    w.abrir()
+                w.clave(inds[a])
+                w.valor(bloque[a - inicio_bloque:b - inicio_bloque])
+            if actual is not None:
+                w.cerrar()
+            w.cerrar()
+        w.cerrar()
+
+    if args.arrow:
+        escribir_arrow(arrow_dir / f"year_{year}", tablas)
+    del tablas
+
+# 3. Un fragmento por año (solo se re-serializan los años cuyo historico o poda cambió)
+fragmentos = {}
+evolution, critical = [], []
+# Evolución de todos los años en dos lecturas del panel multi-año (panel.py) si cubre los
+# mismos años y es posterior a historico/; si no, año a año
+panel = evolucion_panel(hist_path.parent / 'panel', available_years, hist_path, PODA['min_dep_critica'])
+if panel is not None:
+    print("[=] Evolución desde el panel multi-año")
+
+for year in available_years:
+    if panel is None:
+        evolution.append(pd.read_parquet(hist_path / f"profiles_{year}.parquet",
+                                         columns=['country', 'year', 'vulnerability', 'importance', 'global_rank']))
+        # CRITICAL: Para el grafico de evolucion global
+        df_c = pd.read_parquet(hist_path / f"critical_{year}.parquet", columns=['year', 'dependencia_total'])
+        # Filtramos solo las muy criticas (>= 70%) para el contador global como pide el usuario
+        critical.append(df_c.loc[df_c['dependencia_total'] >= PODA['min_dep_critica'], ['year']])
+
+    manifiesto = Manifiesto(f"dashboard_{year}", manifiesto_dir)
+    # El fragmento lo serializa stream_writer (EscritorJSON / valores_columna): también es entrada
+    entradas = manifiesto.huellas([hist_path / f"{t}_{year}.parquet" for t in TABLAS_ANIO]
+                                  + [Path(__file__).resolve(), Path(__file__).resolve().with_name("stream_writer.py")])
+    fragmentos[year] = cache_dir / f"year_{year}.json"
+    salidas = [fragmentos[year]]
+    if args.arrow:
+        salidas += [arrow_dir / f"year_{year}_{t}.arrow" for t in TABLAS_ANIO
+                    if t != 'explorer' or (hist_path / f"explorer_{year}.parquet").exists()]
+    if manifiesto.al_dia(entradas, PARAMETROS, salidas):
+        print(f"[=] {year} sin cambios (caché)")
+        continue
+
+    print(f"[*] Optimizando y empaquetando datos de {year}...")
+    cache_dir.mkdir(exist_ok=True)
+    escribir_anio(year, fragmentos[year])
+    manifiesto.registrar(entradas, PARAMETROS, salidas)
+
+# 4. Catálogos y evolución (meta, en el mismo formato que data_dist/meta.json)
 ind_path = Path('../data/processed/dependencias_consolidadas/industrias_id_nombre.parquet')
-if ind_path.exists():
-    df_ind = pd.read_parquet(ind_path)
-    df_ind['industry_id'] = df_ind['industry_id'].astype(str)
-    datasets['industries'] = df_ind.to_dict(orient='records')
+df_ind = pd.read_parquet(ind_path) if ind_path.exists() else pd.DataFrame()
+if panel is not None:
+    df_evol, df_crit = panel
 else:
-    datasets['industries'] = []
-
-# 5. Inyectar en el HTML
-data_json = json.dumps(datasets, ensure_ascii=False)
+    df_evol = pd.concat(evolution)
+    df_crit = pd.concat(critical).groupby('year').size().reset_index(name='count')
 
+# 5. Inyectar en el HTML escribiendo el payload en flujo dentro de <script id="iseData">
 with open('template.html', 'r', encoding='utf-8') as f:
     html = f.read()
-
 html = html.replace('__LOGO_BASE64__', f'data:image/png;base64,{logo_b64}')
-html = html.replace('__DATA_JSON__', data_json)
+if '__DATA_JSON__' not in html:
+    raise SystemExit("❌ template.html no tiene el marcador __DATA_JSON__")
+cabecera, cola = html.split('__DATA_JSON__', 1)
+del html
 
 with open('index.html', 'w', encoding='utf-8') as f:
-    f.write(html)
-
+    f.write(cabecera)
+    inicio_payload = f.tell()
+    w = EscritorJSON(f, args.decimales)
+    w.abrir()
+    w.clave('meta')
+    w.abrir()
+    w.clave('latest_year'); w.valor(latest_year)
+    w.clave('available_years'); w.valor(available_years)
+    w.clave('evolution'); w.valor(filas_redondeadas(df_evol, args.decimales))
+    w.clave('evolution_cols'); w.valor(df_evol.columns.tolist())
+    w.clave('critical_evolution'); w.valor(df_crit.values.tolist())
+    w.clave('industries'); w.valor(df_ind.values.tolist())
+    w.cerrar()
+    w.clave('years')
+    w.abrir()
+    for year, fragmento in fragmentos.items():
+        w.clave(year)
+        w.crudo(fragmento)
+    w.cerrar()
+    w.cerrar()
+    tamano_payload = f.tell() - inicio_payload
+    f.write(cola)
+    tamano_total = f.tell()
+
+pico = memoria_pico_mb()
 print(f'\n[OK] Dashboard reparado y optimizado globalmente!')
 print(f'   - Años en serie: {available_years}')
-print(f'   - Tamaño total del archivo: {len(data_json)/1024/1024:.2f} MB')
+print(f'   - Datos incrustados: {tamano_payload/1024/1024:.2f} MB · index.html: {tamano_total/1024/1024:.2f} MB')
+print(f'   - Memoria pico del build: {pico:.0f} MB' if pico is not None else '   - Memoria pico del build: n/d')
+if args.arrow:
+    print(f'   - Sidecar Arrow IPC: {sum(p.stat().st_size for p in arrow_dir.glob("*.arrow"))/1024/1024:.2f} MB en {arrow_dir}/')
@@ -1,12 +1,50 @@
+"""
+Dashboard fragmentado en data_dist/ (el template lo pide con fetch):
+
+    meta.json                    evolución, años e industrias
+    year_{año}.json              profiles, hubs, dependencies y bilateral del año
+    explorer_{año}/{ISO3}.json   explorador de un importador (solo al consultarlo)
+    year_{año}.manifiesto.json   bytes (json / gz / br) y filas de cada fragmento del año
+    manifiesto.json              los de todos los años
+
+Formato compacto (FORMATO = 2, stream_writer.tabla_compacta): cada fichero lleva
+arriba los diccionarios de países e industrias y las filas usan sus códigos enteros;
+los floats van cuantizados a DECIMALES decimales como enteros y cada tabla va por
+columnas. Junto a cada JSON se escribe su .gz (y .br con brotli) para servirlos
+precomprimidos.
+"""
 import base64
+import shutil
+import sys
+import numpy as np
 import pandas as pd
 import json
+import pyarrow.parquet as pq
 from pathlib import Path
 
 BASE_DIR = Path(__file__).parent
 DATA_DIST = BASE_DIR / "data_dist"
 HIST_PATH = BASE_DIR.parent / "data" / "processed" / "historico"
 
+sys.path.insert(0, str(BASE_DIR.resolve().parent / "notebooks" / "analysis"))
+from manifiesto import Manifiesto
+from historico_store import evolucion_panel, iterar_paises, leer_indice
+from stream_writer import COLUMNAS_DICCIONARIO, escribir_variantes, rutas_variantes, tabla_compacta
+
+# Umbrales de poda (forman parte de la huella de cada year_XXXX.json en el manifiesto)
+PODA = {
+    'top_hubs': 100,
+    'top_dependencias': 10,
+    'min_criticidad_bilateral': 0,
+    'min_dep_explorer': 0.1,     # España siempre; resto del mundo desde el 10%
+    'top_proveedores': 5,
+}
+TABLAS_ANIO = ['profiles', 'hubs', 'dependencies', 'bilateral', 'explorer']
+FORMATO = 2     # Versión del formato de los fragmentos (el template lee también el anterior)
+DECIMALES = 4   # Precisión de los floats cuantizados (la misma que build.py por defecto)
+PARAMETROS = {**PODA, 'formato': FORMATO, 'decimales': DECIMALES}
+EVOLUCION_COLS = ['country', 'year', 'vulnerability', 'importance', 'global_rank']
+
 # 1. Logo as base64
 logo_path = BASE_DIR / "logo_elcano.png"
 logo_b64 = base64.b64encode(open(logo_path, 'rb').read()).decode() if logo_path.exists() else ""
@@ -17,33 +55,65 @@ latest_year = available_years[-1]
 
 # 2. META.JSON (Compacto)
 print("[*] Generando meta.json...")
-all_profiles = []
-all_critical = []
-for year in available_years:
-    df_p = pd.read_parquet(HIST_PATH / f"profiles_{year}.parquet")
-    all_profiles.append(df_p[['country', 'year', 'vulnerability', 'importance', 'global_rank']])
-    df_c = pd.read_parquet(HIST_PATH / f"critical_{year}.parquet")
-    all_critical.append(df_c[df_c['dependencia_total'] >= 0.7][['year', 'dependencia_total']])
+# Del panel multi-año (panel.py) si cubre los mismos años y es posterior a historico/
+panel = evolucion_panel(HIST_PATH.parent / "panel", available_years, HIST_PATH, 0.7)
+if panel is not None:
+    df_evol, df_crit = panel
+else:
+    all_profiles = []
+    all_critical = []
+    for year in available_years:
+        df_p = pd.read_parquet(HIST_PATH / f"profiles_{year}.parquet")
+        all_profiles.append(df_p[EVOLUCION_COLS])
+        df_c = pd.read_parquet(HIST_PATH / f"critical_{year}.parquet")
+        all_critical.append(df_c[df_c['dependencia_total'] >= 0.7][['year', 'dependencia_total']])
+    df_evol = pd.concat(all_profiles)
+    df_crit = pd.concat(all_critical).groupby('year').size().reset_index(name='count')
+
+def _diccionario(*series):
+    """Valores distintos (texto, ordenados) de varias columnas como índice para get_indexer."""
+    valores = set()
+    for serie in series:
+        valores.update(pd.unique(serie.astype(str)))
+    return pd.Index(sorted(valores))
+
 
+paises_meta = _diccionario(df_evol['country'])
 meta = {
+    'formato': FORMATO,
     'latest_year': latest_year,
     'available_years': available_years,
-    'evolution': pd.concat(all_profiles).values.tolist(), # List of lists
-    'evolution_cols': ['country', 'year', 'vulnerability', 'importance', 'global_rank'],
-    'critical_evolution': pd.concat(all_critical).groupby('year').size().reset_index(name='count').values.tolist()
+    'paises': paises_meta.tolist(),
+    'evolution': tabla_compacta(df_evol[EVOLUCION_COLS], {'paises': paises_meta}, DECIMALES),
+    'evolution_cols': EVOLUCION_COLS,
+    'critical_evolution': df_crit.values.tolist()
 }
 
 ind_path = BASE_DIR.parent / 'data/processed/dependencias_consolidadas/industrias_id_nombre.parquet'
 meta['industries'] = pd.read_parquet(ind_path).values.tolist() if ind_path.exists() else []
 
-with open(DATA_DIST / 'meta.json', 'w', encoding='utf-8') as f:
-    json.dump(meta, f, ensure_ascii=False)
+DATA_DIST.mkdir(parents=True, exist_ok=True)
+escribir_variantes(DATA_DIST / 'meta.json', meta)
 
 # 3. YEAR_XXXX.JSON (Ultra Compacto)
-def to_compact(df, cols):
-    return {'c': cols, 'd': df[cols].values.tolist()}
-
 for year in available_years:
+    # Solo se regeneran los años cuyo historico, poda, formato o script han cambiado
+    manifiesto = Manifiesto(f"data_dist_{year}", HIST_PATH.parent / "_manifiesto")
+    entradas = manifiesto.huellas([HIST_PATH / f"{t}_{year}.parquet" for t in TABLAS_ANIO]
+                                  + [Path(__file__).resolve(), (BASE_DIR / "stream_writer.py").resolve()])
+    salida = DATA_DIST / f'year_{year}.json'
+    ruta_manifiesto = DATA_DIST / f'year_{year}.manifiesto.json'
+    f_exp = HIST_PATH / f"explorer_{year}.parquet"
+    # Un fragmento JSON por importador que el template solo pide al consultar ese país
+    dir_shards = DATA_DIST / f'explorer_{year}'
+    # Con brotli instalado el .br también es salida: si falta, el año se regenera
+    salidas = rutas_variantes(salida) + [ruta_manifiesto]
+    if f_exp.exists():
+        salidas.append(dir_shards)
+    if manifiesto.al_dia(entradas, PARAMETROS, salidas):
+        print(f"[=] {year} sin cambios")
+        continue
+
     print(f"[*] Optimizando {year}...")
     # Profiles
     df_p = pd.read_parquet(HIST_PATH / f"profiles_{year}.parquet")
@@ -52,39 +122,108 @@ for year in available_years:
     if 'num_suppliers_effective' in df_p.columns: p_cols.append('num_suppliers_effective')
     
     # Hubs
-    df_h = pd.read_parquet(HIST_PATH / f"hubs_{year}.parquet").head(100)
+    df_h = pd.read_parquet(HIST_PATH / f"hubs_{year}.parquet").head(PODA['top_hubs'])
     
     # Dependencies
     df_d = pd.read_parquet(HIST_PATH / f"dependencies_{year}.parquet")
-    df_d = df_d.sort_values('dependency_value', ascending=False).groupby('dependent_country').head(10)
+    df_d = df_d.sort_values('dependency_value', ascending=False).groupby('dependent_country').head(PODA['top_dependencias'])
     
     # Bilateral
     df_b = pd.read_parquet(HIST_PATH / f"bilateral_{year}.parquet")
-    df_b = df_b[df_b['criticidad'] > 0]
+    df_b = df_b[df_b['criticidad'] > PODA['min_criticidad_bilateral']]
+
+    tablas = {'profiles': df_p[p_cols], 'hubs': df_h, 'dependencies': df_d, 'bilateral': df_b}
+
+    # Diccionarios del año: países e industrias de todas las tablas (del explorador solo
+    # se leen sus tres columnas de texto)
+    columnas_texto = {nombre: [] for nombre in ('paises', 'industrias')}
+    for df in tablas.values():
+        for col in df.columns:
+            if col in COLUMNAS_DICCIONARIO:
+                columnas_texto[COLUMNAS_DICCIONARIO[col]].append(df[col])
+    explorer_cols = []
+    if f_exp.exists():
+        explorer_cols = [c for c in pq.read_schema(f_exp).names if c != 'dashboard']
+        textos = pd.read_parquet(f_exp, columns=['importer', 'exporter', 'industry'])
+        columnas_texto['paises'] += [textos['importer'], textos['exporter']]
+        columnas_texto['industrias'].append(textos['industry'])
+        del textos
+    diccionarios = {nombre: _diccionario(*series) for nombre, series in columnas_texto.items()}
 
     year_data = {
-        'profiles': to_compact(df_p, p_cols),
-        'hubs': to_compact(df_h, df_h.columns.tolist()),
-        'dependencies': to_compact(df_d, df_d.columns.tolist()),
-        'bilateral': to_compact(df_b, df_b.columns.tolist())
+        'formato': FORMATO,
+        'paises': diccionarios['paises'].tolist(),
+        'industrias': diccionarios['industrias'].tolist(),
+        **{nombre: tabla_compacta(df, diccionarios, DECIMALES) for nombre, df in tablas.items()},
     }
+    fragmentos = {}
 
     # Explorer (este es el más pesado, lo filtramos agresivamente)
-    f_exp = HIST_PATH / f"explorer_{year}.parquet"
     if f_exp.exists():
-        df_e = pd.read_parquet(f_exp)
-        df_e = df_e[(df_e['importer'] == 'ESP') | (df_e['dep_total'] >= 0.1)]
-        df_e = df_e.sort_values('dep_total', ascending=False).groupby(['importer', 'industry']).head(5)
-        
-        indexed = {}
-        for imp, group in df_e.groupby('importer'):
-            indexed[imp] = {}
-            for ind, sub in group.groupby('industry'):
-                indexed[imp][ind] = sub.values.tolist()
-        year_data['explorer_indexed'] = indexed
-        year_data['explorer_cols'] = df_e.columns.tolist()
-
-    with open(DATA_DIST / f'year_{year}.json', 'w', encoding='utf-8') as f:
-        json.dump(year_data, f, ensure_ascii=False, separators=(',', ':')) # Sin espacios
-
-print("[OK] Dashboard compactado.")
+        # Ordenado por importador (ise_architect.py): se recorre país a país sin cargar el año.
+        # Los explorer antiguos sin índice se agrupan en memoria
+        if leer_indice(f_exp) is not None:
+            por_importador = iterar_paises(f_exp, columns=explorer_cols)
+        else:
+            por_importador = pd.read_parquet(f_exp, columns=explorer_cols).groupby('importer')
+
+        if dir_shards.exists():
+            shutil.rmtree(dir_shards)
+        dir_shards.mkdir(parents=True)
+        importadores = []
+        for imp, df_e in por_importador:
+            df_e = df_e[(df_e['importer'] == 'ESP') | (df_e['dep_total'] >= PODA['min_dep_explorer'])]
+            df_e = df_e.sort_values('dep_total', ascending=False, kind='stable') \
+                .groupby(['importer', 'industry']).head(PODA['top_proveedores'])
+            if df_e.empty:
+                continue
+
+            # Filas de cada industria contiguas (por dependencia dentro de cada una):
+            # grupos = [[código de industria, inicio, fin], ...]
+            df_e = df_e.sort_values('industry', kind='stable').reset_index(drop=True)
+            industrias = df_e['industry'].astype(str).to_numpy()
+            inicios = np.concatenate([[0], np.flatnonzero(industrias[1:] != industrias[:-1]) + 1])
+            fines = np.concatenate([inicios[1:], [len(df_e)]])
+            fragmento = tabla_compacta(df_e, diccionarios, DECIMALES)
+            fragmento['grupos'] = [[int(diccionarios['industrias'].get_loc(industrias[a])), int(a), int(b)]
+                                   for a, b in zip(inicios.tolist(), fines.tolist())]
+            fragmentos[imp] = {'filas': len(df_e), **escribir_variantes(dir_shards / f'{imp}.json', fragmento)}
+            importadores.append(imp)
+        year_data['explorer_cols'] = explorer_cols
+        year_data['explorer_shards'] = importadores
+
+    tamanos = escribir_variantes(salida, year_data)
+    with open(ruta_manifiesto, 'w', encoding='utf-8') as f:
+        json.dump({
+            'year': year,
+            'formato': FORMATO,
+            'fichero': {**tamanos, 'filas': {nombre: len(df) for nombre, df in tablas.items()}},
+            'explorer': fragmentos,
+        }, f, ensure_ascii=False)
+    manifiesto.registrar(entradas, PARAMETROS, salidas)
+
+# 4. MANIFIESTO.JSON: bytes y filas de todos los fragmentos (también de los años sin cambios)
+resumen = {'formato': FORMATO, 'meta': {}, 'anios': {}, 'total': {}}
+for variante in ('bytes', 'gz', 'br'):
+    ruta = DATA_DIST / ('meta.json' + {'bytes': '', 'gz': '.gz', 'br': '.br'}[variante])
+    if ruta.exists():
+        resumen['meta'][variante] = ruta.stat().st_size
+ficheros = [resumen['meta']]
+for year in available_years:
+    ruta_manifiesto = DATA_DIST / f'year_{year}.manifiesto.json'
+    if not ruta_manifiesto.exists():
+        continue
+    with open(ruta_manifiesto, encoding='utf-8') as f:
+        anio = json.load(f)
+    resumen['anios'][str(year)] = anio
+    ficheros += [anio['fichero'], *anio['explorer'].values()]
+for entrada in ficheros:
+    for variante in ('bytes', 'gz', 'br'):
+        if variante in entrada:
+            resumen['total'][variante] = resumen['total'].get(variante, 0) + entrada[variante]
+with open(DATA_DIST / 'manifiesto.json', 'w', encoding='utf-8') as f:
+    json.dump(resumen, f, ensure_ascii=False, indent=1)
+
+tot = resumen['total']
+print(f"[OK] Dashboard compactado: {tot.get('bytes', 0) / 1e6:.1f} MB JSON, {tot.get('gz', 0) / 1e6:.1f} MB gzip"
+      + (f", {tot['br'] / 1e6:.1f} MB brotli" if 'br' in tot else ""))
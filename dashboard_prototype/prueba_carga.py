@@ -0,0 +1,125 @@
+"""
+PRUEBA DE CARGA DEL SERVICIO LOCAL (servidor.py)
+Lanza peticiones concurrentes con la mezcla de consultas del dashboard (perfil,
+explorador, hubs, evolución) y mide latencia p50/p99 y rendimiento desde el cliente;
+al final muestra también las métricas que registra el propio servidor.
+
+    python prueba_carga.py --peticiones 2000 --hilos 8               # servidor ya arrancado
+    python prueba_carga.py --lanzar --historico ../data/processed/historico
+"""
+import argparse
+import json
+import random
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+# Peso relativo de cada consulta (el explorador y el perfil dominan en el dashboard)
+MEZCLA = {'perfil': 3, 'explorador': 5, 'hubs': 1, 'evolucion': 1}
+
+
+def _get(url, timeout=30):
+    with urllib.request.urlopen(url, timeout=timeout) as r:
+        return r.status, r.read()
+
+
+def esperar_servidor(base, segundos=30):
+    limite = time.time() + segundos
+    while time.time() < limite:
+        try:
+            return json.loads(_get(f"{base}/api/anios", timeout=2)[1])
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise SystemExit(f"❌ El servidor no responde en {base}")
+
+
+def generar_peticiones(base, n, semilla=0):
+    """URLs de prueba con países, industrias y años reales del catálogo."""
+    rng = random.Random(semilla)
+    anios = json.loads(_get(f"{base}/api/anios")[1])['available_years']
+    catalogos = {y: json.loads(_get(f"{base}/api/catalogo?year={y}")[1]) for y in anios}
+    tipos = list(MEZCLA)
+    pesos = [MEZCLA[t] for t in tipos]
+
+    urls = []
+    for tipo in rng.choices(tipos, pesos, k=n):
+        y = rng.choice(anios)
+        paises, industrias = catalogos[y]['countries'], catalogos[y]['industries']
+        # Mitad de las consultas sobre España (el caso más frecuente en el dashboard)
+        pais = 'ESP' if 'ESP' in paises and rng.random() < 0.5 else rng.choice(paises)
+        if tipo == 'perfil':
+            q = {'country': pais, 'year': y}
+        elif tipo == 'explorador':
+            q = {'importer': pais, 'industry': rng.choice(industrias), 'year': y}
+        elif tipo == 'hubs':
+            q = {'year': y, 'n': rng.choice([10, 100])}
+        else:
+            q = {'country': pais} if rng.random() < 0.7 else {}
+        urls.append((tipo, f"{base}/api/{tipo}?{urllib.parse.urlencode(q)}"))
+    return urls
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga del servicio local ISE")
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--peticiones', type=int, default=2000)
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--lanzar', action='store_true', help="Arranca servidor.py en un subproceso")
+    parser.add_argument('--historico', help="Carpeta historico/ para el servidor lanzado")
+    args = parser.parse_args(argv)
+
+    base = args.url.rstrip('/')
+    proceso = None
+    if args.lanzar:
+        puerto = urllib.parse.urlparse(base).port or 8000
+        cmd = [sys.executable, str(Path(__file__).with_name('servidor.py')), '--puerto', str(puerto)]
+        if args.historico:
+            cmd += ['--historico', args.historico]
+        proceso = subprocess.Popen(cmd)
+
+    try:
+        esperar_servidor(base)
+        urls = generar_peticiones(base, args.peticiones, args.semilla)
+
+        def medir(peticion):
+            tipo, url = peticion
+            inicio = time.perf_counter()
+            try:
+                estado, _ = _get(url)
+            except urllib.error.HTTPError as e:
+                estado = e.code
+            return tipo, estado, time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(args.hilos) as pool:
+            resultados = list(pool.map(medir, urls))
+        total = time.perf_counter() - inicio
+
+        print(f"\n[OK] {len(resultados)} peticiones en {total:.2f} s "
+              f"({len(resultados) / total:.0f} pet/s, {args.hilos} hilos)")
+        print(f"{'endpoint':<12}{'n':>7}{'errores':>9}{'p50 ms':>10}{'p99 ms':>10}")
+        for tipo in MEZCLA:
+            lat = np.array([s for t, _, s in resultados if t == tipo]) * 1000
+            errores = sum(1 for t, e, _ in resultados if t == tipo and e != 200)
+            if len(lat):
+                print(f"{tipo:<12}{len(lat):>7}{errores:>9}{np.percentile(lat, 50):>10.2f}{np.percentile(lat, 99):>10.2f}")
+
+        metricas = json.loads(_get(f"{base}/api/metricas")[1])
+        print("\n[*] Métricas del servidor (incluye la caché LRU):")
+        print(json.dumps(metricas, indent=2, ensure_ascii=False))
+    finally:
+        if proceso is not None:
+            proceso.terminate()
+            proceso.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,389 @@
+"""
+SERVICIO LOCAL DE CONSULTAS ISE
+Sirve al dashboard solo las porciones que necesita de data/processed/historico/
+consultando los Parquet con DuckDB embebido (sin servicios externos), en lugar de
+incrustar todo el histórico en index.html.
+
+    python servidor.py --puerto 8000
+
+Endpoints (GET, JSON; las tablas van por columnas {c, v} como en build.py):
+    /api/anios                                     años disponibles
+    /api/catalogo?year=                            países e industrias del año
+    /api/perfil?country=ESP&year=                  perfil, dependencias, bilateral y hub del país
+    /api/explorador?importer=ESP&industry=...&year=[&min_dep=&top=]
+    /api/hubs?year=[&n=100]                        top-N intermediarios
+    /api/evolucion[?country=ESP]                   serie del país o recuento global de críticas
+    /api/cambios?importer=ESP[&industry=&year=&n=20]  mayores cambios de dependencia frente al año anterior
+    /api/traza?year=&industry=...&exporter=CHN&importer=ESP[&top=5]  traza del par (trazas.py)
+    /api/metricas                                  latencias p50/p99 por endpoint y estado de la caché
+
+Los filtros del explorador (ESP >= 1 %, resto >= 5 %, top 10 proveedores) se aplican en
+cada consulta y pueden cambiarse por parámetro. Las respuestas se guardan en una caché
+LRU cuya clave incluye la huella (tamaño y mtime) de los Parquet consultados, así que un
+histórico regenerado nunca sirve datos viejos.
+
+Si existe el panel multi-año (notebooks/analysis/panel.py, data/processed/panel/) y está
+al día, /api/evolucion sale de él en lugar de leer profiles_ y critical_ de cada año, y
+/api/cambios consulta sus variaciones anuales por par.
+
+/api/traza explica la dependencia de un par desde el almacén del motor
+(dependencias_consolidadas/results_{año}/) con la caché de matrices por industria de
+notebooks/analysis/trazas.py: sumas por longitud y rutas más fuertes con el desglose
+X / importaciones / T de cada salto.
+"""
+import argparse
+import json
+import math
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import duckdb
+import numpy as np
+
+from stream_writer import valores_columna
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "notebooks" / "analysis"))
+from historico_store import PAIS_PRIORITARIO, PODA_EXPLORADOR, evolucion_panel
+from trazas import CACHE_MB, ServicioTrazas
+
+HISTORICO = Path(__file__).resolve().parent.parent / "data" / "processed" / "historico"
+PANEL = HISTORICO.parent / "panel"
+RESULTADOS = HISTORICO.parent / "dependencias_consolidadas"
+
+# Mismos umbrales que la poda de build.py, ahora por defecto de cada consulta
+FILTROS = {
+    'min_dep_esp': PODA_EXPLORADOR['min_dep_esp'],          # Explorador: 1% para España
+    'min_dep_mundo': PODA_EXPLORADOR['min_dep_mundo'],      # Explorador: 5% para el resto del mundo
+    'top_proveedores': PODA_EXPLORADOR['top_proveedores'],  # Explorador: top 10 por importador/industria
+    'top_hubs': 100,
+    'top_dependencias': 10,
+    'min_dep_critica': 0.7,  # Evolución global: relaciones muy críticas
+    'top_cambios': 20,       # Cambios frente al año anterior (panel)
+    'top_caminos_traza': 5,  # Rutas con desglose en /api/traza
+}
+MUESTRAS_LATENCIA = 10_000   # Últimas peticiones por endpoint para p50/p99
+
+
+class ErrorConsulta(Exception):
+    """Parámetro ausente o inválido (respuesta 400) o recurso inexistente (404)."""
+
+    def __init__(self, mensaje, estado=400):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def _tabla(df, decimales=4):
+    return {'c': df.columns.tolist(), 'v': [valores_columna(df[c], decimales) for c in df.columns]}
+
+
+class ServicioISE:
+    """Consultas DuckDB sobre historico/ con caché LRU de respuestas y métricas de latencia."""
+
+    def __init__(self, historico=HISTORICO, tam_cache=1024, decimales=4, panel=None, resultados=None,
+                 cache_trazas_mb=CACHE_MB):
+        self.historico = Path(historico)
+        self.panel = Path(panel) if panel is not None else self.historico.parent / "panel"
+        self.resultados = Path(resultados) if resultados is not None else self.historico.parent / "dependencias_consolidadas"
+        self.trazas = ServicioTrazas(self.resultados, cache_trazas_mb)
+        self.decimales = decimales
+        self._local = threading.local()
+        self._base = duckdb.connect()
+        self._latencias = defaultdict(lambda: deque(maxlen=MUESTRAS_LATENCIA))
+        self._lock = threading.Lock()
+        self._respuesta = lru_cache(maxsize=tam_cache)(self._calcular)
+        self.endpoints = {
+            'anios': self.anios,
+            'catalogo': self.catalogo,
+            'perfil': self.perfil,
+            'explorador': self.explorador,
+            'hubs': self.hubs,
+            'evolucion': self.evolucion,
+            'cambios': self.cambios,
+            'traza': self.traza,
+        }
+
+    # ---------- infraestructura ----------
+
+    def _con(self):
+        # Una conexión DuckDB por hilo (cursor() comparte la base en memoria)
+        if not hasattr(self._local, 'con'):
+            self._local.con = self._base.cursor()
+        return self._local.con
+
+    def _df(self, sql, params=()):
+        return self._con().execute(sql, list(params)).df()
+
+    def _ruta(self, tabla, year):
+        ruta = self.historico / f"{tabla}_{year}.parquet"
+        if not ruta.exists():
+            raise ErrorConsulta(f"No hay {tabla} para {year}", 404)
+        # Ruta literal en el SQL: el año ya es un entero validado y el nombre es fijo
+        return "'" + str(ruta).replace("'", "''") + "'"
+
+    def _anios(self):
+        return sorted(int(f.stem.split('_')[1]) for f in self.historico.glob("profiles_*.parquet"))
+
+    def _version(self):
+        """Huella barata del histórico, del panel y de los almacenes del motor (tamaño y mtime) para la caché."""
+        ficheros = list(self.historico.glob("*.parquet")) + list(self.panel.glob("*.parquet"))
+        ficheros += list(self.panel.glob("parametros.json"))
+        ficheros += list(self.resultados.glob("results_*/*.parquet"))
+        return tuple(sorted((str(f), s.st_size, s.st_mtime_ns) for f in ficheros for s in [f.stat()]))
+
+    def _year(self, params):
+        anios = self._anios()
+        if not anios:
+            raise ErrorConsulta("No hay datos en historico/", 404)
+        if 'year' not in params:
+            return anios[-1]
+        try:
+            year = int(params['year'])
+        except ValueError:
+            raise ErrorConsulta(f"year inválido: {params['year']}") from None
+        if year not in anios:
+            raise ErrorConsulta(f"Año no disponible: {year}", 404)
+        return year
+
+    @staticmethod
+    def _requerido(params, nombre):
+        if not params.get(nombre):
+            raise ErrorConsulta(f"Falta el parámetro {nombre}")
+        return params[nombre]
+
+    @staticmethod
+    def _numero(params, nombre, defecto, tipo=float):
+        """Parámetro numérico finito y no negativo (top, n, min_dep, year...)."""
+        try:
+            valor = tipo(params.get(nombre, defecto))
+        except ValueError:
+            raise ErrorConsulta(f"{nombre} inválido: {params[nombre]}") from None
+        if not math.isfinite(valor) or valor < 0:
+            raise ErrorConsulta(f"{nombre} inválido: {params[nombre]}")
+        return valor
+
+    def _calcular(self, endpoint, params, version):
+        cuerpo = self.endpoints[endpoint](dict(params))
+        return json.dumps(cuerpo, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def responder(self, endpoint, params):
+        """(estado HTTP, cuerpo JSON en bytes, de_cache) de una petición, midiendo su latencia."""
+        inicio = time.perf_counter()
+        de_cache = False
+        try:
+            if endpoint == 'metricas':
+                estado, cuerpo = 200, json.dumps(self.metricas()).encode('utf-8')
+            elif endpoint not in self.endpoints:
+                raise ErrorConsulta(f"Endpoint desconocido: {endpoint}", 404)
+            else:
+                aciertos = self._respuesta.cache_info().hits
+                cuerpo = self._respuesta(endpoint, tuple(sorted(params.items())), self._version())
+                de_cache = self._respuesta.cache_info().hits > aciertos
+                estado = 200
+        except ErrorConsulta as e:
+            estado, cuerpo = e.estado, json.dumps({'error': str(e)}, ensure_ascii=False).encode('utf-8')
+        except duckdb.Error as e:
+            # Consulta que DuckDB no puede resolver: error JSON en lugar de matar el hilo
+            estado, cuerpo = 500, json.dumps({'error': f"{type(e).__name__}: {e}"}, ensure_ascii=False).encode('utf-8')
+        if endpoint != 'metricas':
+            with self._lock:
+                self._latencias[endpoint].append(time.perf_counter() - inicio)
+        return estado, cuerpo, de_cache
+
+    def metricas(self):
+        with self._lock:
+            latencias = {k: np.array(v) for k, v in self._latencias.items()}
+        info = self._respuesta.cache_info()
+        return {
+            'endpoints': {
+                k: {
+                    'peticiones': len(v),
+                    'p50_ms': round(float(np.percentile(v, 50)) * 1000, 3),
+                    'p99_ms': round(float(np.percentile(v, 99)) * 1000, 3),
+                    'max_ms': round(float(v.max()) * 1000, 3),
+                }
+                for k, v in sorted(latencias.items()) if len(v)
+            },
+            'cache': {'aciertos': info.hits, 'fallos': info.misses,
+                      'entradas': info.currsize, 'capacidad': info.maxsize},
+        }
+
+    # ---------- endpoints ----------
+
+    def anios(self, params):
+        anios = self._anios()
+        return {'available_years': anios, 'latest_year': anios[-1] if anios else None}
+
+    def catalogo(self, params):
+        year = self._year(params)
+        paises = self._df(f"SELECT country FROM read_parquet({self._ruta('profiles', year)}) ORDER BY country")
+        industrias = self._df(f"SELECT DISTINCT industry FROM read_parquet({self._ruta('dependencies', year)}) ORDER BY industry")
+        return {'year': year, 'countries': paises['country'].tolist(), 'industries': industrias['industry'].tolist()}
+
+    def perfil(self, params):
+        """Lo que muestra showProfile(): perfil, top dependencias, bilateral crítica y hub."""
+        year = self._year(params)
+        pais = self._requerido(params, 'country')
+        perfil = self._df(f"SELECT * FROM read_parquet({self._ruta('profiles', year)}) WHERE country = ?", [pais])
+        if perfil.empty:
+            raise ErrorConsulta(f"{pais} no está en {year}", 404)
+        deps = self._df(
+            f"SELECT * FROM read_parquet({self._ruta('dependencies', year)}) WHERE dependent_country = ? "
+            f"ORDER BY dependency_value DESC, industry LIMIT ?",
+            [pais, self._numero(params, 'top', FILTROS['top_dependencias'], int)])
+        bilateral = self._df(
+            f"SELECT * FROM read_parquet({self._ruta('bilateral', year)}) WHERE importer = ? AND criticidad > 0 "
+            f"ORDER BY criticidad DESC, industry, exporter", [pais])
+        hub = self._df(f"SELECT * FROM read_parquet({self._ruta('hubs', year)}) WHERE country = ?", [pais])
+        return {
+            'year': year,
+            'profile': _tabla(perfil, self.decimales),
+            'dependencies': _tabla(deps, self.decimales),
+            'bilateral': _tabla(bilateral, self.decimales),
+            'hub': _tabla(hub, self.decimales),
+        }
+
+    def explorador(self, params):
+        """Proveedores de un importador en una industria, con la poda de build.py aplicada al vuelo."""
+        year = self._year(params)
+        importador = self._requerido(params, 'importer')
+        industria = self._requerido(params, 'industry')
+        defecto = FILTROS['min_dep_esp'] if importador == PAIS_PRIORITARIO else FILTROS['min_dep_mundo']
+        min_dep = self._numero(params, 'min_dep', defecto)
+        top = self._numero(params, 'top', FILTROS['top_proveedores'], int)
+        df = self._df(
+            f"SELECT * FROM read_parquet({self._ruta('explorer', year)}) "
+            f"WHERE importer = ? AND industry = ? AND dep_total >= ? "
+            f"ORDER BY dep_total DESC, exporter LIMIT ?",
+            [importador, industria, min_dep, top])
+        df = df.drop(columns=['dashboard'], errors='ignore')
+        return {'year': year, 'importer': importador, 'industry': industria,
+                'min_dep': min_dep, 'top': top, 'explorer': _tabla(df, self.decimales)}
+
+    def hubs(self, params):
+        year = self._year(params)
+        n = self._numero(params, 'n', FILTROS['top_hubs'], int)
+        df = self._df(f"SELECT * FROM read_parquet({self._ruta('hubs', year)}) ORDER BY global_rank LIMIT ?", [n])
+        return {'year': year, 'hubs': _tabla(df, self.decimales)}
+
+    def evolucion(self, params):
+        """Serie anual de un país (como initProfileTrend) o recuento global de críticas (initGlobalTrend)."""
+        anios = self._anios()
+        if not anios:
+            raise ErrorConsulta("No hay datos en historico/", 404)
+        umbral = self._numero(params, 'min_dep', FILTROS['min_dep_critica'])
+        panel = evolucion_panel(self.panel, anios, self.historico, umbral)
+        if panel is not None:
+            evolucion, criticas = panel
+            if params.get('country'):
+                df = evolucion[evolucion['country'] == params['country']].reset_index(drop=True)
+                return {'country': params['country'], 'evolution': _tabla(df, self.decimales)}
+            return {'min_dep': umbral, 'critical_evolution': criticas.values.tolist()}
+
+        if params.get('country'):
+            rutas = ", ".join(self._ruta('profiles', y) for y in anios)
+            df = self._df(
+                f"SELECT country, year, vulnerability, importance, global_rank "
+                f"FROM read_parquet([{rutas}], union_by_name = true) WHERE country = ? ORDER BY year",
+                [params['country']])
+            return {'country': params['country'], 'evolution': _tabla(df, self.decimales)}
+
+        rutas = ", ".join(self._ruta('critical', y) for y in anios)
+        df = self._df(
+            f"SELECT year, count(*) AS count FROM read_parquet([{rutas}], union_by_name = true) "
+            f"WHERE dependencia_total >= ? GROUP BY year ORDER BY year", [umbral])
+        return {'min_dep': umbral, 'critical_evolution': df.values.tolist()}
+
+    def cambios(self, params):
+        """Qué cambió desde el año anterior: pares del importador con mayor |delta_total| (panel)."""
+        ruta = self.panel / "pares.parquet"
+        if not ruta.exists():
+            raise ErrorConsulta("No hay panel multi-año (python panel.py AÑOS)", 404)
+        importador = self._requerido(params, 'importer')
+        pares = "'" + str(ruta).replace("'", "''") + "'"
+        anios = self._df(f"SELECT DISTINCT year FROM read_parquet({pares}) ORDER BY year")['year'].tolist()
+        year = self._numero(params, 'year', anios[-1] if anios else 0, int)
+        if year not in anios:
+            raise ErrorConsulta(f"Año no disponible en el panel: {year}", 404)
+        n = self._numero(params, 'n', FILTROS['top_cambios'], int)
+        filtro, valores = "importer = ? AND year = ? AND delta_total IS NOT NULL", [importador, year]
+        if params.get('industry'):
+            filtro += " AND industry = ?"
+            valores.append(params['industry'])
+        df = self._df(
+            f"SELECT importer, exporter, industry, year, total, delta_total, delta_direct, delta_indirect, "
+            f"rank, delta_rank, hub_score, delta_hub_score FROM read_parquet({pares}) WHERE {filtro} "
+            f"ORDER BY abs(delta_total) DESC, industry, exporter LIMIT ?", [*valores, n])
+        return {'importer': importador, 'year': year, 'cambios': _tabla(df, self.decimales)}
+
+    def traza(self, params):
+        """De dónde sale la dependencia de un par: sumas por longitud y rutas con su desglose."""
+        # El año puede tener almacén del motor sin tablas de historico todavía
+        year = self._numero(params, 'year', 0, int) if 'year' in params else self._year(params)
+        industria = self._requerido(params, 'industry')
+        exportador = self._requerido(params, 'exporter')
+        importador = self._requerido(params, 'importer')
+        top = self._numero(params, 'top', FILTROS['top_caminos_traza'], int)
+        try:
+            return self.trazas.trazar(year, industria, exportador, importador, top)
+        except ValueError as e:
+            raise ErrorConsulta(str(e), 404) from None
+
+
+def crear_manejador(servicio):
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            partes = url.path.strip('/').split('/')
+            if len(partes) != 2 or partes[0] != 'api':
+                estado, cuerpo, de_cache = 404, b'{"error":"Ruta no encontrada"}', False
+            else:
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                estado, cuerpo, de_cache = servicio.responder(partes[1], params)
+            self.send_response(estado)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            # El dashboard puede abrirse desde file:// o desde otro puerto
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('X-Cache', 'HIT' if de_cache else 'MISS')
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, formato, *args):
+            pass  # Las latencias ya se registran en /api/metricas
+
+    return Manejador
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio local de consultas sobre historico/ (DuckDB)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8000)
+    parser.add_argument('--historico', default=str(HISTORICO), help="Carpeta con los Parquet del arquitecto")
+    parser.add_argument('--panel', default=None, help="Carpeta del panel multi-año (por defecto ../panel)")
+    parser.add_argument('--resultados', default=None,
+                        help="Carpeta de los almacenes results_{año} del motor (por defecto ../dependencias_consolidadas)")
+    parser.add_argument('--cache-trazas', type=float, default=CACHE_MB, help="MB de matrices en caché para /api/traza")
+    parser.add_argument('--cache', type=int, default=1024, help="Respuestas guardadas en la caché LRU")
+    parser.add_argument('--decimales', type=int, default=4, help="Decimales de los floats de las respuestas")
+    args = parser.parse_args(argv)
+
+    servicio = ServicioISE(args.historico, args.cache, args.decimales, args.panel, args.resultados, args.cache_trazas)
+    servidor = ThreadingHTTPServer((args.host, args.puerto), crear_manejador(servicio))
+    servidor.daemon_threads = True
+    print(f"[*] Sirviendo {args.historico} en http://{args.host}:{args.puerto}/api/ (años: {servicio._anios()})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
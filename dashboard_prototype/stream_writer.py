@@ -0,0 +1,261 @@
+"""
+ESCRITOR EN FLUJO DEL PAYLOAD DEL DASHBOARD
+Escribe el JSON del dashboard sección a sección directamente en el fichero de salida,
+sin construir el dict completo ni el string completo en memoria:
+
+- Tablas por columnas: {"c": [columnas], "v": [[valores col 0], [valores col 1], ...]}
+  en lugar de una lista de dicts por fila (cada nombre de columna se escribe una vez).
+- Floats redondeados a `decimales` (NaN → null, JSON válido).
+- Opcionalmente, un sidecar Arrow IPC por tabla (tipos float32 / diccionario) que el
+  navegador puede decodificar a typed arrays con apache-arrow (tableFromIPC).
+- Formato compacto de data_dist (build_fragmented.py): tabla_compacta codifica los
+  países e industrias con diccionarios compartidos y cuantiza los floats a enteros, y
+  escribir_variantes deja junto a cada JSON su .gz (y .br si está instalado brotli).
+"""
+import gzip
+import json
+import shutil
+import sys
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows: sin getrusage
+    resource = None
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+try:
+    import brotli
+except ImportError:  # Opcional: sin brotli solo se escribe la variante .gz
+    brotli = None
+
+# Columnas de texto que tabla_compacta codifica con los diccionarios compartidos del año
+COLUMNAS_DICCIONARIO = {
+    'country': 'paises',
+    'dependent_country': 'paises',
+    'importer': 'paises',
+    'exporter': 'paises',
+    'industry': 'industrias',
+}
+MAX_CUANTIZADO = 2 ** 53  # Enteros exactos en JavaScript
+
+
+def _dumps(obj):
+    # "</" escapado para poder incrustar el JSON dentro de <script>
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+
+
+def valores_columna(serie, decimales=4):
+    """Lista JSON-serializable de una columna (floats redondeados, NaN → None)."""
+    if pd.api.types.is_float_dtype(serie.dtype):
+        arr = np.round(serie.to_numpy(dtype=np.float64, na_value=np.nan), decimales)
+        valores = arr.tolist()
+        nulos = np.flatnonzero(np.isnan(arr))
+        for i in nulos:
+            valores[i] = None
+        return valores
+    if pd.api.types.is_integer_dtype(serie.dtype) or pd.api.types.is_bool_dtype(serie.dtype):
+        return serie.to_numpy().tolist()
+    return serie.astype(object).where(serie.notna(), None).tolist()
+
+
+def filas_redondeadas(df, decimales=4):
+    """Filas como listas (para el explorador indexado) con los floats redondeados."""
+    columnas = [valores_columna(df[c], decimales) for c in df.columns]
+    return [list(fila) for fila in zip(*columnas)]
+
+
+class EscritorJSON:
+    """
+    JSON escrito en flujo sobre un fichero de texto abierto.
+
+        with open(ruta, 'w', encoding='utf-8') as f:
+            w = EscritorJSON(f)
+            w.abrir()
+            w.clave('profiles'); w.tabla(df_p)
+            w.clave('hubs'); w.tabla(df_h)
+            w.cerrar()
+    """
+
+    def __init__(self, f, decimales=4):
+        self.f = f
+        self.decimales = decimales
+        self._primero = []      # por contenedor abierto: ¿aún sin elementos?
+        self._tras_clave = False
+
+    def _separar(self):
+        # Coma entre elementos del contenedor actual (salvo justo después de una clave)
+        if self._tras_clave:
+            self._tras_clave = False
+            return
+        if self._primero:
+            if not self._primero[-1]:
+                self.f.write(',')
+            self._primero[-1] = False
+
+    def abrir(self, caracter='{'):
+        """Abre un objeto o lista (como raíz, valor de la clave actual o elemento)."""
+        self._separar()
+        self.f.write(caracter)
+        self._primero.append(True)
+
+    def cerrar(self, caracter='}'):
+        self._primero.pop()
+        self.f.write(caracter)
+
+    def clave(self, nombre):
+        """Clave de un objeto; el siguiente valor escrito le pertenece."""
+        self._separar()
+        self.f.write(_dumps(str(nombre)) + ':')
+        self._tras_clave = True
+
+    def valor(self, obj):
+        self._separar()
+        self.f.write(_dumps(obj))
+
+    def tabla(self, df, columnas=None):
+        """Tabla por columnas {"c": [...], "v": [[...], ...]} escrita columna a columna."""
+        self._separar()
+        columnas = list(columnas if columnas is not None else df.columns)
+        self.f.write('{"c":' + _dumps(columnas) + ',"v":[')
+        for k, col in enumerate(columnas):
+            if k:
+                self.f.write(',')
+            self.f.write(_dumps(valores_columna(df[col], self.decimales)))
+        self.f.write(']}')
+
+    def crudo(self, origen):
+        """Copia por bloques un JSON ya serializado (ruta) como valor."""
+        self._separar()
+        with open(origen, 'r', encoding='utf-8') as g:
+            shutil.copyfileobj(g, self.f, 1 << 20)
+
+
+def tabla_compacta(df, diccionarios, decimales=4):
+    """
+    Tabla en el formato compacto de data_dist: {"n": filas, "c": columnas,
+    "k": codificación de cada columna, "v": valores de cada columna}.
+
+    Codificaciones (k):
+    - {"d": nombre}: códigos en el diccionario compartido nombre ("paises", "industrias")
+      que encabeza el fichero (columnas de COLUMNAS_DICCIONARIO);
+    - {"t": [textos]}: códigos en un diccionario propio de la columna (resto de textos);
+    - {"e": decimales}: floats cuantizados a enteros round(x · 10^e) (NaN → null), con
+      e el menor número de decimales (hasta decimales) que conserva la columna redondeada;
+    - null: enteros y booleanos tal cual (o floats que no caben cuantizados).
+
+    Parameters:
+    -----------
+    diccionarios : dict
+        {nombre: pandas.Index con los valores del diccionario}
+    """
+    codificacion, valores = [], []
+    for col in df.columns:
+        serie = df[col]
+        nombre = COLUMNAS_DICCIONARIO.get(col)
+        if nombre in diccionarios:
+            codigos = diccionarios[nombre].get_indexer(serie.astype(str))
+            if (codigos < 0).any():
+                faltan = sorted(set(serie[codigos < 0].astype(str)))[:5]
+                raise ValueError(f"❌ {col}: valores fuera del diccionario {nombre}: {faltan}")
+            codificacion.append({'d': nombre})
+            valores.append(codigos.tolist())
+        elif pd.api.types.is_float_dtype(serie.dtype):
+            arr = np.round(serie.to_numpy(dtype=np.float64, na_value=np.nan), decimales)
+            finitos = arr[np.isfinite(arr)]
+            e = next(e for e in range(decimales + 1) if e == decimales or np.array_equal(np.round(finitos, e), finitos))
+            escalado = np.rint(arr * 10 ** e)
+            if len(finitos) and np.abs(finitos).max() * 10 ** e >= MAX_CUANTIZADO:
+                codificacion.append(None)
+                valores.append(valores_columna(serie, decimales))
+                continue
+            lista = np.nan_to_num(escalado).astype(np.int64).tolist()
+            for i in np.flatnonzero(~np.isfinite(arr)):
+                lista[i] = None
+            codificacion.append({'e': e})
+            valores.append(lista)
+        elif pd.api.types.is_integer_dtype(serie.dtype) or pd.api.types.is_bool_dtype(serie.dtype):
+            codificacion.append(None)
+            valores.append(serie.to_numpy().tolist())
+        else:
+            codigos, textos = pd.factorize(serie, sort=False)
+            lista = codigos.tolist()
+            for i in np.flatnonzero(codigos < 0):
+                lista[i] = None
+            codificacion.append({'t': [str(t) for t in textos]})
+            valores.append(lista)
+    return {'n': len(df), 'c': [str(c) for c in df.columns], 'k': codificacion, 'v': valores}
+
+
+def rutas_variantes(ruta):
+    """Ficheros que escribe escribir_variantes(ruta): el JSON, su .gz y su .br (con brotli)."""
+    ruta = Path(ruta)
+    extensiones = ['.gz'] + (['.br'] if brotli is not None else [])
+    return [ruta] + [ruta.with_name(ruta.name + ext) for ext in extensiones]
+
+
+def escribir_variantes(ruta, obj, nivel_brotli=11):
+    """
+    Escribe obj como JSON compacto en ruta y, junto a él, ruta.gz (y ruta.br con
+    brotli) para servirlos precomprimidos (gzip_static / brotli_static).
+
+    Returns:
+    --------
+    dict
+        Bytes de cada variante: {'bytes': ..., 'gz': ..., 'br': ... (si hay brotli)}
+    """
+    ruta = Path(ruta)
+    datos = json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    ruta.write_bytes(datos)
+    tamanos = {'bytes': len(datos)}
+    # mtime=0: la misma entrada produce el mismo .gz (sin fecha en la cabecera)
+    comprimido = gzip.compress(datos, compresslevel=9, mtime=0)
+    ruta.with_name(ruta.name + '.gz').write_bytes(comprimido)
+    tamanos['gz'] = len(comprimido)
+    if brotli is not None:
+        comprimido = brotli.compress(datos, quality=nivel_brotli)
+        ruta.with_name(ruta.name + '.br').write_bytes(comprimido)
+        tamanos['br'] = len(comprimido)
+    return tamanos
+
+
+def escribir_arrow(ruta, tablas):
+    """
+    Sidecar Arrow IPC: un fichero con un stream por tabla no es portable, así que se
+    escribe uno por tabla ({ruta}_{tabla}.arrow). Floats en float32 y textos como
+    diccionario, enteros en int32: el navegador los recibe como Float32Array / Int32Array.
+    """
+    ruta = Path(ruta)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    escritos = []
+    for nombre, df in tablas.items():
+        tabla = pa.Table.from_pandas(df, preserve_index=False)
+        campos = []
+        for campo in tabla.schema:
+            if pa.types.is_floating(campo.type):
+                campos.append(pa.field(campo.name, pa.float32()))
+            elif pa.types.is_integer(campo.type):
+                # int64 llegaría como BigInt64Array; los rangos del dashboard caben en int32
+                campos.append(pa.field(campo.name, pa.int32()))
+            elif pa.types.is_string(campo.type) or pa.types.is_large_string(campo.type):
+                campos.append(pa.field(campo.name, pa.dictionary(pa.int32(), pa.string())))
+            else:
+                campos.append(campo)
+        tabla = tabla.cast(pa.schema(campos))
+        destino = ruta.with_name(f"{ruta.name}_{nombre}.arrow")
+        with pa.OSFile(str(destino), 'wb') as sink, pa.ipc.new_file(sink, tabla.schema) as writer:
+            writer.write_table(tabla)
+        escritos.append(destino)
+    return escritos
+
+
+def memoria_pico_mb():
+    """Pico de memoria residente del proceso (MB), o None si el sistema no lo ofrece."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB, macOS en bytes
+    return pico / (1 << 20) if sys.platform == 'darwin' else pico / 1024
@@ -0,0 +1,137 @@
+"""
+AGREGADOS ISE
+Piezas de agregación compartidas por el arquitecto (ise_architect.py), el barrido de
+parámetros (barrido.py), el panel multi-año (panel.py) y los bloques (bloques.py), para
+que todos calculen perfiles y hubs con las mismas definiciones:
+
+- caminos_planos / contar_intermediarios: caminos de buscar_caminos_desde como arrays y
+  frecuencia y fuerza de cada país como intermediario (ponderación 1/(posición+1)).
+- tabla_hubs: tabla hubs con el score de ise_architect (hubs.puntuar_hubs).
+- parciales_perfiles / perfiles_desde_parciales: sumas parciales de los perfiles por
+  bloque de pares (una industria o un año) y su combinación en la tabla profiles.
+"""
+import numpy as np
+import pandas as pd
+
+from hubs import puntuar_hubs
+
+
+def caminos_planos(caminos, n, max_len):
+    """
+    Caminos de todos los exportadores (salida de buscar_caminos_desde) como arrays:
+    exportador, importador, longitud, fuerza e intermediarios (relleno con -1).
+    """
+    exp, imp, lon, fuerza, interms = [], [], [], [], []
+    for j, por_importador in enumerate(caminos):
+        for i, rutas in por_importador.items():
+            for L, inter, f in rutas:
+                exp.append(j)
+                imp.append(i)
+                lon.append(L)
+                fuerza.append(f)
+                interms.append(inter + (-1,) * (max_len - 1 - len(inter)))
+    intermediarios = np.asarray(interms, dtype=np.int64).reshape(len(interms), max(max_len - 1, 0))
+    return (np.asarray(exp, dtype=np.int64), np.asarray(imp, dtype=np.int64),
+            np.asarray(lon, dtype=np.int64), np.asarray(fuerza, dtype=np.float64), intermediarios)
+
+
+def contar_intermediarios(intermediarios, fuerza, n):
+    """
+    Frecuencia y fuerza de cada país como intermediario en un conjunto de caminos
+    (misma ponderación 1/(posición+1) que consolidar_resultados).
+    """
+    frecuencia = np.zeros(n, dtype=np.int64)
+    fuerza_total = np.zeros(n, dtype=np.float64)
+    for pos in range(intermediarios.shape[1]):
+        a = intermediarios[:, pos]
+        validos = a >= 0
+        frecuencia += np.bincount(a[validos], minlength=n)
+        fuerza_total += np.bincount(a[validos], weights=fuerza[validos] / (pos + 1), minlength=n)
+    return frecuencia, fuerza_total
+
+
+def tabla_hubs(frecuencia, fuerza, year):
+    """hubs con el score de ise_architect (0.4 · frecuencia + 0.6 · fuerza, normalizadas)."""
+    hubs = pd.DataFrame({
+        "country": list(frecuencia.keys()),
+        "frequency_total": [frecuencia[c] for c in frecuencia.keys()],
+        "strength_total": [fuerza[c] for c in frecuencia.keys()],
+    })
+    if hubs.empty:
+        return hubs
+    hubs = puntuar_hubs(hubs)
+    hubs["year"] = year
+    return hubs
+
+
+def parciales_perfiles(pairs):
+    """
+    Sumas parciales de los perfiles de un bloque de pares (una industria o un año).
+
+    Returns:
+    --------
+    tuple
+        (importadores, exportadores): por (country, industry) las sumas de vulnerabilidad
+        e indirecta ponderadas, el peso, el comercio de la industria y los proveedores
+        efectivos (1/HHI); por exportador la importancia ponderada y su peso
+    """
+    # Agrupar por códigos enteros (orden alfabético, como groupby) es mucho más rápido que por texto
+    cod_pais, paises = pd.factorize(pairs["importer"], sort=True)
+    cod_ind, industrias = pd.factorize(pairs["industry"], sort=True)
+    cod_exp, exportadores = pd.factorize(pairs["exporter"], sort=True)
+    claves = [pd.Series(cod_pais, index=pairs.index), pd.Series(cod_ind, index=pairs.index)]
+    vul_dep = pairs["total"]
+    peso = pairs["trade_value"]
+    peso64 = peso.astype(np.float64)
+
+    imp = pd.DataFrame({
+        "sv": vul_dep * peso64,
+        "si": pairs["indirect"] * peso64,
+        "sw": peso64,
+        "w_ind": peso,
+    }).groupby(claves, sort=True).sum()
+
+    # HHI por país e industria: suma de cuadrados de las dependencias normalizadas
+    suma_sector = vul_dep.groupby(claves, sort=True).transform("sum")
+    norm_sq = (vul_dep / suma_sector.where(suma_sector != 0, 1.0)) ** 2
+    hhi = norm_sq.groupby(claves, sort=True).sum()
+    hhi = hhi.where(vul_dep.groupby(claves, sort=True).sum() != 0, 1.0)
+    imp["eff"] = 1.0 / hhi
+    imp.index = pd.MultiIndex.from_arrays([
+        paises[imp.index.get_level_values(0)], industrias[imp.index.get_level_values(1)]
+    ], names=["country", "industry"])
+
+    exporter = pd.Series(cod_exp, index=pairs.index)
+    exp = pd.DataFrame({"se": vul_dep * peso64, "swe": peso64}).groupby(exporter, sort=True).sum()
+    exp.index = pd.Index(exportadores[exp.index], name="country")
+    return imp.reset_index(), exp.reset_index()
+
+
+def perfiles_desde_parciales(importadores, exportadores, year):
+    """Combina las sumas parciales de todas las industrias en la tabla profiles."""
+    w_ind = importadores["w_ind"].astype(np.float64)
+    imp = importadores.assign(ew=importadores["eff"] * w_ind, w64=w_ind) \
+        .groupby("country", sort=True)[["sv", "si", "sw", "ew", "w64"]].sum()
+
+    # 1-2. Vulnerabilidad e indirecta medias ponderadas por trade_value del importador
+    con_peso = imp["sw"] != 0
+    vul = imp["sv"] / imp["sw"]
+    indirs = imp["si"] / imp["sw"]
+    ind_share = (indirs / vul).where(vul > 0, 0.0)
+    # 3. Promedio nacional de proveedores efectivos ponderado por el comercio de cada industria
+    avg_eff = imp["ew"] / imp["w64"]
+
+    profiles_vul = pd.DataFrame({
+        "vulnerability": vul.where(con_peso, 0.0),
+        "indirect_share": ind_share.where(con_peso, 0.0),
+        "num_suppliers_effective": avg_eff.where(con_peso, 0.0),
+    })
+
+    # Agregacin por pas (Exportador - Importancia)
+    exp = exportadores.groupby("country", sort=True)[["se", "swe"]].sum()
+    profiles_imp = (exp["se"] / exp["swe"]).where(exp["swe"] > 0, 0.0).rename("importance")
+
+    profiles = pd.concat([profiles_vul, profiles_imp], axis=1).fillna(0).reset_index()
+    profiles["year"] = year
+    profiles["global_rank"] = profiles["vulnerability"].rank(ascending=False).astype(int)
+    return profiles
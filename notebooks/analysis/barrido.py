@@ -0,0 +1,507 @@
+"""
+BARRIDO DE PARÁMETROS ISE
+Calcula en una sola ejecución todas las variantes de una rejilla de parámetros del
+motor (threshold_pct, convergence_threshold, path_strength_threshold,
+max_possible_length) y devuelve perfiles y hubs en formato largo, con una columna
+'variante' que identifica cada combinación, más estadísticas de estabilidad del
+ranking de perfiles frente a una variante base.
+
+Lo que comparten las variantes se calcula una sola vez por industria:
+- por threshold_pct: la matriz limpia, la transición T y sus vecinos ordenados;
+- los productos de T y dependencias_por_longitud hasta la mayor max_possible_length
+  de la rejilla (dependencias[L] no depende de la longitud máxima, así que sirve
+  para todas las longitudes menores);
+- una única búsqueda de caminos con el menor path_strength_threshold y la mayor
+  longitud: los caminos significativos de cada variante son el subconjunto con
+  fuerza > umbral y longitud <= su longitud de convergencia.
+
+Por variante solo se repite el criterio de convergencia (elemento a elemento), el
+filtrado de caminos y las sumas de perfiles y hubs, con las mismas definiciones que
+ise_architect.py.
+
+    rejilla = rejilla_parametros(threshold_pct=[0.0025, 0.005, 0.01], max_possible_length=[3, 4])
+    res = barrer_parametros(matrices_comercio, rejilla, year=2016)
+    res["estabilidad"]
+    guardar_barrido(res, ruta_barrido(2016))
+"""
+import argparse
+import itertools
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from agregados import (
+    caminos_planos,
+    contar_intermediarios,
+    parciales_perfiles,
+    perfiles_desde_parciales,
+    tabla_hubs,
+)
+from dependency_engine import (
+    calcular_dependencias_por_longitud,
+    calcular_longitudes_convergencia,
+    eliminar_filas_columnas_cero,
+    elegir_ruta_matricial,
+    transicion_dispersa,
+)
+from path_search import buscar_caminos_desde, vecinos_ordenados
+
+BASE_PATH = Path(__file__).resolve().parent.parent.parent
+BARRIDOS_DIR = BASE_PATH / "data" / "processed" / "barridos"
+
+PARAMETROS = ("threshold_pct", "convergence_threshold", "path_strength_threshold", "max_possible_length")
+# Valores por defecto del motor (calculate_all_dependencies y el notebook)
+POR_DEFECTO = {"threshold_pct": 0.005, "convergence_threshold": 0.01,
+               "path_strength_threshold": 0.001, "max_possible_length": 3}
+TABLAS_BARRIDO = ("variantes", "perfiles", "hubs", "industrias", "estabilidad", "estabilidad_paises")
+
+
+def rejilla_parametros(threshold_pct=None, convergence_threshold=None, path_strength_threshold=None,
+                       max_possible_length=None):
+    """
+    Producto cartesiano de los valores de cada parámetro (los no indicados toman el
+    valor por defecto del motor).
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Una fila por variante: 'variante' (0..k-1) y los cuatro parámetros
+    """
+    valores = {
+        "threshold_pct": threshold_pct,
+        "convergence_threshold": convergence_threshold,
+        "path_strength_threshold": path_strength_threshold,
+        "max_possible_length": max_possible_length,
+    }
+    listas = []
+    for nombre in PARAMETROS:
+        v = valores[nombre]
+        if v is None:
+            v = [POR_DEFECTO[nombre]]
+        elif np.isscalar(v):
+            v = [v]
+        listas.append(sorted(set(v)))
+    if any(v < 0 for v in listas[2]):
+        raise ValueError("❌ path_strength_threshold debe ser >= 0 en el motor matricial")
+    if any(int(v) < 1 for v in listas[3]):
+        raise ValueError("❌ max_possible_length debe ser >= 1")
+
+    rejilla = pd.DataFrame(list(itertools.product(*listas)), columns=list(PARAMETROS))
+    rejilla["max_possible_length"] = rejilla["max_possible_length"].astype(int)
+    rejilla.insert(0, "variante", np.arange(len(rejilla)))
+    return rejilla
+
+
+def _normalizar_rejilla(rejilla):
+    if not isinstance(rejilla, pd.DataFrame):
+        rejilla = pd.DataFrame(list(rejilla))
+    rejilla = rejilla.copy()
+    for nombre in PARAMETROS:
+        if nombre not in rejilla.columns:
+            rejilla[nombre] = POR_DEFECTO[nombre]
+    if "variante" not in rejilla.columns:
+        rejilla.insert(0, "variante", np.arange(len(rejilla)))
+    rejilla["max_possible_length"] = rejilla["max_possible_length"].astype(int)
+    if rejilla.duplicated(list(PARAMETROS)).any():
+        raise ValueError("❌ La rejilla tiene combinaciones de parámetros repetidas")
+    return rejilla.reset_index(drop=True)
+
+
+def _barrer_industria(industry, mat, rejilla, country_names=None):
+    """
+    Todas las variantes de una industria.
+
+    Returns:
+    --------
+    tuple
+        (industry, {'variantes': {variante: {'perfiles': parciales (importadores,
+        exportadores), 'hubs': (países, frecuencia, fuerza), 'industria': fila resumen}},
+        'segundos': tiempo de cada parte})
+    """
+    salida = {"variantes": {}, "segundos": defaultdict(float)}
+    for threshold_pct, grupo in rejilla.groupby("threshold_pct", sort=True):
+        t0 = time.perf_counter()
+        limpia = eliminar_filas_columnas_cero(mat, threshold_pct=threshold_pct, country_names=country_names)
+        salida["segundos"]["limpieza"] += time.perf_counter() - t0
+        n = limpia.shape[0]
+        if n < 2:
+            continue
+
+        # Compartido por todas las variantes de este umbral de limpieza
+        t0 = time.perf_counter()
+        X = limpia.values
+        nombres = np.asarray(limpia.columns.tolist(), dtype=object)
+        denom = X.sum(axis=0, dtype=np.float64)
+        denom[denom == 0.0] = np.inf
+        direct = X / denom  # direct[j, i]
+        ruta, densidad = elegir_ruta_matricial(X)
+        T = transicion_dispersa(X, denom) if ruta == "dispersa" else (X / denom).astype(np.float64, copy=False)
+        L_max = int(grupo["max_possible_length"].max())
+        dependencias = calcular_dependencias_por_longitud(T, L_max) if L_max >= 2 else {}
+        salida["segundos"]["productos"] += time.perf_counter() - t0
+
+        # Superconjunto de caminos: menor umbral, longitud máxima y sin top_k
+        t0 = time.perf_counter()
+        umbral_min = float(grupo["path_strength_threshold"].min())
+        if L_max >= 3 or (L_max >= 2 and umbral_min > 0):
+            orden_filas, pesos_filas = vecinos_ordenados(T)
+            caminos = [
+                buscar_caminos_desde(T, j, L_max, umbral_min, top_k=0, orden_filas=orden_filas,
+                                     pesos_filas=pesos_filas)
+                for j in range(n)
+            ]
+        else:
+            caminos = [{} for _ in range(n)]
+        c_exp, c_imp, c_lon, c_fuerza, c_interms = caminos_planos(caminos, n, max(L_max, 1))
+        del caminos
+        salida["segundos"]["caminos"] += time.perf_counter() - t0
+
+        # Pares (j != i) en el orden del almacén: por importador y, dentro, por exportador
+        ii, jj = np.nonzero(~np.eye(n, dtype=bool))
+        base_pares = {
+            "importer": nombres[ii],
+            "exporter": nombres[jj],
+            "industry": industry,
+            "trade_value": X[jj, ii],
+            "direct": direct[jj, ii],
+        }
+
+        t0 = time.perf_counter()
+        for fila in grupo.itertuples(index=False):
+            L = int(fila.max_possible_length)
+            umbral = float(fila.path_strength_threshold)
+            indirect, length = calcular_longitudes_convergencia(direct, dependencias, L,
+                                                                fila.convergence_threshold)
+
+            # Caminos significativos de la variante (regla de process_country_pair)
+            sig = (c_fuerza > umbral) & (c_lon <= length[c_exp, c_imp]) & ((c_lon > 2) | (umbral > 0))
+            frecuencia, fuerza = contar_intermediarios(c_interms[sig], c_fuerza[sig], n)
+
+            pares = pd.DataFrame({**base_pares, "indirect": indirect[jj, ii]})
+            pares["total"] = pares["direct"] + pares["indirect"]
+            longitudes = length[jj, ii]
+            salida["variantes"][int(fila.variante)] = {
+                "perfiles": parciales_perfiles(pares),
+                "hubs": (nombres, frecuencia, fuerza),
+                "industria": {
+                    "industry": industry,
+                    "paises": n,
+                    "ruta_motor": ruta,
+                    "densidad": round(densidad, 4),
+                    "caminos_significativos": int(sig.sum()),
+                    "longitud_media": float(longitudes.mean()) if len(longitudes) else None,
+                    "dependencia_indirecta_media": float(pares["indirect"].mean()) if len(pares) else 0.0,
+                },
+            }
+        salida["segundos"]["variantes"] += time.perf_counter() - t0
+    return industry, salida
+
+
+def _spearman(a, b):
+    """Correlación de Spearman (Pearson de los rangos); NaN si alguna serie es constante."""
+    ra, rb = a.rank(), b.rank()
+    if len(ra) < 2 or ra.nunique() < 2 or rb.nunique() < 2:
+        return np.nan
+    return float(ra.corr(rb))
+
+
+def estabilidad_rankings(perfiles, hubs=None, base=0, top=10):
+    """
+    Estabilidad del ranking de vulnerabilidad (global_rank de profiles) frente a la
+    variante base.
+
+    Parameters:
+    -----------
+    perfiles : pandas.DataFrame
+        Perfiles en formato largo (columna 'variante')
+    hubs : pandas.DataFrame, opcional
+        Hubs en formato largo; añade la correlación de su global_score con la base
+    base : int
+        Variante de referencia
+    top : int
+        Tamaño del top para el solape
+
+    Returns:
+    --------
+    tuple
+        (por variante: rho de Spearman, solape del top, cambio de rango medio y máximo;
+        por país: rango en la base, mínimo, máximo, medio, desviación y amplitud)
+    """
+    rangos = perfiles.pivot(index="country", columns="variante", values="global_rank")
+    vulnerabilidad = perfiles.pivot(index="country", columns="variante", values="vulnerability")
+    if base not in rangos.columns:
+        raise ValueError(f"❌ La variante base {base} no está en los perfiles")
+    ref = rangos[base]
+    top_ref = set(ref.nsmallest(top).index)
+    if hubs is not None and not hubs.empty:
+        scores = hubs.pivot(index="country", columns="variante", values="global_score")
+
+    filas = []
+    for v in rangos.columns:
+        comunes = rangos[v].notna() & ref.notna()
+        cambio = (rangos.loc[comunes, v] - ref[comunes]).abs()
+        fila = {
+            "variante": v,
+            "paises": int(comunes.sum()),
+            "rho_spearman": _spearman(vulnerabilidad.loc[comunes, v], vulnerabilidad.loc[comunes, base]),
+            f"solape_top{top}": len(top_ref & set(rangos[v].nsmallest(top).index)) / max(len(top_ref), 1),
+            "cambio_rango_medio": float(cambio.mean()) if len(cambio) else 0.0,
+            "cambio_rango_max": int(cambio.max()) if len(cambio) else 0,
+        }
+        if hubs is not None and not hubs.empty and v in scores.columns and base in scores.columns:
+            comunes = scores[v].notna() & scores[base].notna()
+            fila["rho_spearman_hubs"] = _spearman(scores.loc[comunes, v], scores.loc[comunes, base])
+        filas.append(fila)
+    por_variante = pd.DataFrame(filas)
+
+    por_pais = pd.DataFrame({
+        "rango_base": ref,
+        "rango_min": rangos.min(axis=1),
+        "rango_max": rangos.max(axis=1),
+        "rango_medio": rangos.mean(axis=1),
+        "rango_std": rangos.std(axis=1, ddof=0),
+    })
+    por_pais["amplitud"] = por_pais["rango_max"] - por_pais["rango_min"]
+    por_pais = por_pais.reset_index().sort_values(["amplitud", "rango_base"], ascending=[False, True],
+                                                  kind="stable").reset_index(drop=True)
+    return por_variante, por_pais
+
+
+def _variante_base(rejilla, base):
+    if base is not None:
+        return int(base)
+    defecto = np.ones(len(rejilla), dtype=bool)
+    for nombre, valor in POR_DEFECTO.items():
+        defecto &= np.isclose(rejilla[nombre].to_numpy(dtype=np.float64), valor)
+    return int(rejilla.loc[defecto, "variante"].iloc[0]) if defecto.any() else int(rejilla["variante"].iloc[0])
+
+
+def barrer_parametros(matrices_comercio, rejilla, year=None, country_names=None, base=None, top=10,
+                      n_jobs=1, verbose=True):
+    """
+    Calcula todas las variantes de la rejilla sobre las matrices de comercio de un año.
+
+    Parameters:
+    -----------
+    matrices_comercio : dict
+        {industria: DataFrame exportadores × importadores} (o vistas numpy del tensor
+        con country_names), como en el bucle de industrias del notebook
+    rejilla : pandas.DataFrame o lista de dict
+        Variantes (rejilla_parametros); los parámetros ausentes toman el valor por defecto
+    year : int, opcional
+        Año que se anota en perfiles y hubs
+    base : int, opcional
+        Variante de referencia para la estabilidad. Por defecto la que tiene los
+        parámetros por defecto del motor (o la primera)
+    top : int
+        Tamaño del top para el solape de rankings
+    n_jobs : int
+        Industrias calculadas a la vez en procesos separados
+
+    Returns:
+    --------
+    dict
+        DataFrames 'variantes', 'perfiles', 'hubs', 'industrias' (formato largo con
+        columna 'variante' y los parámetros), 'estabilidad', 'estabilidad_paises', y
+        'segundos' por parte compartida
+    """
+    rejilla = _normalizar_rejilla(rejilla)
+    base = _variante_base(rejilla, base)
+    ids = rejilla["variante"].tolist()
+    if verbose:
+        print(f"[*] Barrido ISE: {len(rejilla)} variantes × {len(matrices_comercio)} industrias")
+
+    trabajos = (delayed(_barrer_industria)(industry, mat, rejilla, country_names)
+                for industry, mat in matrices_comercio.items())
+    if n_jobs == 1:
+        salidas = (f(*a, **k) for f, a, k in trabajos)
+    else:
+        salidas = Parallel(n_jobs=n_jobs, return_as="generator")(trabajos)
+
+    parciales = {v: ([], []) for v in ids}
+    frecuencia = {v: defaultdict(int) for v in ids}
+    fuerza = {v: defaultdict(float) for v in ids}
+    industrias = []
+    segundos = defaultdict(float)
+    for k, (industry, salida) in enumerate(salidas, start=1):
+        for parte, s in salida["segundos"].items():
+            segundos[parte] += s
+        for v, res in salida["variantes"].items():
+            imp, exp = res["perfiles"]
+            parciales[v][0].append(imp)
+            parciales[v][1].append(exp)
+            nombres, f, s = res["hubs"]
+            for pais, fi, si in zip(nombres, f.tolist(), s.tolist()):
+                frecuencia[v][pais] += fi
+                fuerza[v][pais] += si
+            industrias.append({"variante": v, **res["industria"]})
+        if verbose:
+            print(f"\r Industrias procesadas: {k}/{len(matrices_comercio)}", end="", flush=True)
+    if verbose:
+        print()
+
+    parametros = rejilla.set_index("variante")[list(PARAMETROS)]
+
+    def _largo(tablas):
+        tablas = [t.assign(variante=v) for v, t in tablas.items() if not t.empty]
+        if not tablas:
+            return pd.DataFrame()
+        df = pd.concat(tablas, ignore_index=True)
+        df = df.join(parametros, on="variante")
+        return df[["variante", *PARAMETROS] + [c for c in df.columns if c not in ("variante", *PARAMETROS)]]
+
+    perfiles = _largo({
+        v: perfiles_desde_parciales(pd.concat(imp), pd.concat(exp), year)
+        for v, (imp, exp) in parciales.items() if imp
+    })
+    hubs = _largo({v: tabla_hubs(frecuencia[v], fuerza[v], year) for v in ids})
+    industrias = pd.DataFrame(industrias)
+    if not industrias.empty:
+        industrias = industrias.join(parametros, on="variante").sort_values(["variante", "industry"],
+                                                                            kind="stable").reset_index(drop=True)
+
+    if not perfiles.empty and base in set(perfiles["variante"]):
+        estabilidad, estabilidad_paises = estabilidad_rankings(perfiles, hubs, base, top)
+        estabilidad = estabilidad.join(parametros, on="variante")
+        estabilidad["base"] = estabilidad["variante"] == base
+    else:
+        estabilidad, estabilidad_paises = pd.DataFrame(), pd.DataFrame()
+
+    return {
+        "variantes": rejilla,
+        "perfiles": perfiles,
+        "hubs": hubs,
+        "industrias": industrias,
+        "estabilidad": estabilidad,
+        "estabilidad_paises": estabilidad_paises,
+        "segundos": {parte: round(s, 3) for parte, s in segundos.items()},
+    }
+
+
+def ruta_barrido(year, directorio=None, nombre=None):
+    """Carpeta de un barrido: data/processed/barridos/barrido_{year}[_{nombre}]/."""
+    carpeta = f"barrido_{year}" + (f"_{nombre}" if nombre else "")
+    return Path(directorio or BARRIDOS_DIR) / carpeta
+
+
+def guardar_barrido(resultado, directorio):
+    """Escribe cada tabla del barrido como {tabla}.parquet en directorio."""
+    directorio = Path(directorio)
+    directorio.mkdir(parents=True, exist_ok=True)
+    rutas = {}
+    for nombre in TABLAS_BARRIDO:
+        rutas[nombre] = directorio / f"{nombre}.parquet"
+        resultado[nombre].to_parquet(rutas[nombre], index=False)
+    return rutas
+
+
+def cargar_barrido(directorio):
+    """{tabla: DataFrame} de un barrido guardado con guardar_barrido."""
+    directorio = Path(directorio)
+    return {nombre: pd.read_parquet(directorio / f"{nombre}.parquet") for nombre in TABLAS_BARRIDO
+            if (directorio / f"{nombre}.parquet").exists()}
+
+
+def verificar_barrido(n=30, industrias=3, density=0.4, seed=0, atol=1e-9):
+    """
+    Compara los perfiles y hubs del barrido con los de calculate_all_dependencies_matrix
+    ejecutado variante a variante (pares → calcular_perfiles, intermediarios → hubs).
+
+    Returns:
+    --------
+    dict
+        Resumen de la comparación ('ok', variantes, diferencia máxima)
+
+    Raises:
+    -------
+    AssertionError
+        Si algún perfil, frecuencia o fuerza de intermediario no coincide
+    """
+    from dependency_engine import calculate_all_dependencies_matrix
+    from ise_architect import calcular_perfiles
+
+    rng = np.random.default_rng(seed)
+    names = [f"C{k:02d}" for k in range(n)]
+    matrices = {}
+    for k in range(industrias):
+        X = rng.pareto(1.5, size=(n, n)).astype(np.float32)
+        X[rng.random((n, n)) > density] = 0.0
+        matrices[f"Industria {k}"] = pd.DataFrame(X, index=names, columns=names)
+
+    rejilla = rejilla_parametros(threshold_pct=[0.005, 0.02], convergence_threshold=[0.01, 0.001],
+                                 path_strength_threshold=[0.001, 0.01], max_possible_length=[2, 3, 4])
+    res = barrer_parametros(matrices, rejilla, year=0, verbose=False)
+
+    max_diff = 0.0
+    for fila in rejilla.itertuples(index=False):
+        pares, frecuencia, fuerza = [], defaultdict(int), defaultdict(float)
+        for industry, mat in matrices.items():
+            limpia = eliminar_filas_columnas_cero(mat, threshold_pct=fila.threshold_pct)
+            r = calculate_all_dependencies_matrix(
+                limpia.values, limpia.columns.tolist(), fila.convergence_threshold,
+                int(fila.max_possible_length), fila.path_strength_threshold)
+            pares.append(pd.DataFrame({
+                "importer": [d["importador"] for d in r["dependencies"]],
+                "exporter": [d["exportador"] for d in r["dependencies"]],
+                "industry": industry,
+                "trade_value": np.asarray([d["trade_value"] for d in r["dependencies"]], dtype=np.float32),
+                "direct": [d["dependencia_directa"] for d in r["dependencies"]],
+                "indirect": [d["dependencia_indirecta"] for d in r["dependencies"]],
+                "total": [d["dependencia_total"] for d in r["dependencies"]],
+            }))
+            for pais, f in r["intermediary_frequency"].items():
+                frecuencia[pais] += f
+                fuerza[pais] += r["intermediary_strength"][pais]
+
+        ref = calcular_perfiles(pd.concat(pares, ignore_index=True), 0).set_index("country")
+        obt = res["perfiles"][res["perfiles"]["variante"] == fila.variante].set_index("country")
+        assert ref.index.equals(obt.index), fila
+        for col in ("vulnerability", "indirect_share", "num_suppliers_effective", "importance"):
+            assert np.allclose(ref[col], obt[col], rtol=1e-9, atol=atol), (fila, col)
+            max_diff = max(max_diff, float(np.abs(ref[col] - obt[col]).max()))
+        assert (ref["global_rank"] == obt["global_rank"]).all(), fila
+
+        hubs = res["hubs"][res["hubs"]["variante"] == fila.variante].set_index("country")
+        for pais, f in frecuencia.items():
+            assert hubs.loc[pais, "frequency_total"] == f, (fila, pais)
+            assert np.isclose(hubs.loc[pais, "strength_total"], fuerza[pais], rtol=1e-9, atol=atol), (fila, pais)
+
+    return {'ok': True, 'variantes': len(rejilla), 'max_diff': max_diff}
+
+
+if __name__ == "__main__":
+    from itp_ingest import cargar_itp_anio
+    from trade_tensor import crear_tensor_comercio, matrices_desde_tensor
+
+    parser = argparse.ArgumentParser(description="Barrido de parámetros del motor ISE para un año")
+    parser.add_argument("year", type=int)
+    parser.add_argument("--threshold-pct", type=float, nargs="+")
+    parser.add_argument("--convergencia", type=float, nargs="+", help="convergence_threshold")
+    parser.add_argument("--umbral-caminos", type=float, nargs="+", help="path_strength_threshold")
+    parser.add_argument("--longitud", type=int, nargs="+", help="max_possible_length")
+    parser.add_argument("--top", type=int, default=10, help="Tamaño del top para el solape de rankings")
+    parser.add_argument("--industrias", type=int, help="Solo las primeras N industrias (pruebas)")
+    parser.add_argument("--jobs", type=int, default=1, help="Industrias en paralelo (-1 = todos los núcleos)")
+    parser.add_argument("--nombre", help="Sufijo de la carpeta de salida")
+    args = parser.parse_args()
+
+    rejilla = rejilla_parametros(args.threshold_pct, args.convergencia, args.umbral_caminos, args.longitud)
+    data = cargar_itp_anio(args.year)
+    codigos = sorted(data["importer_iso3"].unique().tolist())
+    tensor, industrias = crear_tensor_comercio(data, codigos)
+    del data
+    if args.industrias:
+        industrias = industrias[:args.industrias]
+        tensor = tensor[:args.industrias]
+    matrices = matrices_desde_tensor(tensor, industrias, codigos)
+
+    res = barrer_parametros(matrices, rejilla, year=args.year, top=args.top, n_jobs=args.jobs)
+    destino = ruta_barrido(args.year, nombre=args.nombre)
+    guardar_barrido(res, destino)
+    print(res["estabilidad"].round(4).to_string(index=False))
+    print(f"\n Tiempos compartidos: {res['segundos']}")
+    print(f" Tablas guardadas en: {destino}")
@@ -0,0 +1,16 @@
+"""
+BENCHMARK DEL PIPELINE ISE
+ITP sintético (sintetico.py) y medición por etapas con historial JSON (etapas.py).
+
+    cd notebooks/analysis
+    python -m benchmark --escala pequena
+"""
+from benchmark.etapas import (
+    ESCALAS,
+    HISTORIAL,
+    comparar_con_anterior,
+    ejecutar_benchmark,
+    guardar_en_historial,
+    verificar_contra_referencia,
+)
+from benchmark.sintetico import codigos_iso3, escribir_partes_gz, generar_itp_sintetico
@@ -0,0 +1,59 @@
+import argparse
+import sys
+
+from benchmark.etapas import (
+    ESCALAS,
+    HISTORIAL,
+    cargar_historial,
+    comparar_con_anterior,
+    ejecutar_benchmark,
+    guardar_en_historial,
+)
+
+parser = argparse.ArgumentParser(prog="python -m benchmark",
+                                 description="Benchmark del pipeline ISE sobre un ITP sintético")
+parser.add_argument("--escala", choices=sorted(ESCALAS), default="pequena",
+                    help="Tamaño predefinido (los argumentos explícitos lo sobrescriben)")
+parser.add_argument("--paises", type=int)
+parser.add_argument("--industrias", type=int)
+parser.add_argument("--industrias-motor", type=int, help="Industrias medidas a cada longitud L")
+parser.add_argument("--densidad", type=float, default=0.3)
+parser.add_argument("--longitudes", type=int, nargs="+", default=[2, 3, 4, 5])
+parser.add_argument("--anio", type=int, default=2016)
+parser.add_argument("--semilla", type=int, default=0)
+parser.add_argument("--sin-build", action="store_true", help="No mide build.py")
+parser.add_argument("--sin-verificar", action="store_true", help="Omite la comparación con process_country_pair")
+parser.add_argument("--historial", default=str(HISTORIAL), help="JSON donde se acumulan las ejecuciones")
+parser.add_argument("--no-guardar", action="store_true", help="No añade esta ejecución al historial")
+parser.add_argument("--tolerancia", type=float, default=1.25,
+                    help="Ratio de tiempo frente a la ejecución anterior a partir del cual hay regresión")
+parser.add_argument("--estricto", action="store_true", help="Sale con código 1 si hay regresiones")
+args = parser.parse_args()
+
+tam = dict(ESCALAS[args.escala])
+for clave in ("paises", "industrias", "industrias_motor"):
+    if getattr(args, clave) is not None:
+        tam[clave] = getattr(args, clave)
+
+registro = ejecutar_benchmark(
+    densidad=args.densidad, anio=args.anio, longitudes=tuple(args.longitudes), semilla=args.semilla,
+    incluir_build=not args.sin_build, verificar=not args.sin_verificar, **tam,
+)
+historial = cargar_historial(args.historial) + [registro]
+if not args.no_guardar:
+    historial = guardar_en_historial(registro, args.historial)
+    print(f"\n[OK] Ejecución añadida a {args.historial} ({len(historial)} en total)")
+
+if registro["verificaciones"]:
+    peor = max(registro["verificaciones"].values())
+    print(f"[OK] Motor matricial = process_country_pair en {len(registro['verificaciones'])} casos (dif. máx. {peor:.2e})")
+
+comparacion = comparar_con_anterior(registro, historial, args.tolerancia)
+if not comparacion:
+    print("[=] Sin ejecuciones anteriores con los mismos parámetros para comparar")
+else:
+    print(f"\n{'etapa':<22}{'antes s':>10}{'ahora s':>10}{'ratio':>8}")
+    for nombre, antes, ahora, ratio, regresion in comparacion:
+        print(f"{nombre:<22}{antes:>10.3f}{ahora:>10.3f}{ratio:>8.2f}{'  ⚠️ REGRESIÓN' if regresion else ''}")
+    if args.estricto and any(r[-1] for r in comparacion):
+        sys.exit(1)
@@ -0,0 +1,294 @@
+"""
+ETAPAS DEL BENCHMARK
+Ejecuta el pipeline completo sobre un ITP sintético en una carpeta temporal con la
+estructura del proyecto ("Seguridad Economica/data/processed/..."), cronometra cada
+etapa y guarda el resultado en un historial JSON para detectar regresiones.
+
+Etapas: generar → ingesta (partes .gz → Parquet) → carga del año → matrices (tensor de
+comercio, lo que hace crear_matriz_comercio_optimizado en el notebook) → limpieza
+(eliminar_filas_columnas_cero) → motor a L=2..5 → motor con almacén → arquitecto →
+build del dashboard.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows: sin getrusage, las etapas van sin memoria pico
+    resource = None
+
+from benchmark.sintetico import escribir_partes_gz, generar_itp_sintetico
+from dependency_engine import (
+    calculate_all_dependencies,
+    calculate_all_dependencies_parallel,
+    calcular_todas_las_industrias,
+    eliminar_filas_columnas_cero,
+    verificar_motor_matricial,
+)
+from itp_ingest import cargar_itp_anio, ingestar_itp
+from results_store import EscritorResultados, ruta_resultados
+from trade_tensor import crear_tensor_comercio, matrices_desde_tensor, totales_importacion
+
+ANALYSIS_DIR = Path(__file__).resolve().parent.parent
+BASE_PATH = ANALYSIS_DIR.parent.parent
+DASHBOARD_DIR = BASE_PATH / "dashboard_prototype"
+# Fuera del control de versiones (.gitignore): cada máquina acumula su propio historial
+HISTORIAL = BASE_PATH / "data" / "processed" / "_benchmark" / "historial.json"
+
+# Tamaños predefinidos (el ITP real: ~236 países, 170 industrias)
+ESCALAS = {
+    "pequena": {"paises": 40, "industrias": 10, "industrias_motor": 10},
+    "media": {"paises": 120, "industrias": 40, "industrias_motor": 10},
+    "completa": {"paises": 236, "industrias": 170, "industrias_motor": 20},
+}
+# Casos de la verificación contra process_country_pair: (países, longitud máxima)
+CASOS_VERIFICACION = [(6, 2), (7, 3), (8, 4), (8, 5)]
+
+
+def _rss_pico_mb(hijos=False):
+    """Memoria pico del proceso (o de sus hijos) en MB; None sin resource (Windows)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_CHILDREN if hijos else resource.RUSAGE_SELF).ru_maxrss
+    return round(pico / (1 << 20) if sys.platform == "darwin" else pico / 1024, 1)
+
+
+class _Cronometro:
+    """Tiempo y memoria pico (acumulada del proceso) por etapa."""
+
+    def __init__(self, verbose=True):
+        self.etapas = {}
+        self.verbose = verbose
+
+    @contextmanager
+    def etapa(self, nombre, **extra):
+        inicio = time.perf_counter()
+        cpu = time.process_time()
+        yield extra
+        self.etapas[nombre] = {
+            "segundos": round(time.perf_counter() - inicio, 4),
+            "cpu_segundos": round(time.process_time() - cpu, 4),
+            "rss_pico_mb": _rss_pico_mb(),
+            **extra,
+        }
+        if self.verbose:
+            print(f"  {nombre:<22} {self.etapas[nombre]['segundos']:>9.3f} s")
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ANALYSIS_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def verificar_contra_referencia(matriz_limpia=None, casos=CASOS_VERIFICACION, rtol=1e-9):
+    """
+    Motor matricial frente a process_country_pair (motor por pares) en tamaños pequeños:
+    matrices aleatorias para cada (n, L) de casos (rutas densa y dispersa) y, si se da,
+    una industria sintética recortada a sus 10 mayores países.
+
+    Returns:
+    --------
+    dict
+        {caso: diferencia máxima}; lanza AssertionError si algo no coincide
+    """
+    resultado = {}
+    for n, L in casos:
+        for modo in ("densa", "dispersa"):
+            res = verificar_motor_matricial(n=n, max_possible_length=L, seed=n * 10 + L, rtol=rtol, modo=modo)
+            resultado[f"aleatoria_{modo}_n{n}_L{L}"] = res["max_diff"]
+
+    if matriz_limpia is not None:
+        mayores = matriz_limpia.sum(axis=0).sort_values(ascending=False).index[:10]
+        sub = matriz_limpia.loc[mayores, mayores]
+        X, nombres = sub.to_numpy(dtype=np.float64), sub.columns.tolist()
+        for L in (3, 4):
+            ref = calculate_all_dependencies_parallel(X, nombres, max_possible_length=L, n_jobs=1, use_gpu=False)
+            mat = calculate_all_dependencies(X, nombres, max_possible_length=L, engine="matricial", n_jobs=1)
+            max_diff = 0.0
+            for a, b in zip(ref["dependencies"], mat["dependencies"]):
+                assert (a["importador"], a["exportador"], a["longitud_optima"]) == \
+                       (b["importador"], b["exportador"], b["longitud_optima"]), (a, b)
+                assert np.isclose(a["dependencia_total"], b["dependencia_total"], rtol=rtol, atol=1e-12), (a, b)
+                max_diff = max(max_diff, abs(a["dependencia_total"] - b["dependencia_total"]))
+            resultado[f"sintetica_n{len(nombres)}_L{L}"] = max_diff
+    return resultado
+
+
+def ejecutar_benchmark(paises=40, industrias=10, densidad=0.3, anio=2016, longitudes=(2, 3, 4, 5),
+                       industrias_motor=None, semilla=0, incluir_build=True, verificar=True,
+                       directorio=None, verbose=True):
+    """
+    Ejecuta todas las etapas sobre un ITP sintético.
+
+    Parameters:
+    -----------
+    industrias_motor : int, opcional
+        Industrias sobre las que se mide el motor a cada longitud (por defecto todas)
+    directorio : Path, opcional
+        Carpeta de trabajo (por defecto una temporal que se borra al terminar)
+
+    Returns:
+    --------
+    dict
+        Registro del historial: parámetros, entorno, etapas y verificaciones
+    """
+    parametros = {
+        "paises": paises, "industrias": industrias, "densidad": densidad, "anio": anio,
+        "longitudes": list(longitudes), "industrias_motor": industrias_motor, "semilla": semilla,
+        "build": incluir_build,
+    }
+    crono = _Cronometro(verbose)
+    temporal = tempfile.TemporaryDirectory(prefix="ise_benchmark_") if directorio is None else None
+    raiz = Path(directorio or temporal.name) / "Seguridad Economica"
+    processed = raiz / "data" / "processed"
+    cwd = Path.cwd()
+
+    try:
+        if verbose:
+            print(f"[*] Benchmark ISE: {paises} países × {industrias} industrias (densidad {densidad})")
+
+        with crono.etapa("generar") as extra:
+            df = generar_itp_sintetico(paises, industrias, (anio,), densidad, semilla=semilla)
+            partes = escribir_partes_gz(df, raiz / "data" / "raw" / "ITP" / "ITPD_E_R03")
+            extra["filas"] = len(df)
+        del df
+
+        dataset_dir = processed / "ITPD_E_R03_parquet"
+        with crono.etapa("ingesta") as extra:
+            ingestar_itp(partes[0].parent, dataset_dir, verbose=False)
+            extra["bytes_gz"] = sum(p.stat().st_size for p in partes)
+
+        with crono.etapa("carga_anio"):
+            data = cargar_itp_anio(anio, dataset_dir)
+
+        with crono.etapa("matrices") as extra:
+            codigos = sorted(data["importer_iso3"].unique().tolist())
+            tensor, nombres_ind = crear_tensor_comercio(data, codigos)
+            matrices = matrices_desde_tensor(tensor, nombres_ind, codigos)
+            totales_importacion(tensor, nombres_ind, codigos)
+            extra["forma_tensor"] = list(tensor.shape)
+        del data
+
+        with crono.etapa("limpieza") as extra:
+            limpias = {ind: eliminar_filas_columnas_cero(mat, threshold_pct=0.005) for ind, mat in matrices.items()}
+            extra["paises_medios"] = float(np.mean([m.shape[0] for m in limpias.values()]))
+
+        seleccion = list(limpias)[:industrias_motor] if industrias_motor else list(limpias)
+        for L in longitudes:
+            with crono.etapa(f"motor_L{L}") as extra:
+                for ind in seleccion:
+                    m = limpias[ind]
+                    calculate_all_dependencies(m.values, m.columns.tolist(), max_possible_length=L, n_jobs=1)
+                extra["industrias"] = len(seleccion)
+
+        # Año completo como en el notebook (L=3 por defecto): almacén results_{año}/
+        results_dir = ruta_resultados(anio, processed / "dependencias_consolidadas")
+        with crono.etapa("motor_almacen") as extra:
+            with EscritorResultados(results_dir, parametros={"anio": anio}) as escritor:
+                _, saltadas, errores = calcular_todas_las_industrias(
+                    matrices, threshold_pct=0.005, verbose=False, escritor=escritor, conservar_resultados=False)
+            extra["industrias"] = len(escritor.industrias)
+            extra["errores"] = len(errores)
+        del matrices, tensor
+
+        with crono.etapa("arquitecto"):
+            # process_year busca la raíz "Seguridad Economica" subiendo desde el directorio actual
+            from ise_architect import process_year
+            os.chdir(raiz)
+            try:
+                if not process_year(anio, forzar=True):
+                    raise RuntimeError("❌ El arquitecto no pudo procesar el año sintético")
+            finally:
+                os.chdir(cwd)
+
+        if incluir_build and (DASHBOARD_DIR / "build.py").exists():
+            destino = raiz / "dashboard_prototype"
+            destino.mkdir(parents=True, exist_ok=True)
+            for nombre in ("build.py", "stream_writer.py", "template.html"):
+                (destino / nombre).write_bytes((DASHBOARD_DIR / nombre).read_bytes())
+            entorno = dict(os.environ, PYTHONPATH=os.pathsep.join([str(ANALYSIS_DIR), os.environ.get("PYTHONPATH", "")]))
+            with crono.etapa("build") as extra:
+                subprocess.run([sys.executable, "build.py"], cwd=destino, env=entorno, check=True,
+                               capture_output=True, text=True)
+                extra["index_mb"] = round((destino / "index.html").stat().st_size / 1e6, 2)
+                extra["rss_pico_mb_hijo"] = _rss_pico_mb(hijos=True)
+
+        verificaciones = None
+        if verificar:
+            with crono.etapa("verificacion"):
+                verificaciones = verificar_contra_referencia(limpias[seleccion[0]] if seleccion else None)
+    finally:
+        os.chdir(cwd)
+        if temporal is not None:
+            temporal.cleanup()
+
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "entorno": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "parametros": parametros,
+        "etapas": crono.etapas,
+        "verificaciones": verificaciones,
+    }
+
+
+def cargar_historial(ruta=HISTORIAL):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+
+def guardar_en_historial(registro, ruta=HISTORIAL):
+    """Añade el registro al historial (escritura atómica) y lo devuelve completo."""
+    ruta = Path(ruta)
+    historial = cargar_historial(ruta)
+    historial.append(registro)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    temporal = ruta.with_name(f"{ruta.name}.{os.getpid()}.tmp")
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(historial, f, ensure_ascii=False, indent=2)
+    os.replace(temporal, ruta)
+    return historial
+
+
+def comparar_con_anterior(registro, historial, tolerancia=1.25, minimo_segundos=0.1):
+    """
+    Compara cada etapa con la última ejecución con los mismos parámetros.
+
+    Returns:
+    --------
+    list
+        [(etapa, segundos anteriores, segundos actuales, ratio, es_regresion)]
+    """
+    previos = [r for r in historial if r is not registro and r.get("parametros") == registro["parametros"]]
+    if not previos:
+        return []
+    anterior = previos[-1]["etapas"]
+    filas = []
+    for nombre, actual in registro["etapas"].items():
+        if nombre not in anterior:
+            continue
+        antes, ahora = anterior[nombre]["segundos"], actual["segundos"]
+        ratio = ahora / antes if antes > 0 else float("inf")
+        filas.append((nombre, antes, ahora, ratio, ratio > tolerancia and ahora - antes > minimo_segundos))
+    return filas
@@ -0,0 +1,123 @@
+"""
+ITP SINTÉTICO
+Genera registros con la forma del ITPD-E (exporter_iso3, importer_iso3, year, trade,
+industry_id, industry_descr, importer_name, exporter_name) para medir el pipeline sin
+los datos reales de data/raw/ITP:
+
+- Países con "tamaño" de cola pesada (lognormal): pocos grandes exportadores y muchos
+  pequeños, como en el comercio real.
+- Flujos tipo gravedad (tamaño exportador × tamaño importador × peso de la industria)
+  con ruido de Pareto, y enlaces presentes con probabilidad creciente con el tamaño, de
+  modo que la densidad media es la pedida pero los grandes comercian con casi todos.
+- Comercio doméstico (diagonal) opcional, que el ITP incluye.
+"""
+import gzip
+import itertools
+import string
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from itp_ingest import DTYPES, USECOLS
+
+
+def codigos_iso3(n):
+    """n códigos de tres letras deterministas, con ESP siempre presente (el pipeline la trata aparte)."""
+    codigos = ["ESP"]
+    for letras in itertools.product(string.ascii_uppercase, repeat=3):
+        if len(codigos) >= n:
+            break
+        codigo = "".join(letras)
+        if codigo != "ESP":
+            codigos.append(codigo)
+    return sorted(codigos[:n])
+
+
+def generar_itp_sintetico(paises=60, industrias=20, anios=(2016,), densidad=0.3,
+                          alfa_pareto=1.5, sigma_tamano=1.5, domestico=True, semilla=0):
+    """
+    DataFrame con la forma del ITP (tipos de itp_ingest.DTYPES).
+
+    Parameters:
+    -----------
+    paises, industrias : int
+        Tamaño del problema (el ITP real tiene ~236 países y 170 industrias)
+    anios : iterable
+        Años a generar (cada año perturba ligeramente los flujos del anterior)
+    densidad : float
+        Fracción media de pares exportador → importador con comercio en cada industria
+    alfa_pareto : float
+        Índice de cola del ruido multiplicativo (menor = flujos más extremos)
+    sigma_tamano : float
+        Dispersión lognormal del tamaño de los países
+    domestico : bool
+        Incluye el comercio doméstico (exportador == importador)
+
+    Returns:
+    --------
+    pandas.DataFrame
+    """
+    rng = np.random.default_rng(semilla)
+    iso3 = np.asarray(codigos_iso3(paises), dtype=object)
+    nombres = np.asarray([f"Country {c}" for c in iso3], dtype=object)
+    descr = np.asarray([f"Industry {k:03d}" for k in range(industrias)], dtype=object)
+    ids = np.arange(1, industrias + 1, dtype=np.int32)
+
+    tamano = rng.lognormal(0.0, sigma_tamano, paises)
+    tamano /= tamano.max()
+    peso_industria = rng.lognormal(0.0, 1.0, industrias)
+
+    # Probabilidad de enlace ∝ (tamaño_e · tamaño_i)^0.5, escalada a la densidad pedida
+    afinidad = np.sqrt(np.outer(tamano, tamano))
+    prob = np.clip(afinidad * densidad / afinidad.mean(), 0.0, 1.0)
+
+    base = None
+    trozos = []
+    for anio in anios:
+        if base is None:
+            enlaces = rng.random((industrias, paises, paises)) < prob
+            ruido = rng.pareto(alfa_pareto, (industrias, paises, paises)) + 0.01
+            base = np.where(enlaces, ruido * np.outer(tamano, tamano) * peso_industria[:, None, None], 0.0)
+            if domestico:
+                diag = np.arange(paises)
+                base[:, diag, diag] = tamano * peso_industria[:, None] * 20.0
+        else:
+            # Evolución anual: crecimiento lognormal suave sobre los mismos enlaces
+            base = base * rng.lognormal(0.02, 0.1, base.shape)
+
+        k, e, i = np.nonzero(base)
+        trozos.append(pd.DataFrame({
+            "exporter_iso3": iso3[e],
+            "importer_iso3": iso3[i],
+            "year": np.int32(anio),
+            "trade": (base[k, e, i] * 1e6).astype(np.float32),
+            "industry_id": ids[k],
+            "industry_descr": descr[k],
+            "importer_name": nombres[i],
+            "exporter_name": nombres[e],
+        }))
+
+    df = pd.concat(trozos, ignore_index=True)[USECOLS]
+    return df.astype(DTYPES)
+
+
+def escribir_partes_gz(df, directorio, partes=3, prefijo="ITPD_E_R03.csv.parte"):
+    """
+    Escribe df como las partes .gz del ITP (un CSV troceado; cabecera solo en la primera),
+    listas para itp_ingest.ingestar_itp.
+
+    Returns:
+    --------
+    list
+        Rutas de las partes escritas
+    """
+    directorio = Path(directorio)
+    directorio.mkdir(parents=True, exist_ok=True)
+    rutas = []
+    for n, trozo in enumerate(np.array_split(np.arange(len(df)), partes), start=1):
+        ruta = directorio / f"{prefijo}{n}.gz"
+        with gzip.open(ruta, "wt", encoding="utf-8", compresslevel=1, newline="") as f:
+            df.iloc[trozo].to_csv(f, index=False, header=(n == 1))
+        rutas.append(ruta)
+    return rutas
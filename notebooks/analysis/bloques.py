@@ -0,0 +1,424 @@
+"""
+BLOQUES DE PAÍSES ISE
+Dependencias de bloques (UE, G7, BRICS...) como un solo país, calculadas contrayendo
+las matrices de cada industria en lugar de recalcular el año con otra lista de países
+(el colapso de _archive/dependency_v2_UE.ipynb, que rehacía todo el notebook).
+
+Con un mapeo {país: bloque} y la matriz de agregación S (n × m, un 1 por país en la
+columna de su bloque o de sí mismo si no está en ninguno), la matriz de comercio del
+grafo contraído es Sᵀ · X · S: cada bloque es un nodo que importa y exporta la suma de
+sus miembros. Su matriz de transición es la contracción de T ponderada por las
+importaciones de cada miembro (T_b[a, b] = Σ_{j∈a, i∈b} T[j, i] · d_i / Σ_{i∈b} d_i),
+así que las dependencias del bloque como importador son medias ponderadas de las de
+sus miembros y, como proveedor, sumas sobre sus miembros. Los flujos internos del
+bloque quedan en su diagonal (como el comercio doméstico de un país); con neto=True se
+anulan, como en el notebook archivado, y las dependencias del bloque son cuotas de sus
+importaciones de fuera del bloque.
+
+X se reconstruye desde el almacén del motor (results_{año}/pairs.parquet: trade_value
+es X[j, i] de la matriz limpia y direct = X[j, i] / d_i), de modo que se contraen las
+mismas matrices que usó el motor sin volver a leer el ITP; un año completo tarda
+segundos. Salidas por año:
+
+- pares: por (importador, exportador, industria) las dependencias del grafo contraído
+  en que el importador o el exportador es un bloque.
+- perfiles / hubs: filas de los bloques con las columnas de profiles_{año} y
+  hubs_{año} (ise_architect.py). anadir_bloques las añade a las tablas de los países
+  con is_bloc=True y su puesto entre los países; es lo que hace
+  `python ise_architect.py 2022 --bloques EU27 ASEAN`.
+
+    python bloques.py 2022 --bloques EU27 USMCA
+"""
+import argparse
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from agregados import caminos_planos, contar_intermediarios, parciales_perfiles, perfiles_desde_parciales
+from dependency_engine import (
+    PESO_FRECUENCIA,
+    PESO_FUERZA,
+    calcular_dependencias_por_longitud,
+    calcular_longitudes_convergencia,
+    parametros_motor,
+)
+from path_search import buscar_caminos_desde, vecinos_ordenados
+from results_store import iterar_industrias, matriz_desde_pares, parametros_almacen, ruta_resultados
+
+BASE_PATH = Path(__file__).resolve().parent.parent.parent
+BLOQUES_DIR = BASE_PATH / "data" / "processed" / "bloques"
+
+# ============================================================================
+# BLOQUES PREDEFINIDOS (los de _archive/dependency_v2_UE.ipynb)
+# ============================================================================
+
+BLOQUES = {
+    "EU27": {'AUT', 'BEL', 'BGR', 'HRV', 'CYP', 'CZE', 'DNK', 'EST',
+             'FIN', 'FRA', 'DEU', 'GRC', 'HUN', 'IRL', 'ITA', 'LVA',
+             'LTU', 'LUX', 'MLT', 'NLD', 'POL', 'PRT', 'ROU', 'SVK',
+             'SVN', 'ESP', 'SWE'},
+    "ASEAN": {'BRN', 'KHM', 'IDN', 'LAO', 'MYS', 'MMR', 'PHL', 'SGP', 'THA', 'VNM'},
+    "MERCOSUR": {'ARG', 'BRA', 'PRY', 'URY'},
+    "USMCA": {'USA', 'CAN', 'MEX'},
+    "G7": {'USA', 'JPN', 'DEU', 'GBR', 'FRA', 'ITA', 'CAN'},
+    "BRICS": {'BRA', 'RUS', 'IND', 'CHN', 'ZAF'},
+}
+
+
+def crear_mapeo(grupos):
+    """
+    Mapeo {país_iso3: bloque}.
+
+    Parameters:
+    -----------
+    grupos : dict o iterable
+        {nombre_bloque: países} o nombres de BLOQUES (p. ej. ["EU27", "ASEAN"])
+
+    Raises:
+    -------
+    ValueError
+        Si un bloque no existe o un país está en dos bloques (p. ej. EU27 y G7): cada
+        contracción asigna cada país a un solo nodo
+    """
+    if not isinstance(grupos, dict):
+        desconocidos = [g for g in grupos if g not in BLOQUES]
+        if desconocidos:
+            raise ValueError(f"❌ Bloques desconocidos: {desconocidos} (disponibles: {sorted(BLOQUES)})")
+        grupos = {g: BLOQUES[g] for g in grupos}
+    mapping = {}
+    for group_name, countries in grupos.items():
+        for country in countries:
+            if mapping.get(country, group_name) != group_name:
+                raise ValueError(f"❌ {country} está en {mapping[country]} y en {group_name}: "
+                                 "los bloques de una contracción no pueden solaparse")
+            mapping[country] = group_name
+    return mapping
+
+
+def matriz_agregacion(codigos, mapeo):
+    """
+    Matriz S de la contracción de codigos según mapeo.
+
+    Returns:
+    --------
+    tuple
+        (S float64 (n, m), nodos (array de m etiquetas en orden alfabético, como el
+        groupby del notebook archivado), es_bloque (bool, m))
+    """
+    etiquetas = np.asarray([mapeo.get(c, c) for c in codigos], dtype=object)
+    nodos, destino = np.unique(etiquetas, return_inverse=True)
+    S = np.zeros((len(codigos), len(nodos)), dtype=np.float64)
+    S[np.arange(len(codigos)), destino] = 1.0
+    bloques = set(mapeo.values())
+    return S, nodos, np.asarray([nodo in bloques for nodo in nodos], dtype=bool)
+
+
+def contraer(X, S):
+    """Sᵀ · X · S (también sobre pilas (..., n, n))."""
+    return S.T @ X @ S
+
+
+def _bloques_industria(industria, X, codigos, mapeo, neto=True, convergence_threshold=0.01,
+                       max_possible_length=3, path_strength_threshold=0.001):
+    """
+    Dependencias y caminos del grafo contraído de una industria.
+
+    Returns:
+    --------
+    dict o None
+        'pares' (pares con algún bloque), 'perfiles' (parciales de esos pares) y 'hubs'
+        {bloque: (frecuencia, fuerza)}; None si ningún país de la industria está en un bloque
+    """
+    S, nodos, es_bloque = matriz_agregacion(codigos, mapeo)
+    if not es_bloque.any():
+        return None
+    Xb = contraer(X, S)
+    m = len(nodos)
+    if neto:
+        b = np.flatnonzero(es_bloque)
+        Xb[b, b] = 0.0
+
+    # Como calculate_all_dependencies_matrix sobre Xb
+    denom = Xb.sum(axis=0)
+    denom[denom == 0.0] = np.inf
+    direct = Xb / denom
+    dependencias = calcular_dependencias_por_longitud(direct, max_possible_length)
+    indirect, length = calcular_longitudes_convergencia(direct, dependencias, max_possible_length,
+                                                        convergence_threshold)
+    del dependencias
+
+    jj, ii = np.nonzero((es_bloque[:, None] | es_bloque[None, :]) & ~np.eye(m, dtype=bool))
+    pares = pd.DataFrame({
+        "importer": nodos[ii],
+        "exporter": nodos[jj],
+        "industry": industria,
+        "trade_value": Xb[jj, ii],
+        "direct": direct[jj, ii],
+        "indirect": indirect[jj, ii],
+        "total": direct[jj, ii] + indirect[jj, ii],
+        "longitud": length[jj, ii].astype(np.int8),
+    })
+
+    # Caminos significativos del grafo contraído → bloques como intermediarios
+    caminos = [{} for _ in range(m)]
+    if max_possible_length >= 3 or (max_possible_length >= 2 and path_strength_threshold > 0):
+        orden_filas, pesos_filas = vecinos_ordenados(direct)
+        for j in range(m):
+            caminos[j] = buscar_caminos_desde(direct, j, max_possible_length, path_strength_threshold, top_k=0,
+                                              longitudes_j=length[j], orden_filas=orden_filas,
+                                              pesos_filas=pesos_filas)
+    _, _, c_lon, c_fuerza, c_interms = caminos_planos(caminos, m, max(max_possible_length, 1))
+    sig = (c_fuerza > path_strength_threshold) & ((c_lon > 2) | (path_strength_threshold > 0))
+    frecuencia, fuerza = contar_intermediarios(c_interms[sig], c_fuerza[sig], m)
+    hubs = {nodos[k]: (int(frecuencia[k]), float(fuerza[k])) for k in np.flatnonzero(es_bloque)}
+    return {"pares": pares, "perfiles": parciales_perfiles(pares), "hubs": hubs}
+
+
+class AcumuladorBloques:
+    """
+    Bloques de un año industria a industria (el arquitecto lo alimenta en su misma
+    pasada por el almacén).
+
+    Parameters:
+    -----------
+    mapeo : dict
+        {país: bloque} (crear_mapeo)
+    neto : bool
+        Anula los flujos internos de cada bloque
+    parametros : dict
+        convergence_threshold y path_strength_threshold del motor (parametros_almacen)
+    """
+
+    def __init__(self, mapeo, neto=True, parametros=None):
+        parametros = parametros or parametros_motor()
+        self.mapeo = mapeo
+        self.neto = neto
+        self.convergence_threshold = parametros["convergence_threshold"]
+        self.path_strength_threshold = parametros["path_strength_threshold"]
+        self.pares = []
+        self.parciales_imp, self.parciales_exp = [], []
+        self.frecuencia = defaultdict(int)
+        self.fuerza = defaultdict(float)
+
+    def agregar(self, info, pares):
+        """Añade una industria: info es su fila de industries, pares su tabla pairs (DataFrame o Arrow)."""
+        codigos = list(info["country_names"])
+        if len(codigos) < 2:
+            return
+        salida = _bloques_industria(info["industry"], matriz_desde_pares(pares, codigos), codigos, self.mapeo,
+                                    self.neto, self.convergence_threshold, info["max_possible_length"],
+                                    self.path_strength_threshold)
+        if salida is None:
+            return
+        self.pares.append(salida["pares"])
+        imp, exp = salida["perfiles"]
+        self.parciales_imp.append(imp)
+        self.parciales_exp.append(exp)
+        for bloque, (f, s) in salida["hubs"].items():
+            self.frecuencia[bloque] += f
+            self.fuerza[bloque] += s
+
+    def tablas(self, year):
+        """
+        Returns:
+        --------
+        dict
+            DataFrames 'pares', 'perfiles' (columnas de profiles) y 'hubs' (country,
+            frequency_total, strength_total) de los bloques
+        """
+        if not self.pares:
+            vacio = pd.DataFrame()
+            return {"pares": vacio, "perfiles": vacio, "hubs": vacio}
+        bloques = sorted(set(self.mapeo.values()))
+        perfiles = perfiles_desde_parciales(pd.concat(self.parciales_imp), pd.concat(self.parciales_exp), year)
+        # Los parciales de los países del grafo contraído están incompletos (solo sus pares con bloques)
+        perfiles = perfiles[perfiles["country"].isin(bloques)].reset_index(drop=True)
+        perfiles["global_rank"] = perfiles["vulnerability"].rank(ascending=False).astype(int)
+        hubs = pd.DataFrame({
+            "country": list(self.frecuencia),
+            "frequency_total": [self.frecuencia[b] for b in self.frecuencia],
+            "strength_total": [self.fuerza[b] for b in self.frecuencia],
+        })
+        return {"pares": pd.concat(self.pares, ignore_index=True), "perfiles": perfiles, "hubs": hubs}
+
+
+def calcular_bloques(year, bloques, neto=True, store_dir=None, verbose=True):
+    """
+    Bloques de un año desde su almacén results_{year}/.
+
+    Parameters:
+    -----------
+    bloques : dict o iterable
+        {país: bloque}, {bloque: países} o nombres de BLOQUES
+    store_dir : Path, opcional
+        Almacén del motor (por defecto ruta_resultados(year))
+
+    Returns:
+    --------
+    dict
+        DataFrames 'pares', 'perfiles' y 'hubs' (AcumuladorBloques.tablas) y 'parametros'
+    """
+    store_dir = Path(store_dir or ruta_resultados(year))
+    mapeo = bloques if isinstance(bloques, dict) and all(isinstance(v, str) for v in bloques.values()) \
+        else crear_mapeo(bloques)
+    acumulador = AcumuladorBloques(mapeo, neto, parametros_almacen(store_dir))
+    columnas = {"pairs": ["importer", "exporter", "trade_value", "direct"]}
+    for num, (info, tablas) in enumerate(iterar_industrias(store_dir, columnas, pandas=False), start=1):
+        acumulador.agregar(info, tablas["pairs"])
+        if verbose:
+            print(f"\r Industrias procesadas: {num}", end="", flush=True)
+    if verbose:
+        print()
+    salida = acumulador.tablas(year)
+    salida["parametros"] = {"year": year, "bloques": {b: sorted(p for p, g in mapeo.items() if g == b)
+                                                      for b in sorted(set(mapeo.values()))},
+                            "neto": neto}
+    return salida
+
+
+def anadir_bloques(profiles, hubs, perfiles_bloques, hubs_bloques):
+    """
+    Tablas profiles y hubs de un año con las filas de los bloques añadidas (is_bloc).
+
+    Las filas de los países no cambian. Cada bloque lleva el puesto que tendría entre
+    los países (1 + países con mayor vulnerabilidad o global_score); su freq_norm y
+    strength_norm se normalizan con los máximos de los países, así que pasan de 1 si el
+    bloque es mayor intermediario que cualquier país.
+    """
+    profiles = profiles.assign(is_bloc=False)
+    if not perfiles_bloques.empty:
+        extra = perfiles_bloques.assign(is_bloc=True)
+        vul = np.sort(profiles["vulnerability"].to_numpy())
+        extra["global_rank"] = 1 + len(vul) - np.searchsorted(vul, extra["vulnerability"].to_numpy(), side="right")
+        profiles = pd.concat([profiles, extra[profiles.columns]], ignore_index=True)
+
+    hubs = hubs.assign(is_bloc=False)
+    if not hubs_bloques.empty and not hubs.empty:
+        max_f = hubs["frequency_total"].max()
+        max_s = hubs["strength_total"].max()
+        extra = hubs_bloques.assign(is_bloc=True)
+        extra["freq_norm"] = extra["frequency_total"] / max_f if max_f > 0 else 0
+        extra["strength_norm"] = extra["strength_total"] / max_s if max_s > 0 else 0
+        extra["global_score"] = (PESO_FRECUENCIA * extra["freq_norm"]) + (PESO_FUERZA * extra["strength_norm"])
+        score = np.sort(hubs["global_score"].to_numpy())
+        extra["global_rank"] = 1 + len(score) - np.searchsorted(score, extra["global_score"].to_numpy(), side="right")
+        extra["year"] = hubs["year"].iloc[0]
+        hubs = pd.concat([hubs, extra[hubs.columns]], ignore_index=True) \
+            .sort_values("global_score", ascending=False, kind="stable").reset_index(drop=True)
+    return profiles, hubs
+
+
+def guardar_bloques(salida, directorio=None):
+    """Escribe pares, perfiles, hubs y parametros.json de un año en directorio/{año}/ (por defecto data/processed/bloques/)."""
+    destino = Path(directorio or BLOQUES_DIR) / str(salida["parametros"]["year"])
+    destino.mkdir(parents=True, exist_ok=True)
+    for nombre in ("pares", "perfiles", "hubs"):
+        salida[nombre].to_parquet(destino / f"{nombre}.parquet", index=False)
+    with open(destino / "parametros.json", "w", encoding="utf-8") as f:
+        json.dump(salida["parametros"], f, ensure_ascii=False, indent=2)
+    return destino
+
+
+def verificar_bloques(n=20, max_possible_length=4, density=0.5, seed=0, atol=1e-9):
+    """
+    Compara la contracción con el colapso del notebook archivado (agrupar filas y
+    columnas del bloque con pandas y pasar el motor matricial a la matriz colapsada),
+    con y sin neto, partiendo de un almacén escrito por el motor.
+
+    Returns:
+    --------
+    dict
+        Resumen de la comparación ('ok', diferencia máxima)
+
+    Raises:
+    -------
+    AssertionError
+        Si alguna dependencia, longitud, perfil o intermediario no coincide
+    """
+    import tempfile
+
+    from dependency_engine import calculate_all_dependencies_matrix, eliminar_filas_columnas_cero
+    from ise_architect import calcular_perfiles
+    from results_store import guardar_resultados
+
+    rng = np.random.default_rng(seed)
+    codigos = [f"C{k:02d}" for k in range(n)]
+    grupos = {"B1": codigos[2:7], "B2": codigos[10:13]}
+    mapeo = crear_mapeo(grupos)
+    all_results = {}
+    for k in range(2):
+        X = rng.pareto(1.5, size=(n, n))
+        X[rng.random((n, n)) > density] = 0.0
+        limpia = eliminar_filas_columnas_cero(X, country_names=codigos)
+        all_results[f"Industria {k}"] = {
+            "results": calculate_all_dependencies_matrix(limpia.values, limpia.columns.tolist(),
+                                                         max_possible_length=max_possible_length),
+            "matrix": limpia, "matrix_shape": limpia.shape, "country_names": limpia.columns.tolist(),
+        }
+
+    max_diff = 0.0
+    with tempfile.TemporaryDirectory(prefix="ise_bloques_") as tmp:
+        store_dir = guardar_resultados(all_results, Path(tmp) / "results_2016")
+        for neto in (True, False):
+            salida = calcular_bloques(2016, mapeo, neto=neto, store_dir=store_dir, verbose=False)
+            pares = salida["pares"].set_index(["importer", "exporter", "industry"])
+            filas, frecuencia, fuerza = [], defaultdict(int), defaultdict(float)
+            for industria, entrada in all_results.items():
+                col = entrada["matrix"].copy()
+                col.index = col.index.map(lambda x: mapeo.get(x, x))
+                col.columns = col.columns.map(lambda x: mapeo.get(x, x))
+                col = col.groupby(level=0).sum().T.groupby(level=0).sum().T
+                if neto:
+                    for b in set(mapeo.values()) & set(col.index):
+                        col.loc[b, b] = 0.0
+                r = calculate_all_dependencies_matrix(col.values, col.columns.tolist(),
+                                                      max_possible_length=max_possible_length)
+                deps = [d for d in r["dependencies"] if d["importador"] in grupos or d["exportador"] in grupos]
+                for d in deps:
+                    fila = pares.loc[(d["importador"], d["exportador"], industria)]
+                    assert fila["longitud"] == d["longitud_optima"], (neto, d, fila)
+                    assert np.isclose(fila["total"], d["dependencia_total"], rtol=1e-9, atol=atol), (neto, d, fila)
+                    max_diff = max(max_diff, abs(fila["total"] - d["dependencia_total"]))
+                filas.append(pd.DataFrame({
+                    "importer": [d["importador"] for d in deps],
+                    "exporter": [d["exportador"] for d in deps],
+                    "industry": industria,
+                    "trade_value": [d["trade_value"] for d in deps],
+                    "direct": [d["dependencia_directa"] for d in deps],
+                    "indirect": [d["dependencia_indirecta"] for d in deps],
+                    "total": [d["dependencia_total"] for d in deps],
+                }))
+                for b in grupos:
+                    frecuencia[b] += r["intermediary_frequency"].get(b, 0)
+                    fuerza[b] += r["intermediary_strength"].get(b, 0.0)
+
+            ref = calcular_perfiles(pd.concat(filas, ignore_index=True), 2016).set_index("country").loc[list(grupos)]
+            obt = salida["perfiles"].set_index("country").loc[list(grupos)]
+            for col in ("vulnerability", "indirect_share", "num_suppliers_effective", "importance"):
+                assert np.allclose(ref[col], obt[col], rtol=1e-9, atol=atol), (neto, col)
+            hubs = salida["hubs"].set_index("country")
+            for b in grupos:
+                assert hubs.loc[b, "frequency_total"] == frecuencia[b], (neto, b)
+                assert np.isclose(hubs.loc[b, "strength_total"], fuerza[b], rtol=1e-9, atol=atol), (neto, b)
+    return {'ok': True, 'max_diff': max_diff}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dependencias de bloques de países por contracción de matrices")
+    parser.add_argument("years", nargs="+", type=int)
+    parser.add_argument("--bloques", nargs="+", required=True, help=f"Bloques a contraer ({', '.join(BLOQUES)})")
+    parser.add_argument("--bruto", action="store_true",
+                        help="Conserva los flujos internos de cada bloque (como su comercio doméstico)")
+    parser.add_argument("--salida", default=str(BLOQUES_DIR))
+    args = parser.parse_args()
+
+    mapeo = crear_mapeo(args.bloques)
+    for year in args.years:
+        inicio = time.perf_counter()
+        salida = calcular_bloques(year, mapeo, neto=not args.bruto)
+        destino = guardar_bloques(salida, args.salida)
+        print(f" {year}: {len(salida['pares'])} pares con bloques ({time.perf_counter() - inicio:.1f} s) → {destino}")
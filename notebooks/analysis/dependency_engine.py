@@ -0,0 +1,1402 @@
+"""
+MOTOR DE DEPENDENCIAS ISE
+Funciones de cálculo de dependencias directas e indirectas por industria.
+Se importan desde 00_dependency.ipynb (y desde procesos auxiliares) para que
+el motor pueda reutilizarse fuera del notebook.
+"""
+import inspect
+import multiprocessing
+import tempfile
+import time
+from functools import lru_cache
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from instrumentacion import etapa, medicion, metricas_resultados
+from manifiesto import huella_fichero, huella_matriz, huella_valores
+from path_search import buscar_caminos_desde, vecinos_ordenados
+
+try:
+    import torch
+except ImportError:  # El motor funciona igual sin GPU
+    torch = None
+
+try:
+    import scipy.sparse as sp
+except ImportError:  # Sin scipy el motor matricial usa siempre la ruta densa
+    sp = None
+
+# Ruta dispersa del motor matricial (scipy.sparse): se elige con modo="auto" cuando la
+# matriz limpia tiene al menos N_MIN_DISPERSO países y una densidad de flujos no nulos
+# <= UMBRAL_DENSIDAD_DISPERSA. Los productos que se rellenan por encima de
+# UMBRAL_RELLENO pasan a densos (el producto disperso ya no compensa)
+UMBRAL_DENSIDAD_DISPERSA = 0.05
+N_MIN_DISPERSO = 64
+UMBRAL_RELLENO = 0.1
+# Ruta por defecto de calculate_all_dependencies_matrix ("auto", "densa" o "dispersa").
+# No forma parte de la huella de las industrias: ambas rutas dan las mismas dependencias
+MODO_MATRICIAL = "auto"
+
+# Código del motor: forma parte de la huella de cada industria (clave_industria), así que
+# un cambio en estos ficheros invalida los resultados guardados
+FICHEROS_MOTOR = (Path(__file__).resolve(), Path(__file__).resolve().with_name("path_search.py"))
+
+# Dependencia total de todas las longitudes (dependencia_total_ilimitada): los importadores
+# se resuelven por lotes cuya pila de inversas ocupa como mucho MB_LOTE_ILIMITADA. Un
+# sistema con condición (norma 1) > CONDICION_MAX_ILIMITADA se trata como singular (un
+# grupo de países que solo se compran entre sí, sin fuga) y se resuelve amortiguado con
+# 1 - AMORTIGUACION_SINGULAR
+MB_LOTE_ILIMITADA = 256
+CONDICION_MAX_ILIMITADA = 1e10
+AMORTIGUACION_SINGULAR = 1e-6
+
+
+def eliminar_filas_columnas_cero(df, threshold_pct: float = 0.005, country_names=None):
+    """
+    Filtra una matriz aplicando umbral relativo por país importador (columna).
+
+    Acepta un DataFrame o directamente una vista numpy n×n del tensor de comercio
+    (trade_tensor.crear_tensor_comercio); en ese caso country_names da las etiquetas.
+    """
+    if isinstance(df, np.ndarray):
+        df = pd.DataFrame(df, index=country_names, columns=country_names, copy=False)
+
+    # Umbral por columna: total_col * pct
+    col_totals = df.sum(axis=0)
+    thresholds = col_totals * float(threshold_pct)
+
+    # Aplicar máscara vectorizada (alineación por columnas)
+    df_filtered = df.where(df >= thresholds, 0.0)
+
+    # Países con filas y columnas a cero tras umbral
+    zero_rows = df_filtered.index[df_filtered.sum(axis=1) == 0.0]
+    zero_cols = df_filtered.columns[df_filtered.sum(axis=0) == 0.0]
+    to_drop = list(set(zero_rows) & set(zero_cols))
+
+    return df_filtered.drop(index=to_drop, columns=to_drop)
+
+
+def calculate_path_dependency(X_clean, path, denominators):
+    """Calcula la dependencia de un camino específico."""
+    fuerza_camino = 1.0
+    for k in range(len(path) - 1):
+        if denominators[path[k+1]] > 0:
+            fuerza_camino *= X_clean[path[k], path[k+1]] / denominators[path[k+1]]
+        else:
+            fuerza_camino = 0  # Si el denominador es cero, la fuerza del camino es cero
+    return fuerza_camino
+
+# Pesos del score de intermediarios/hubs (frecuencia y fuerza normalizadas por su máximo)
+PESO_FRECUENCIA = 0.4
+PESO_FUERZA = 0.6
+
+
+def calculate_intermediary_centrality(intermediary_frequency, intermediary_strength, country_names):
+    """
+    Calcula métricas de centralidad para intermediarios.
+    
+    Misma salida que la versión original (tuplas (país, frecuencia, fuerza, score)
+    ordenadas por score descendente, empates en el orden de country_names), con la
+    normalización y el score calculados sobre arrays.
+    """
+    if not country_names:
+        return []
+    frecuencia = np.array([intermediary_frequency[c] for c in country_names])
+    fuerza = np.array([intermediary_strength[c] for c in country_names], dtype=np.float64)
+
+    # Normalizar
+    max_freq = max(intermediary_frequency.values()) if intermediary_frequency.values() else 1
+    max_strength = max(intermediary_strength.values()) if intermediary_strength.values() else 1
+    norm_freq = frecuencia / max_freq if max_freq > 0 else np.zeros(len(frecuencia))
+    norm_strength = fuerza / max_strength if max_strength > 0 else np.zeros(len(fuerza))
+    combined_score = PESO_FRECUENCIA * norm_freq + PESO_FUERZA * norm_strength
+
+    orden = np.argsort(-combined_score, kind="stable")
+    return [(country_names[k], intermediary_frequency[country_names[k]],
+             intermediary_strength[country_names[k]], float(combined_score[k])) for k in orden]
+
+
+def acumular_intermediarios(caminos, country_names):
+    """
+    Frecuencia y fuerza de cada país como intermediario en una lista de caminos
+    ({'intermediarios': [...], 'fuerza': f}): cada aparición suma 1 a la frecuencia y
+    fuerza · 1/(posición+1) a la fuerza.
+
+    Los caminos se aplanan a arrays (país, posición, fuerza) en el orden camino a
+    camino y se suman con un único bincount, que acumula en ese mismo orden: el
+    resultado es idéntico, bit a bit, al del bucle anidado por camino e intermediario.
+
+    Returns:
+    --------
+    tuple
+        (frecuencia int64, fuerza float64), arrays en el orden de country_names
+    """
+    n = len(country_names)
+    posicion_pais = {c: k for k, c in enumerate(country_names)}
+    longitudes = np.fromiter((len(p['intermediarios']) for p in caminos), dtype=np.int64, count=len(caminos))
+    total = int(longitudes.sum())
+    if total == 0:
+        return np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.float64)
+    paises = np.fromiter((posicion_pais[c] for p in caminos for c in p['intermediarios']),
+                         dtype=np.int64, count=total)
+    fuerza = np.repeat(np.fromiter((p['fuerza'] for p in caminos), dtype=np.float64, count=len(caminos)),
+                       longitudes)
+    posiciones = np.arange(total) - np.repeat(np.cumsum(longitudes) - longitudes, longitudes)
+    frecuencia = np.bincount(paises, minlength=n)
+    fuerza_total = np.bincount(paises, weights=fuerza * (1.0 / (posiciones + 1)), minlength=n)
+    return frecuencia, fuerza_total
+
+
+def process_country_pair(i, j, X_clean, denominators, country_names,
+                         max_possible_length, convergence_threshold,
+                         path_strength_threshold, T):
+    """
+    Exactamente la misma definición que antes (combinations), pero:
+    - Usa T (matriz de transición) precalculada.
+    - Vectoriza la longitud 2.
+    - Mantiene mismos retornos y campos.
+    """
+    n = X_clean.shape[0]
+
+    # Dependencia directa (igual que antes)
+    trade_value = X_clean[j, i]
+    direct_dependency = (X_clean[j, i] / denominators[i]) if denominators[i] > 0 else 0.0
+
+    dependencies_by_length = {1: direct_dependency}
+    significant_paths = []
+    current_total = direct_dependency
+    indirect_total = 0.0
+    length = 1
+
+    # Candidatos de intermediarios (igual que antes)
+    middle = [k for k in range(n) if k != i and k != j]
+
+    # ---- L = 2 (vectorizado, EXACTO) ----
+    if max_possible_length >= 2 and middle:
+        row_j = T[j, :]
+        col_i = T[:, i]
+        mask = np.ones(n, dtype=bool)
+        mask[[i, j]] = False
+
+        # suma exacta: sum_k T[j,k]*T[k,i], k!=i,j
+        di2 = np.dot(row_j[mask], col_i[mask])
+        dependencies_by_length[2] = float(di2)
+        indirect_total += float(di2)
+        current_total = direct_dependency + indirect_total
+        length = 2
+
+        # caminos significativos para L=2 (mismo umbral)
+        if path_strength_threshold > 0:
+            ks = np.nonzero(row_j * col_i > path_strength_threshold)[0]
+            ks = [k for k in ks if k != i and k != j]
+            if ks:
+                for k in ks:
+                    significant_paths.append({
+                        'exportador': country_names[j],
+                        'importador': country_names[i],
+                        'intermediarios': [country_names[k]],
+                        'fuerza': float(row_j[k] * col_i[k]),
+                        'longitud': 2
+                    })
+
+        # criterio de convergencia
+        if abs(current_total - direct_dependency) < convergence_threshold or max_possible_length == 2:
+            # ordenar y devolver
+            significant_paths.sort(key=lambda x: x['fuerza'], reverse=True)
+            pair_key = f"{country_names[j]}->{country_names[i]}"
+            result = {
+                'importador': country_names[i],
+                'exportador': country_names[j],
+                'trade_value': trade_value,
+                'dependencia_directa': direct_dependency,
+                'dependencia_indirecta': indirect_total,
+                'dependencia_total': direct_dependency + indirect_total,
+                'longitud_optima': 2,
+                'dependencias_por_longitud': dependencies_by_length
+            }
+            return {
+                'pair_key': pair_key,
+                'result': result,
+                'top_dependency': (country_names[i], country_names[j],
+                                   direct_dependency, indirect_total,
+                                   direct_dependency + indirect_total, 2),
+                'significant_paths': significant_paths,
+                'length_converged': 2
+            }
+
+    # ---- L >= 3 (exacto con combinations, pero usando T) ----
+    for L in range(3, max_possible_length + 1):
+        DI_ij_L = 0.0
+        for interms in combinations(middle, L - 1):
+            path = (j,) + interms + (i,)
+            # producto exacto de T a lo largo del camino
+            prod = 1.0
+            for a, b in zip(path[:-1], path[1:]):
+                w = T[a, b]
+                if w == 0.0:
+                    prod = 0.0
+                    break
+                prod *= w
+
+            DI_ij_L += prod
+
+            if prod > path_strength_threshold:
+                significant_paths.append({
+                    'exportador': country_names[j],
+                    'importador': country_names[i],
+                    'intermediarios': [country_names[x] for x in interms],
+                    'fuerza': float(prod),
+                    'longitud': L
+                })
+
+        dependencies_by_length[L] = float(DI_ij_L)
+        indirect_total += float(DI_ij_L)
+
+        prev_total = current_total
+        current_total = direct_dependency + indirect_total
+        length = L
+
+        if L > 1 and abs(current_total - prev_total) < convergence_threshold:
+            break
+
+    # Final
+    significant_paths.sort(key=lambda x: x['fuerza'], reverse=True)
+    total_dependency = direct_dependency + indirect_total
+    pair_key = f"{country_names[j]}->{country_names[i]}"
+    result = {
+        'importador': country_names[i],
+        'exportador': country_names[j],
+        'trade_value': trade_value,
+        'dependencia_directa': direct_dependency,
+        'dependencia_indirecta': indirect_total,
+        'dependencia_total': total_dependency,
+        'longitud_optima': length,
+        'dependencias_por_longitud': dependencies_by_length
+    }
+    return {
+        'pair_key': pair_key,
+        'result': result,
+        'top_dependency': (country_names[i], country_names[j],
+                           direct_dependency, indirect_total, total_dependency, length),
+        'significant_paths': significant_paths,
+        'length_converged': length if length > 1 else 0
+    }
+
+
+
+
+def calculate_all_dependencies_parallel(X, country_names=None, convergence_threshold=0.01, 
+                                       max_possible_length=3, 
+                                       path_strength_threshold=0.001, n_jobs=None, use_gpu=True, 
+                                       debug_mode=False, chunk_size=None, instrumentacion=None):
+    """
+    Versión paralelizada del cálculo de dependencias que mantiene EXACTAMENTE
+    la misma salida que la versión original.
+    
+    El parámetro debug_mode permite verificar que el número de dependencias
+    coincida con la versión original.
+    """
+    """
+    Versión paralelizada del cálculo de dependencias.
+    
+    Parameters adicionales:
+    -----------------------
+    n_jobs : int, opcional
+        Número de trabajos paralelos. Si es None, usa todos los núcleos disponibles.
+    use_gpu : bool, default=True
+        Si se debe intentar usar GPU para acelerar algunos cálculos.
+    chunk_size : int, opcional
+        Importadores por tarea. Si es None, ~4 tareas por núcleo.
+    instrumentacion : instrumentacion.Instrumentacion, opcional
+        Registra las etapas preparacion / pares / consolidacion del motor por pares
+    """
+    n = X.shape[0]
+
+    if country_names is None:
+        country_names = [f"País {i}" for i in range(n)]
+
+    if len(country_names) != n:
+        raise ValueError(f"La longitud de country_names ({len(country_names)}) no coincide con la dimensión de X ({n})")
+
+    # Configurar paralelización
+    if n_jobs is None:
+        n_jobs = multiprocessing.cpu_count()
+    
+    # Verificar disponibilidad de GPU
+    gpu_available = torch is not None and torch.cuda.is_available() and use_gpu
+    X_clean = X
+
+    with etapa(instrumentacion, "motor_pares.preparacion", paises=n):
+        denom = X_clean.sum(axis=0, dtype=np.float64)
+        denom[denom == 0.0] = np.inf
+        T = (X_clean / denom).astype(np.float64, copy=False)
+
+        denominators = np.sum(X, axis=0)
+
+    # Acelerar cálculos directos con GPU si está disponible
+    if gpu_available:
+        # Transferir datos a GPU
+        X_gpu = torch.tensor(X_clean, device='cuda', dtype=torch.float32)
+        denom_gpu = torch.tensor(denominators, device='cuda', dtype=torch.float32)
+        
+        # Calcular dependencias directas en forma vectorizada (columnas sin importaciones → 0)
+        direct_deps = torch.where(denom_gpu > 0, X_gpu / denom_gpu, torch.zeros_like(X_gpu))
+        
+        # Transferir resultados de vuelta a CPU
+        direct_dependencies = direct_deps.cpu().numpy()
+        
+        # Usar estas dependencias directas precalculadas en el procesamiento posterior
+        # (Aunque en esta implementación seguimos calculándolas en process_country_pair para
+        # mantener cambios mínimos en el código)
+
+    # Mantenemos la misma estructura de iteración del código original:
+    # primero por importador (i) y luego por exportador (j). Cada tarea recibe un
+    # bloque de importadores completos en lugar de un único par.
+    n_jobs = max(1, min(n_jobs, n))
+    if chunk_size is None:
+        chunk_size = max(1, -(-n // (n_jobs * 4)))
+    bloques = [list(range(start, min(start + chunk_size, n))) for start in range(0, n, chunk_size)]
+    parametros = (country_names, max_possible_length, convergence_threshold, path_strength_threshold)
+
+    with etapa(instrumentacion, "motor_pares.pares", paises=n, n_jobs=n_jobs, bloques=len(bloques)) as registro:
+        pair_results = _pares_por_bloques(bloques, X_clean, denom, T, parametros, n_jobs)
+        registro["pares"] = len(pair_results)
+        registro["caminos"] = sum(len(res['significant_paths']) for res in pair_results)
+        registro["longitud_media"] = float(np.mean([res['result']['longitud_optima'] for res in pair_results])) \
+            if pair_results else None
+
+    with etapa(instrumentacion, "motor_pares.consolidacion", paises=n):
+        return consolidar_resultados(pair_results, country_names, max_possible_length)
+
+
+def _pares_por_bloques(bloques, X_clean, denom, T, parametros, n_jobs):
+    """process_country_pair para todos los bloques de importadores, en uno o varios procesos."""
+    if n_jobs == 1:
+        pair_results = []
+        for bloque in bloques:
+            pair_results.extend(_procesar_bloque_importadores(bloque, (X_clean, denom, T), parametros))
+    else:
+        # X, denom y T se escriben una sola vez en disco y los workers los abren como
+        # memmap de solo lectura: las tareas solo serializan rutas y listas de índices
+        with tempfile.TemporaryDirectory(prefix="ise_motor_") as tmp:
+            rutas = []
+            for nombre, arr in (("X", X_clean), ("denom", denom), ("T", T)):
+                ruta = str(Path(tmp) / f"{nombre}.npy")
+                np.save(ruta, np.ascontiguousarray(arr))
+                rutas.append(ruta)
+
+            with Parallel(n_jobs=n_jobs) as parallel:
+                bloques_res = parallel(
+                    delayed(_procesar_bloque_importadores)(bloque, tuple(rutas), parametros)
+                    for bloque in bloques
+                )
+            pair_results = [res for bloque_res in bloques_res for res in bloque_res]
+    return pair_results
+
+
+def _abrir_matrices(matrices):
+    """Devuelve (X, denom, T): arrays en memoria o memmaps abiertos desde rutas .npy."""
+    if isinstance(matrices[0], str):
+        # np.asarray: vista ndarray sobre el memmap (evita el coste de la subclase al indexar)
+        return tuple(np.asarray(np.load(ruta, mmap_mode="r")) for ruta in matrices)
+    return matrices
+
+
+def _procesar_bloque_importadores(importadores, matrices, parametros):
+    """Ejecuta process_country_pair para todos los exportadores de un bloque de importadores."""
+    X_clean, denom, T = _abrir_matrices(matrices)
+    country_names, max_possible_length, convergence_threshold, path_strength_threshold = parametros
+    n = X_clean.shape[0]
+    return [
+        process_country_pair(i, j, X_clean, denom, country_names,
+                             max_possible_length, convergence_threshold,
+                             path_strength_threshold, T)
+        for i in importadores for j in range(n) if i != j
+    ]
+
+
+def consolidar_resultados(pair_results, country_names, max_possible_length):
+    """
+    Agrega los resultados por par (salida de process_country_pair o del motor
+    matricial) en la estructura de resultados por industria.
+
+    Parameters:
+    -----------
+    pair_results : iterable de dict
+        Un dict por par (i, j) con las claves 'pair_key', 'result',
+        'top_dependency', 'significant_paths' y 'length_converged'
+    country_names : list
+        Nombres de los países en el orden de la matriz
+    max_possible_length : int
+        Longitud máxima de caminos (dimensiona length_distribution)
+
+    Returns:
+    --------
+    dict
+        Estructura 'results' que consumen ise_architect.py y el resto del notebook
+    """
+    n = len(country_names)
+
+    # Estructura de resultados extendida
+    results = {
+        'dependencies': [],
+        'top_dependencies': [],
+        'avg_dependencies': {},
+        'length_distribution': np.zeros(max_possible_length),
+        'critical_intermediaries': {},     # Intermediarios críticos por relación
+        'intermediary_frequency': {},      # Frecuencia de países como intermediarios
+        'critical_paths': [],              # Rutas críticas completas
+        'intermediary_strength': {}        # Fuerza de cada país como intermediario
+    }
+    
+    # Agrupar resultados por país importador
+    results_by_importer = {}
+    for res in pair_results:
+        importer = res['result']['importador']
+        if importer not in results_by_importer:
+            results_by_importer[importer] = []
+        results_by_importer[importer].append(res)
+    
+    # Recolectar critical paths de todos los pares para ordenarlos después
+    all_critical_paths = []
+    
+    # Procesar los resultados manteniendo el mismo orden que el código original
+    for i in range(n):
+        importer = country_names[i]
+        total_dep = 0.0
+        num_deps = 0
+        
+        if importer in results_by_importer:
+            for res in results_by_importer[importer]:
+                # Agregar a dependencies
+                results['dependencies'].append(res['result'])
+                
+                # Agregar a top_dependencies
+                results['top_dependencies'].append(res['top_dependency'])
+                
+                # Actualizar critical_intermediaries
+                results['critical_intermediaries'][res['pair_key']] = res['significant_paths']
+                
+                # Recolectar critical paths
+                all_critical_paths.extend(res['significant_paths'])
+                
+                # Actualizar length_distribution si convergió
+                if res['length_converged'] > 1:
+                    results['length_distribution'][res['length_converged'] - 1] += 1
+                
+                # Actualizar dependencia promedio
+                total_dep += res['result']['dependencia_total']
+                num_deps += 1
+        
+        # Guardar dependencia promedio para este importador
+        results['avg_dependencies'][importer] = total_dep / num_deps if num_deps > 0 else 0
+    
+    # Estadísticas de intermediarios: todos los caminos significativos a la vez, en el
+    # orden en que se recogieron (antes de ordenarlos por fuerza)
+    frecuencia, fuerza = acumular_intermediarios(all_critical_paths, country_names)
+    results['intermediary_frequency'] = dict(zip(country_names, frecuencia.tolist()))
+    results['intermediary_strength'] = dict(zip(country_names, fuerza.tolist()))
+
+    # Añadir y ordenar los critical paths (igual que el original)
+    results['critical_paths'] = all_critical_paths
+    
+    # Ordenar top dependencies
+    results['top_dependencies'].sort(key=lambda x: x[4], reverse=True)
+    results['top_dependencies'] = results['top_dependencies'][:90]
+    
+    # Ordenar critical_paths por fuerza
+    results['critical_paths'].sort(key=lambda x: x['fuerza'], reverse=True)
+    
+    # Calcular métricas de centralidad para intermediarios
+    results['intermediary_centrality'] = calculate_intermediary_centrality(
+        results['intermediary_frequency'], 
+        results['intermediary_strength'],
+        country_names
+    )
+    
+    return results
+
+
+# ============================================================
+# MOTOR MATRICIAL (todos los pares de una industria a la vez)
+# ============================================================
+
+def calcular_dependencias_por_longitud(T, max_possible_length=3):
+    """
+    Calcula la dependencia indirecta de cada longitud para TODOS los pares a la vez.
+
+    Reproduce exactamente la definición de process_country_pair: para L >= 3 los
+    intermediarios son combinations(middle, L-1), es decir, cadenas de países
+    distintos de i y j en orden creciente de índice. Un orden estrictamente creciente
+    equivale a multiplicar por la parte triangular superior estricta de T, de modo
+    que la suma sobre todas las combinaciones es un producto de matrices. Las cadenas
+    que pasan por el propio importador o exportador se descuentan por
+    inclusión-exclusión (cada uno puede aparecer como mucho una vez).
+
+    Parameters:
+    -----------
+    T : numpy.ndarray o scipy.sparse
+        Matriz de transición (n×n), T[a, b] = X[a, b] / importaciones_totales[b]. Si es
+        dispersa, los productos se calculan con scipy.sparse (productos_transicion_dispersa)
+    max_possible_length : int
+        Longitud máxima de caminos a calcular
+
+    Returns:
+    --------
+    dict
+        {L: numpy.ndarray (n×n)} con DI_L[j, i] = dependencia indirecta de longitud L
+        del importador i respecto al exportador j, para L = 2..max_possible_length
+    """
+    max_m = max_possible_length - 1  # número máximo de intermediarios
+    if max_m < 1:
+        return {}
+    if sp is not None and sp.issparse(T):
+        return combinar_productos(productos_transicion_dispersa(T, max_m), max_m)
+    return combinar_productos(productos_transicion(T, max_m), max_m)
+
+
+def productos_transicion(T, max_m):
+    """
+    Productos de matrices de los que se obtienen las dependencias por longitud
+    (la parte O(n³) del motor matricial). escenarios.py los actualiza con
+    correcciones de bajo rango cuando solo cambian algunas columnas de T.
+
+    T puede ser una pila (..., n, n) de transiciones del mismo tamaño (p. ej. los años
+    de una industria en panel.py): los productos se hacen por lotes sobre los dos
+    últimos ejes.
+
+    Returns:
+    --------
+    dict
+        'D': T sin diagonal, 'P': [U^s], 'DP': [D U^s], 'PD': [U^s D] para
+        s = 0..max_m-1, y 'cadenas': [D U^(m-1) D] para m = 1..max_m
+    """
+    T = np.asarray(T, dtype=np.float64)
+    n = T.shape[-1]
+
+    # D: T sin diagonal (el primer intermediario ≠ j y el último ≠ i)
+    D = T.copy()
+    _anular_diagonal(D)
+    # U: saltos entre intermediarios en orden creciente de índice
+    U = np.triu(D, k=1)
+
+    # Potencias de U, y productos con D por la izquierda / derecha
+    P = [np.eye(n)]
+    for _ in range(max_m - 1):
+        P.append(P[-1] @ U)
+    DP = [D @ P_s for P_s in P]   # DP[s][j, x]: j → a1 → ... (s saltos en U) → x
+    PD = [P_s @ D for P_s in P]   # PD[s][x, i]: x → ... (s saltos en U) → i
+    cadenas = [DP[m - 1] @ D for m in range(1, max_m + 1)]
+    return {'D': D, 'P': P, 'DP': DP, 'PD': PD, 'cadenas': cadenas}
+
+
+def _anular_diagonal(M):
+    """Pone a cero la diagonal de M o de cada matriz de una pila (..., n, n)."""
+    idx = np.arange(M.shape[-1])
+    M[..., idx, idx] = 0.0
+
+
+def _compactar(M):
+    """Producto disperso que se ha rellenado por encima de UMBRAL_RELLENO → denso."""
+    if sp is not None and sp.issparse(M) and M.nnz > UMBRAL_RELLENO * M.shape[0] * M.shape[1]:
+        return M.toarray()
+    return M
+
+
+def _denso(M):
+    return M.toarray() if sp is not None and sp.issparse(M) else M
+
+
+def productos_transicion_dispersa(T, max_m):
+    """
+    productos_transicion con T en formato disperso: D y U son CSR y los productos solo
+    recorren los flujos no nulos (las filas y columnas vacías no cuestan nada). Cada
+    producto que se rellena por encima de UMBRAL_RELLENO sigue en denso. Se devuelven
+    densos, como productos_transicion, para la inclusión-exclusión (O(n²) por término).
+    """
+    T = sp.csr_matrix(T, dtype=np.float64)
+    n = T.shape[0]
+
+    # D: T sin diagonal; U: su parte triangular superior estricta
+    coo = T.tocoo()
+    fuera = coo.row != coo.col
+    D = sp.csr_matrix((coo.data[fuera], (coo.row[fuera], coo.col[fuera])), shape=(n, n))
+    U = sp.triu(D, k=1, format="csr")
+
+    P = [sp.identity(n, dtype=np.float64, format="csr")]
+    for _ in range(max_m - 1):
+        P.append(_compactar(P[-1] @ U))
+    DP = [_compactar(D @ P_s) for P_s in P]
+    PD = [_compactar(P_s @ D) for P_s in P]
+    cadenas = [_denso(DP[m - 1] @ D) for m in range(1, max_m + 1)]
+    return {
+        'D': _denso(D), 'P': [_denso(M) for M in P], 'DP': [_denso(M) for M in DP],
+        'PD': [_denso(M) for M in PD], 'cadenas': cadenas,
+    }
+
+
+def transicion_dispersa(X, denom):
+    """T = X / denom en CSR (mismas divisiones elemento a elemento que la ruta densa)."""
+    T = sp.csr_matrix(X)
+    T.sort_indices()
+    T.data = T.data / denom[T.indices]
+    return T
+
+
+def elegir_ruta_matricial(X, modo="auto"):
+    """
+    Ruta del motor matricial para una matriz limpia.
+
+    Parameters:
+    -----------
+    modo : str
+        "auto" (según tamaño y densidad), "densa" o "dispersa"
+
+    Returns:
+    --------
+    tuple
+        ("densa" | "dispersa", densidad de flujos no nulos)
+    """
+    n = X.shape[0]
+    densidad = float(np.count_nonzero(X)) / (n * n) if n else 0.0
+    if modo == "auto":
+        dispersa = sp is not None and n >= N_MIN_DISPERSO and densidad <= UMBRAL_DENSIDAD_DISPERSA
+        return ("dispersa" if dispersa else "densa"), densidad
+    if modo not in ("densa", "dispersa"):
+        raise ValueError(f"❌ modo debe ser 'auto', 'densa' o 'dispersa'. Recibido: {modo}")
+    if modo == "dispersa" and sp is None:
+        raise ImportError("❌ La ruta dispersa necesita scipy (pip install scipy)")
+    return modo, densidad
+
+
+def combinar_productos(productos, max_m):
+    """
+    Dependencia indirecta por longitud a partir de productos_transicion: descuenta
+    por inclusión-exclusión las cadenas que pasan por el importador o el exportador
+    (solo operaciones elemento a elemento, O(n²) por término).
+    """
+    P, DP, PD = productos['P'], productos['DP'], productos['PD']
+
+    # Cadenas cerradas: el exportador reaparece como intermediario (R) o el
+    # importador aparece como intermediario antes de cerrar la cadena (Q)
+    R = [np.diagonal(DP_s, axis1=-2, axis2=-1)[..., :, None] for DP_s in DP]  # R[s][j] = (D U^s)[j, j]
+    Q = [np.diagonal(PD_s, axis1=-2, axis2=-1)[..., None, :] for PD_s in PD]  # Q[s][i] = (U^s D)[i, i]
+
+    dependencias = {}
+    for m in range(1, max_m + 1):
+        L = m + 1
+        total = productos['cadenas'][m - 1].copy()
+
+        if m >= 2:
+            # j en la posición p (2..m) de la cadena de intermediarios
+            for p in range(2, m + 1):
+                total -= R[p - 1] * PD[m - p]
+            # i en la posición q (1..m-1)
+            for q in range(1, m):
+                total -= DP[q - 1] * Q[m - q]
+            # i y j a la vez (se han restado dos veces)
+            for p in range(2, m + 1):
+                for q in range(p + 1, m):
+                    total += R[p - 1] * P[q - p] * Q[m - q]
+            for q in range(1, m):
+                for p in range(q + 1, m + 1):
+                    total += DP[q - 1] * np.swapaxes(P[p - q], -1, -2) * PD[m - p]
+
+        _anular_diagonal(total)
+        # Errores de redondeo de la inclusión-exclusión en pares sin caminos
+        np.maximum(total, 0.0, out=total)
+        dependencias[L] = total
+
+    return dependencias
+
+
+def calcular_longitudes_convergencia(direct, dependencias, max_possible_length=3,
+                                     convergence_threshold=0.01):
+    """
+    Aplica el criterio de convergencia de process_country_pair a todos los pares
+    (elemento a elemento, así que también vale para pilas (..., n, n)).
+
+    Returns:
+    --------
+    tuple
+        (indirecta, longitud): matrices n×n con la dependencia indirecta acumulada
+        hasta la longitud de convergencia y dicha longitud para cada par
+    """
+    indirect = np.zeros(direct.shape, dtype=np.float64)
+    length = np.ones(direct.shape, dtype=np.int64)
+
+    if max_possible_length < 2:
+        return indirect, length
+
+    # L = 2: mismas operaciones en coma flotante que el motor por pares
+    indirect = indirect + dependencias[2]
+    current = direct + indirect
+    length[:] = 2
+    active = ~((np.abs(current - direct) < convergence_threshold) | (max_possible_length == 2))
+
+    for L in range(3, max_possible_length + 1):
+        if not active.any():
+            break
+        new_indirect = indirect + dependencias[L]
+        new_current = direct + new_indirect
+        converged = np.abs(new_current - current) < convergence_threshold
+        indirect = np.where(active, new_indirect, indirect)
+        current = np.where(active, new_current, current)
+        length[active] = L
+        active &= ~converged
+
+    return indirect, length
+
+
+def _inversas_sin_importador(D, importadores, amortiguacion):
+    """
+    N_i = (I - α D_i)^-1 para cada importador i del lote, con D_i = D sin la fila ni la
+    columna de i (pila (b, n, n)), y la condición en norma 1 de cada sistema (inf si es
+    exactamente singular).
+    """
+    b, n = len(importadores), D.shape[0]
+    k = np.arange(b)
+    B = np.broadcast_to(-amortiguacion * D, (b, n, n)).copy()
+    B[k, importadores, :] = 0.0
+    B[k, :, importadores] = 0.0
+    idx = np.arange(n)
+    B[:, idx, idx] += 1.0
+    try:
+        N = np.linalg.inv(B)
+    except np.linalg.LinAlgError:
+        # Algún sistema del lote es singular: uno a uno, los singulares quedan a inf
+        N = np.full(B.shape, np.inf)
+        for m in range(b):
+            try:
+                N[m] = np.linalg.inv(B[m])
+            except np.linalg.LinAlgError:
+                pass
+    with np.errstate(invalid="ignore"):
+        condicion = np.abs(B).sum(axis=1).max(axis=-1) * np.abs(N).sum(axis=1).max(axis=-1)
+    return N, np.where(np.isnan(condicion), np.inf, condicion)
+
+
+def dependencia_total_ilimitada(T, amortiguacion=1.0, mb_lote=MB_LOTE_ILIMITADA):
+    """
+    Dependencia total de todas las longitudes (tipo Leontief) para TODOS los pares, sin
+    el corte de max_possible_length.
+
+    Suma los caminos de j a i de cualquier longitud cuyos intermediarios son distintos
+    de i y de j (entre sí pueden repetirse y aparecer en cualquier orden, como en la
+    inversa de Leontief). Es la probabilidad de que, remontando proveedores desde i con
+    las cuotas de T, se llegue a j antes de volver a i, así que está entre 0 y 1 y nunca
+    es menor que la dependencia total truncada (que solo cuenta cadenas de países
+    distintos en orden creciente hasta max_possible_length).
+
+    Para cada importador i, con D = T sin diagonal y D_i = D sin la fila ni la columna
+    de i, N_i = (I - α D_i)^-1 = Σ_k (α D_i)^k suma los caminos que no pasan por i.
+    Partiendo cada camino de j a i por su última visita a j:
+
+        total[j, i] = (N_i · D[:, i])[j] / N_i[j, j]
+
+    Las inversas se calculan por lotes de importadores sobre una pila (b, n, n), O(n⁴)
+    por industria. La serie converge porque cada país pierde en cada salto la cuota de
+    su comercio doméstico y de lo que compra a i; con α < 1 los caminos de k o más
+    intermediarios suman además como mucho α^k.
+
+    Parameters:
+    -----------
+    T : numpy.ndarray o scipy.sparse
+        Matriz de transición (n×n), T[a, b] = X[a, b] / importaciones_totales[b]
+    amortiguacion : float, default=1.0
+        α: peso de cada intermediario adicional (1.0 = Leontief sin amortiguar)
+    mb_lote : float
+        Memoria máxima de cada lote de inversas
+
+    Returns:
+    --------
+    tuple
+        (total, info): total[j, i] incluye la dependencia directa (diagonal a cero);
+        info con 'condicion' (máxima de los sistemas resueltos) y 'amortiguados'
+        (importadores con sistema singular, resueltos con 1 - AMORTIGUACION_SINGULAR)
+    """
+    if not 0.0 < amortiguacion <= 1.0:
+        raise ValueError(f"❌ amortiguacion debe estar en (0, 1]. Recibido: {amortiguacion}")
+    D = np.array(_denso(T), dtype=np.float64)
+    _anular_diagonal(D)
+    n = D.shape[0]
+    total = np.zeros((n, n), dtype=np.float64)
+    amortiguados, condicion = [], 0.0
+    lote = max(1, int(mb_lote * 2**20 // (2 * 8 * n * n))) if n else 1
+
+    for inicio in range(0, n, lote):
+        importadores = np.arange(inicio, min(n, inicio + lote))
+        N, cond = _inversas_sin_importador(D, importadores, amortiguacion)
+        singulares = cond > CONDICION_MAX_ILIMITADA
+        if singulares.any():
+            alfa = min(amortiguacion, 1.0 - AMORTIGUACION_SINGULAR)
+            N[singulares], cond[singulares] = _inversas_sin_importador(D, importadores[singulares], alfa)
+            amortiguados.extend(importadores[singulares].tolist())
+        condicion = max(condicion, float(cond.max()))
+        # caminos[k, j]: caminos de j al importador k que no pasan por él
+        caminos = (N @ D[:, importadores].T[:, :, None])[:, :, 0]
+        total[:, importadores] = (caminos / np.diagonal(N, axis1=1, axis2=2)).T
+
+    _anular_diagonal(total)
+    # Errores de redondeo en pares sin caminos
+    np.maximum(total, 0.0, out=total)
+    return total, {'condicion': condicion, 'amortiguados': amortiguados}
+
+
+def calculate_all_dependencies_matrix(X, country_names=None, convergence_threshold=0.01,
+                                      max_possible_length=3, path_strength_threshold=0.001,
+                                      top_k_paths=3, modo=None):
+    """
+    Motor matricial: mismas dependencias y caminos que calculate_all_dependencies_parallel,
+    pero calculando dependencias_por_longitud de todos los pares con productos de matrices
+    y obteniendo los caminos con la búsqueda best-first de path_search.
+
+    Parameters adicionales:
+    -----------------------
+    top_k_paths : int, default=3
+        Rutas más fuertes que se guardan por par en results['best_paths'], aunque
+        queden por debajo de path_strength_threshold
+    modo : str, opcional
+        "auto", "densa" o "dispersa" (elegir_ruta_matricial). Por defecto MODO_MATRICIAL
+
+    Returns:
+    --------
+    dict
+        Misma estructura de resultados que calculate_all_dependencies_parallel, más
+        'best_paths': {'EXP->IMP': [path_dict, ...]} con las top_k_paths rutas del par
+    """
+    if path_strength_threshold < 0:
+        raise ValueError("❌ path_strength_threshold debe ser >= 0 en el motor matricial")
+
+    n = X.shape[0]
+
+    if country_names is None:
+        country_names = [f"País {i}" for i in range(n)]
+
+    if len(country_names) != n:
+        raise ValueError(f"La longitud de country_names ({len(country_names)}) no coincide con la dimensión de X ({n})")
+
+    denom = X.sum(axis=0, dtype=np.float64)
+    denom[denom == 0.0] = np.inf
+    T = (X / denom).astype(np.float64, copy=False)
+
+    # Con dos países no hay intermediarios: se delega en la definición por pares
+    if n <= 2:
+        pair_results = [
+            process_country_pair(i, j, X, denom, country_names, max_possible_length,
+                                 convergence_threshold, path_strength_threshold, T)
+            for i in range(n) for j in range(n) if i != j
+        ]
+        return consolidar_resultados(pair_results, country_names, max_possible_length)
+
+    direct = X / denom  # direct[j, i]
+    ruta, _ = elegir_ruta_matricial(X, MODO_MATRICIAL if modo is None else modo)
+    # Ruta dispersa: productos de la transición y vecinos de la búsqueda solo sobre flujos no nulos
+    T_motor = transicion_dispersa(X, denom) if ruta == "dispersa" else T
+    dependencias = calcular_dependencias_por_longitud(T_motor, max_possible_length)
+    indirect, length = calcular_longitudes_convergencia(
+        direct, dependencias, max_possible_length, convergence_threshold
+    )
+
+    # Rutas por exportador: todas las que superan el umbral + las top_k_paths de cada par
+    orden_filas, pesos_filas = vecinos_ordenados(T_motor)
+    caminos = [
+        buscar_caminos_desde(T_motor, j, max_possible_length, path_strength_threshold,
+                             top_k=top_k_paths, longitudes_j=length[j], orden_filas=orden_filas,
+                             pesos_filas=pesos_filas)
+        for j in range(n)
+    ]
+
+    pair_results = []
+    best_paths = {}
+    for i in range(n):
+        for j in range(n):
+            if i == j:
+                continue
+            L_ij = int(length[j, i])
+            direct_dependency = direct[j, i]
+            indirect_total = float(indirect[j, i])
+            total_dependency = direct_dependency + indirect_total
+
+            dependencies_by_length = {1: direct_dependency}
+            for L in range(2, L_ij + 1):
+                dependencies_by_length[L] = float(dependencias[L][j, i])
+
+            rutas = [
+                {
+                    'exportador': country_names[j],
+                    'importador': country_names[i],
+                    'intermediarios': [country_names[x] for x in interms],
+                    'fuerza': fuerza,
+                    'longitud': L
+                }
+                for L, interms, fuerza in caminos[j].get(i, [])
+            ]
+            # Caminos significativos: misma regla que process_country_pair
+            # (en L=2 solo se registran si el umbral es positivo)
+            significant_paths = [
+                r for r in rutas
+                if r['fuerza'] > path_strength_threshold
+                and (r['longitud'] > 2 or path_strength_threshold > 0)
+            ]
+            if rutas and top_k_paths > 0:
+                best_paths[f"{country_names[j]}->{country_names[i]}"] = rutas[:top_k_paths]
+
+            pair_results.append({
+                'pair_key': f"{country_names[j]}->{country_names[i]}",
+                'result': {
+                    'importador': country_names[i],
+                    'exportador': country_names[j],
+                    'trade_value': X[j, i],
+                    'dependencia_directa': direct_dependency,
+                    'dependencia_indirecta': indirect_total,
+                    'dependencia_total': total_dependency,
+                    'longitud_optima': L_ij,
+                    'dependencias_por_longitud': dependencies_by_length
+                },
+                'top_dependency': (country_names[i], country_names[j],
+                                   direct_dependency, indirect_total, total_dependency, L_ij),
+                'significant_paths': significant_paths,
+                'length_converged': L_ij if L_ij > 1 else 0
+            })
+
+    results = consolidar_resultados(pair_results, country_names, max_possible_length)
+    results['best_paths'] = best_paths
+    return results
+
+
+def verificar_motor_matricial(n=7, max_possible_length=4, convergence_threshold=0.01,
+                              path_strength_threshold=0.001, density=0.6, seed=0, rtol=1e-9,
+                              modo="auto"):
+    """
+    Compara calculate_all_dependencies_matrix con el motor por pares (process_country_pair)
+    sobre una matriz aleatoria pequeña (modo="dispersa" contrasta la ruta scipy.sparse).
+
+    Returns:
+    --------
+    dict
+        Resumen de la comparación ('ok', número de pares, diferencia máxima, ...)
+
+    Raises:
+    -------
+    AssertionError
+        Si alguna dependencia, longitud o camino significativo no coincide
+    """
+    rng = np.random.default_rng(seed)
+    X = rng.pareto(1.5, size=(n, n)).astype(np.float32)
+    X[rng.random((n, n)) > density] = 0.0
+    names = [f"C{k:02d}" for k in range(n)]
+
+    ref = calculate_all_dependencies_parallel(
+        X, names, convergence_threshold, max_possible_length, path_strength_threshold,
+        n_jobs=1, use_gpu=False
+    )
+    new = calculate_all_dependencies_matrix(
+        X, names, convergence_threshold, max_possible_length, path_strength_threshold, modo=modo
+    )
+
+    assert len(ref['dependencies']) == len(new['dependencies'])
+    max_diff = 0.0
+    for a, b in zip(ref['dependencies'], new['dependencies']):
+        assert (a['importador'], a['exportador']) == (b['importador'], b['exportador'])
+        assert a['longitud_optima'] == b['longitud_optima'], (a, b)
+        assert a['dependencias_por_longitud'].keys() == b['dependencias_por_longitud'].keys(), (a, b)
+        for L, v in a['dependencias_por_longitud'].items():
+            w = b['dependencias_por_longitud'][L]
+            assert np.isclose(v, w, rtol=rtol, atol=1e-12), (a, b)
+            max_diff = max(max_diff, abs(v - w))
+
+    for key, paths in ref['critical_intermediaries'].items():
+        other = new['critical_intermediaries'][key]
+        assert [(p['intermediarios'], p['longitud']) for p in paths] == \
+               [(p['intermediarios'], p['longitud']) for p in other], key
+        assert all(p['fuerza'] == q['fuerza'] for p, q in zip(paths, other)), key
+
+    return {
+        'ok': True,
+        'pares': len(ref['dependencies']),
+        'caminos': len(ref['critical_paths']),
+        'max_diff': max_diff
+    }
+
+
+# Para mantener compatibilidad, redefinimos la función original
+# para que utilice la versión paralelizada
+def calculate_all_dependencies(X, country_names=None, convergence_threshold=0.01, 
+                              max_possible_length=3, threshold_pct=0.01, 
+                              path_strength_threshold=0.001, engine="matricial",
+                              top_k_paths=3, n_jobs=None):
+    """
+    Calcula todas las dependencias entre países con análisis de intermediarios críticos.
+    
+    Esta función mantiene EXACTAMENTE la misma firma y resultados que la original,
+    pero utiliza internamente paralelización y GPU para acelerar los cálculos.
+    
+    Parameters:
+    -----------
+    X : numpy.ndarray
+        Matriz de comercio
+    country_names : list, opcional
+        Nombres de los países
+    convergence_threshold : float, default=0.01
+        Umbral para determinar la convergencia
+    max_possible_length : int, default=5
+        Longitud máxima de caminos a considerar
+    threshold_pct : float, default=0.01
+        Umbral para filtrar valores de comercio insignificantes (porcentaje)
+    path_strength_threshold : float, default=0.001
+        Umbral mínimo para considerar una ruta como significativa
+    engine : str, default="matricial"
+        "matricial" calcula todos los pares a la vez (calculate_all_dependencies_matrix);
+        "pares" usa el motor original por pares con combinations (referencia)
+    top_k_paths : int, default=3
+        Rutas más fuertes por par guardadas en results['best_paths'] (solo motor matricial)
+    n_jobs : int, opcional
+        Núcleos para el motor por pares. Si es None, min(núcleos, países)
+        
+    Returns:
+    --------
+    dict
+        Diccionario con todos los resultados del análisis
+    """
+    if engine == "matricial":
+        return calculate_all_dependencies_matrix(
+            X, country_names, convergence_threshold,
+            max_possible_length, path_strength_threshold, top_k_paths
+        )
+    if engine != "pares":
+        raise ValueError(f"❌ engine debe ser 'matricial' o 'pares'. Recibido: {engine}")
+
+    # Determinar si usar paralelización basado en el tamaño del problema
+    use_parallel = X.shape[0] > 5  # Para matrices muy pequeñas no vale la pena paralelizar
+    
+    # Verificar disponibilidad de GPU
+    use_gpu = torch is not None and torch.cuda.is_available()
+    
+    # Aquí agregas el segundo log
+    #print(f"Usando paralelización: {use_parallel}, GPU disponible: {use_gpu}")
+    #if use_gpu:
+    #    print(f"GPU en uso: {torch.cuda.get_device_name(0)}")
+    
+    # Configurar número de trabajos para paralelización
+    n_countries = X.shape[0]
+    if n_jobs is None:
+        n_jobs = min(multiprocessing.cpu_count(), n_countries)  # Limitar al número de países
+    
+    
+    if use_parallel:
+        # Usar la versión paralelizada
+        return calculate_all_dependencies_parallel(
+            X, country_names, convergence_threshold, 
+            max_possible_length, path_strength_threshold,
+            n_jobs=n_jobs, use_gpu=use_gpu, debug_mode=False
+        )
+    else:
+        # Para matrices muy pequeñas, usar un solo proceso
+        return calculate_all_dependencies_parallel(
+            X, country_names, convergence_threshold, 
+            max_possible_length, path_strength_threshold,
+            n_jobs=1, use_gpu=use_gpu, debug_mode=False
+        )
+
+
+
+# ============================================================
+# BUCLE DE INDUSTRIAS (secuencial o en varios procesos)
+# ============================================================
+
+def procesar_industria(industry, mat, threshold_pct=0.005, country_names=None, registro=None, **kwargs):
+    """
+    Limpia la matriz de una industria y calcula sus dependencias.
+
+    mat puede ser un DataFrame o una vista numpy del tensor de comercio (con
+    country_names); ninguna de las dos se copia antes de filtrar. Si se pasa registro
+    (dict de instrumentacion.medicion), se anotan en él los tiempos de limpieza y motor.
+
+    Returns:
+    --------
+    tuple
+        (industry, entrada de all_results o None si la matriz limpia es demasiado pequeña)
+    """
+    registro = {} if registro is None else registro
+    t0 = time.perf_counter()
+    mat_clean = eliminar_filas_columnas_cero(mat, threshold_pct=threshold_pct, country_names=country_names)
+    registro["segundos_limpieza"] = round(time.perf_counter() - t0, 4)
+    registro["forma"] = list(mat_clean.shape)
+    if mat_clean.shape[0] < 2:
+        return industry, None
+
+    X = mat_clean.values
+    country_names = mat_clean.columns.tolist()
+    if kwargs.get("engine", "matricial") == "matricial":
+        registro["ruta_motor"], densidad = elegir_ruta_matricial(X)
+    else:
+        registro["ruta_motor"], densidad = "pares", float(np.count_nonzero(X)) / X.size
+    registro["densidad"] = round(densidad, 4)
+    t0 = time.perf_counter()
+    results = calculate_all_dependencies(X, country_names, **kwargs)
+    registro["segundos_motor"] = round(time.perf_counter() - t0, 4)
+    return industry, {
+        'results': results,
+        'country_names': country_names,
+        'matrix_shape': mat_clean.shape
+    }
+
+
+def parametros_motor(threshold_pct=0.005, **kwargs):
+    """
+    Parámetros efectivos con que se calcula una industria: los de
+    calculate_all_dependencies (con sus valores por defecto) más el umbral de limpieza.
+    n_jobs no cambia el resultado y no se incluye.
+    """
+    firma = inspect.signature(calculate_all_dependencies)
+    parametros = {
+        nombre: p.default for nombre, p in firma.parameters.items()
+        if nombre not in ("X", "country_names", "n_jobs")
+    }
+    parametros.update({k: v for k, v in kwargs.items() if k != "n_jobs"})
+    parametros["threshold_pct_limpieza"] = threshold_pct
+    return parametros
+
+
+@lru_cache(maxsize=1)
+def huella_codigo_motor():
+    """sha256 de los ficheros del motor (FICHEROS_MOTOR), calculada una vez por proceso."""
+    return [(huella_fichero(ruta) or {}).get("sha256") for ruta in FICHEROS_MOTOR]
+
+
+def clave_industria(mat, threshold_pct=0.005, country_names=None, **kwargs):
+    """
+    Huella de contenido de una industria: bytes de su matriz de comercio, países,
+    parámetros y código del motor. Si no cambia, sus resultados guardados siguen valiendo.
+    """
+    if country_names is None:
+        etiquetas = list(mat.index) + list(mat.columns)
+        mat = mat.to_numpy()
+    else:
+        etiquetas = list(country_names)
+    return huella_valores({
+        "matriz": huella_matriz(mat, etiquetas),
+        "parametros": parametros_motor(threshold_pct, **kwargs),
+        "codigo": huella_codigo_motor(),
+    })
+
+
+def _procesar_industria_segura(industry, mat, threshold_pct, kwargs):
+    """
+    Versión para workers: devuelve el error como texto en lugar de propagarlo, junto
+    con el registro de instrumentación de la industria (medido en el propio worker).
+    """
+    entrada = error = None
+    try:
+        with medicion(etapa="industria", industria=industry) as registro:
+            _, entrada = procesar_industria(industry, mat, threshold_pct, registro=registro, **kwargs)
+    except Exception as e:
+        error = str(e)
+    if entrada is None and error is None:
+        registro["estado"] = "saltada"
+    elif entrada is not None:
+        registro.update(metricas_resultados(entrada))
+    return industry, entrada, error, registro
+
+
+def calcular_todas_las_industrias(matrices_comercio, n_jobs_industrias=1, threshold_pct=0.005,
+                                  verbose=True, escritor=None, conservar_resultados=True,
+                                  reutilizadas=None, instrumentacion=None, puntos_control=None,
+                                  reintentar=False, **kwargs):
+    """
+    Calcula las dependencias de todas las industrias, opcionalmente en varios procesos.
+
+    Con n_jobs_industrias > 1 cada proceso calcula industrias completas y el motor
+    interno se ejecuta con un solo núcleo (n_jobs=1) para no sobresuscribir la CPU.
+    El orden de all_results es siempre el de matrices_comercio.
+
+    Parameters:
+    -----------
+    matrices_comercio : dict
+        {industria: DataFrame} (salida de crear_matriz_comercio_optimizado, vistas del tensor)
+    n_jobs_industrias : int, default=1
+        Procesos para el bucle de industrias
+    threshold_pct : float, default=0.005
+        Umbral de eliminar_filas_columnas_cero
+    escritor : results_store.EscritorResultados, opcional
+        Si se indica, cada industria se escribe en el almacén columnar en cuanto termina
+    conservar_resultados : bool, default=True
+        False no acumula all_results en memoria (útil junto con escritor)
+    reutilizadas : iterable, opcional
+        Industrias cuya huella (clave_industria) no ha cambiado: no se recalculan, se
+        copian del almacén que escritor va a sustituir
+    instrumentacion : instrumentacion.Instrumentacion, opcional
+        Recibe un registro por industria (tiempos, memoria, forma, caminos, longitudes;
+        con la traza completa si falla)
+    puntos_control : results_store.PuntosControl, opcional
+        Guarda cada industria en cuanto termina. Las ya guardadas con la misma clave
+        (clave_industria) no se recalculan: el año se reanuda donde se quedó. Las que
+        fallaron o se saltaron en una ejecución anterior tampoco, salvo con reintentar
+    reintentar : bool, default=False
+        Recalcula solo las industrias que fallaron o se saltaron antes (con puntos_control)
+    **kwargs :
+        Parámetros de calculate_all_dependencies
+
+    Returns:
+    --------
+    tuple
+        (all_results, saltadas, errores) con errores = {industria: mensaje}
+    """
+    all_results = {}
+    saltadas = []
+    errores = {}
+    completadas = 0
+    total_industrias = len(matrices_comercio)
+    reutilizadas = set(reutilizadas or ()) if escritor is not None else set()
+
+    # Puntos de control: industrias ya guardadas (se reanudan) y fallos previos (se
+    # repiten solo con reintentar), siempre que su clave no haya cambiado
+    claves, reanudadas, fallos_previos = {}, set(), {}
+    if puntos_control is not None:
+        claves = {ind: clave_industria(mat, threshold_pct, **kwargs)
+                  for ind, mat in matrices_comercio.items() if ind not in reutilizadas}
+        guardadas = puntos_control.completadas()
+        reanudadas = {ind for ind, clave in claves.items() if guardadas.get(ind) == clave}
+        if not reintentar:
+            fallos_previos = {ind: fallo for ind, fallo in puntos_control.fallos().items()
+                              if ind in claves and ind not in reanudadas and fallo.get("clave") == claves[ind]}
+        if verbose and (reanudadas or fallos_previos):
+            print(f"↻ Reanudadas desde puntos de control: {len(reanudadas)} · "
+                  f"fallos previos sin reintentar: {len(fallos_previos)}")
+
+    pendientes = {ind: mat for ind, mat in matrices_comercio.items()
+                  if ind not in reutilizadas and ind not in reanudadas and ind not in fallos_previos}
+
+    if n_jobs_industrias > 1:
+        kwargs.setdefault("n_jobs", 1)
+        calculadas = Parallel(n_jobs=n_jobs_industrias, return_as="generator")(
+            delayed(_procesar_industria_segura)(industry, mat, threshold_pct, kwargs)
+            for industry, mat in pendientes.items()
+        )
+    else:
+        calculadas = (
+            _procesar_industria_segura(industry, mat, threshold_pct, kwargs)
+            for industry, mat in pendientes.items()
+        )
+
+    for industry in matrices_comercio:
+        if industry in reutilizadas:
+            # Resultado guardado todavía válido: se copia sin recalcular
+            escritor.copiar_industria(industry)
+            if conservar_resultados:
+                all_results[industry] = escritor.leer_industria(industry)
+            completadas += 1
+            if instrumentacion is not None:
+                instrumentacion.registrar({"etapa": "industria", "industria": industry, "estado": "reutilizada"})
+            continue
+        if industry in reanudadas:
+            # Ya calculada antes de una interrupción: se copia de su punto de control
+            if escritor is not None:
+                escritor.copiar_industria(industry, puntos_control.ruta(industry))
+            if conservar_resultados:
+                all_results[industry] = puntos_control.leer(industry)
+            completadas += 1
+            if instrumentacion is not None:
+                instrumentacion.registrar({"etapa": "industria", "industria": industry, "estado": "reanudada"})
+            continue
+        if industry in fallos_previos:
+            fallo = fallos_previos[industry]
+            if fallo["estado"] == "error":
+                errores[industry] = fallo["error"]
+            else:
+                saltadas.append(industry)
+            continue
+        industry, entrada, error, registro = next(calculadas)
+        if instrumentacion is not None:
+            instrumentacion.registrar(registro)
+        if error is not None:
+            errores[industry] = error
+            if puntos_control is not None:
+                puntos_control.registrar_fallo(industry, "error", error, claves[industry])
+            if verbose:
+                print(f"\n⚠️ Error en industria '{industry}': {error}")
+            continue
+        if entrada is None:
+            saltadas.append(industry)
+            if puntos_control is not None:
+                puntos_control.registrar_fallo(industry, "saltada", clave=claves[industry])
+            continue
+        completadas += 1
+        if puntos_control is not None:
+            # Primero el punto de control (durable); después el almacén del año
+            puntos_control.guardar(industry, entrada, claves[industry])
+        if escritor is not None:
+            escritor.agregar_industria(industry, entrada)
+        if conservar_resultados:
+            all_results[industry] = entrada
+        if verbose:
+            print(f"✓ Completadas: {completadas}/{total_industrias}", end="\r", flush=True)
+
+    return all_results, saltadas, errores
+
+
+def resultados_identicos(a, b):
+    """Compara dos estructuras de resultados exigiendo mismos tipos, orden y bits."""
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return list(a.keys()) == list(b.keys()) and all(
+            resultados_identicos(a[k], b[k]) for k in a
+        )
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(resultados_identicos(x, y) for x, y in zip(a, b))
+    if isinstance(a, np.ndarray):
+        return a.dtype == b.dtype and a.shape == b.shape and a.tobytes() == b.tobytes()
+    if isinstance(a, (float, np.floating)):
+        return np.asarray(a).tobytes() == np.asarray(b).tobytes()
+    return a == b
+
+
+def medir_speedup(X, country_names=None, cores=None, **kwargs):
+    """
+    Mide el speed-up de calculate_all_dependencies_parallel por número de núcleos y
+    comprueba que los resultados son idénticos bit a bit a los de un solo núcleo.
+
+    Parameters:
+    -----------
+    X : numpy.ndarray
+        Matriz de comercio de una industria
+    cores : list de int, opcional
+        Núcleos a probar. Por defecto 1, 2, 4, ... hasta cpu_count()
+    **kwargs :
+        Parámetros de calculate_all_dependencies_parallel
+
+    Returns:
+    --------
+    list de dict
+        [{'n_jobs', 'segundos', 'speedup', 'identico'}, ...]
+    """
+    if cores is None:
+        cores = [1]
+        while cores[-1] * 2 <= multiprocessing.cpu_count():
+            cores.append(cores[-1] * 2)
+    kwargs.setdefault("use_gpu", False)
+
+    referencia = None
+    base = None
+    filas = []
+    for c in cores:
+        t0 = time.perf_counter()
+        res = calculate_all_dependencies_parallel(X, country_names, n_jobs=c, **kwargs)
+        segundos = time.perf_counter() - t0
+        if referencia is None:
+            referencia, base = res, segundos
+        filas.append({
+            'n_jobs': c,
+            'segundos': round(segundos, 3),
+            'speedup': round(base / segundos, 2) if segundos > 0 else float("nan"),
+            'identico': resultados_identicos(res, referencia)
+        })
+        print(f"n_jobs={c:>3}: {segundos:8.2f} s · speed-up x{filas[-1]['speedup']:.2f} · "
+              f"{'idéntico' if filas[-1]['identico'] else '⚠️ DIFERENTE'}")
+    return filas
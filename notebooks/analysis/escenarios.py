@@ -0,0 +1,426 @@
+"""
+ESCENARIOS DE SHOCK DE SUMINISTRO ISE
+Simula cortes y desvíos de suministro sobre la matriz de comercio de una industria y
+devuelve las dependencias directas, indirectas y totales resultantes junto con la
+diferencia respecto al escenario base.
+
+Cada edición (quitar un exportador, limitar un flujo bilateral, redirigir una cuota
+hacia proveedores alternativos) solo cambia las columnas de los importadores
+afectados. Los productos de matrices del motor matricial (productos_transicion) se
+actualizan con correcciones de bajo rango en esas columnas, O(n² · k) en lugar de
+O(n³), y el resto (inclusión-exclusión y convergencia) se recalcula elemento a
+elemento. Con pocos importadores afectados un escenario tarda milisegundos; si se
+toca una fracción grande de la matriz se recalcula entero.
+
+Las ediciones se aplican sobre la matriz ya limpia (eliminar_filas_columnas_cero):
+el conjunto de países no cambia y el umbral de limpieza no se vuelve a aplicar.
+
+    motor = MotorEscenarios.desde_industria(matriz_df)
+    res = motor.simular([limitar_flujo('CHN', 'ESP', fraccion=0.5)])
+    motor.diferencias(res).head()
+"""
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from dependency_engine import (
+    calcular_longitudes_convergencia,
+    combinar_productos,
+    eliminar_filas_columnas_cero,
+    productos_transicion,
+)
+
+
+# ============================================================
+# EDICIONES
+# ============================================================
+
+def quitar_exportador(exportador, importadores=None):
+    """
+    El exportador deja de vender (a todos o solo a los importadores indicados). Por
+    defecto a todos sus clientes salvo él mismo: su comercio doméstico no cambia.
+    """
+    return {'tipo': 'quitar_exportador', 'exportador': exportador,
+            'importadores': None if importadores is None else list(importadores)}
+
+
+def limitar_flujo(exportador, importador, tope=None, fraccion=None):
+    """
+    Limita el flujo exportador → importador a un valor absoluto (tope) o a una
+    fracción de su valor actual (fraccion). Lo que se pierde no se sustituye.
+    """
+    if (tope is None) == (fraccion is None):
+        raise ValueError("❌ limitar_flujo necesita exactamente uno de tope o fraccion")
+    if tope is not None and not tope >= 0.0:
+        raise ValueError(f"❌ tope debe ser mayor o igual que 0 (recibido {tope})")
+    if fraccion is not None and not 0.0 <= fraccion <= 1.0:
+        raise ValueError(f"❌ fraccion debe estar entre 0 y 1 (recibido {fraccion})")
+    return {'tipo': 'limitar_flujo', 'exportador': exportador, 'importador': importador,
+            'tope': tope, 'fraccion': fraccion}
+
+
+def redirigir_cuota(importador, exportador, fraccion, alternativas=None):
+    """
+    El importador deja de comprar una fracción de lo que importa del exportador y la
+    reparte entre las alternativas en proporción a lo que ya les compra (a partes
+    iguales si no les compra nada). Por defecto, entre todos sus demás proveedores.
+    Las importaciones totales del importador no cambian.
+    """
+    if not 0.0 <= fraccion <= 1.0:
+        raise ValueError(f"❌ fraccion debe estar entre 0 y 1 (recibido {fraccion})")
+    return {'tipo': 'redirigir_cuota', 'importador': importador, 'exportador': exportador,
+            'fraccion': fraccion,
+            'alternativas': None if alternativas is None else list(alternativas)}
+
+
+def escenarios_sin_exportador(exportadores):
+    """Barrido típico de resiliencia: un escenario por exportador eliminado."""
+    return {f"sin_{e}": [quitar_exportador(e)] for e in exportadores}
+
+
+# ============================================================
+# ACTUALIZACIÓN DE BAJO RANGO
+# ============================================================
+
+def _selector(columnas, n):
+    """Matriz k×n con E[t, columnas[t]] = 1 (la corrección vive en esas columnas)."""
+    E = np.zeros((len(columnas), n))
+    E[np.arange(len(columnas)), columnas] = 1.0
+    return E
+
+
+def actualizar_productos(productos, dD, columnas, max_m):
+    """
+    Productos de productos_transicion tras sumar dD (n×k) a las columnas `columnas`
+    de D, sin rehacer ningún producto n×n×n.
+
+    Cada corrección se mantiene factorizada como F @ G (F n×r, G r×n): si
+    A' = A + F1 G1 y B' = B + F2 G2, entonces
+    A'B' = AB + F1 (G1 B') + (A F2) G2, y el rango r crece solo en k por producto.
+    """
+    n = productos['D'].shape[0]
+    E = _selector(columnas, n)
+    D = productos['D']
+    D2 = D.copy()
+    D2[:, columnas] += dD
+    # U solo cambia en las mismas columnas (parte triangular superior estricta)
+    dU = np.where(np.arange(n)[:, None] < np.asarray(columnas)[None, :], dD, 0.0)
+
+    P = [productos['P'][0]]
+    F, G = np.zeros((n, 0)), np.zeros((0, n))   # ΔP[0] = 0
+    factores_P = [(F, G)]
+    for s in range(1, max_m):
+        U = productos['P'][1]
+        # ΔP[s] = P[s-1] ΔU + ΔP[s-1] U'
+        GU = G @ U
+        GU[:, columnas] += G @ dU
+        F = np.hstack([productos['P'][s - 1] @ dU, F])
+        G = np.vstack([E, GU])
+        factores_P.append((F, G))
+        P.append(productos['P'][s] + F @ G)
+
+    DP, PD, cadenas = [], [], []
+    for s in range(max_m):
+        F, G = factores_P[s]
+        # ΔDP[s] = ΔD P'[s] + D ΔP[s]
+        F_dp = np.hstack([dD, D @ F])
+        G_dp = np.vstack([P[s][columnas, :], G])
+        DP.append(productos['DP'][s] + F_dp @ G_dp)
+        # ΔPD[s] = P[s] ΔD + ΔP[s] D'
+        G_D2 = G @ D2
+        pd_s = productos['PD'][s] + F @ G_D2
+        pd_s[:, columnas] += productos['P'][s] @ dD
+        PD.append(pd_s)
+        # Δcadena[s] = DP[s] ΔD + ΔDP[s] D'
+        cadena = productos['cadenas'][s] + F_dp @ (G_dp @ D2)
+        cadena[:, columnas] += productos['DP'][s] @ dD
+        cadenas.append(cadena)
+
+    return {'D': D2, 'P': P, 'DP': DP, 'PD': PD, 'cadenas': cadenas}
+
+
+# ============================================================
+# MOTOR DE ESCENARIOS
+# ============================================================
+
+class MotorEscenarios:
+    """
+    Escenario base de una industria (X, T y productos del motor matricial) sobre el
+    que se simulan ediciones.
+
+    Parameters:
+    -----------
+    X : numpy.ndarray
+        Matriz de comercio limpia (n×n), X[exportador, importador]
+    max_columnas : int, optional
+        Importadores afectados a partir de los cuales se recalcula todo en lugar de
+        actualizar por bajo rango (por defecto n // 6)
+    """
+
+    def __init__(self, X, country_names=None, max_possible_length=3, convergence_threshold=0.01,
+                 max_columnas=None):
+        self.X = np.asarray(X, dtype=np.float64)
+        n = self.X.shape[0]
+        if country_names is None:
+            country_names = [f"País {i}" for i in range(n)]
+        if len(country_names) != n:
+            raise ValueError(f"La longitud de country_names ({len(country_names)}) no coincide con la dimensión de X ({n})")
+
+        self.country_names = list(country_names)
+        self.indice = {c: k for k, c in enumerate(self.country_names)}
+        self.max_possible_length = max_possible_length
+        self.convergence_threshold = convergence_threshold
+        self.max_m = max_possible_length - 1
+        self.max_columnas = max(1, n // 6) if max_columnas is None else max_columnas
+
+        self.T = self._transicion(self.X)
+        self.productos = productos_transicion(self.T, self.max_m) if self.max_m >= 1 else None
+        self.base = self._evaluar(self.T, self.productos)
+        self.base.update({'columnas': [], 'metodo': 'base', 'segundos': 0.0})
+
+    @classmethod
+    def desde_industria(cls, mat, threshold_pct=0.005, country_names=None, **kwargs):
+        """Motor sobre la matriz de una industria limpiada igual que en procesar_industria."""
+        mat_clean = eliminar_filas_columnas_cero(mat, threshold_pct=threshold_pct, country_names=country_names)
+        return cls(mat_clean.values, mat_clean.columns.tolist(), **kwargs)
+
+    @staticmethod
+    def _transicion(X):
+        denom = X.sum(axis=0, dtype=np.float64)
+        denom[denom == 0.0] = np.inf
+        return (X / denom).astype(np.float64, copy=False)
+
+    def _evaluar(self, T, productos):
+        """Dependencias de un escenario a partir de T y sus productos."""
+        if productos is None:
+            dependencias = {}
+        else:
+            dependencias = combinar_productos(productos, self.max_m)
+        indirecta, longitud = calcular_longitudes_convergencia(
+            T, dependencias, self.max_possible_length, self.convergence_threshold
+        )
+        return {'directa': T, 'indirecta': indirecta, 'total': T + indirecta, 'longitud': longitud}
+
+    def _pais(self, nombre):
+        try:
+            return self.indice[nombre]
+        except KeyError:
+            raise KeyError(f"❌ '{nombre}' no está en la matriz limpia de esta industria") from None
+
+    def aplicar(self, ediciones):
+        """
+        Columnas de X que cambian con las ediciones (aplicadas en orden).
+
+        Returns:
+        --------
+        dict
+            {índice de importador: nueva columna de X}
+        """
+        columnas = {}
+
+        def columna(i):
+            if i not in columnas:
+                columnas[i] = self.X[:, i].copy()
+            return columnas[i]
+
+        for ed in ediciones:
+            tipo = ed['tipo']
+            if tipo == 'quitar_exportador':
+                j = self._pais(ed['exportador'])
+                if ed['importadores'] is None:
+                    destinos = [i for i in np.flatnonzero(self.X[j]) if i != j]
+                    destinos += [i for i in columnas if i not in destinos and i != j]
+                else:
+                    destinos = [self._pais(c) for c in ed['importadores']]
+                for i in destinos:
+                    columna(i)[j] = 0.0
+            elif tipo == 'limitar_flujo':
+                j, i = self._pais(ed['exportador']), self._pais(ed['importador'])
+                col = columna(i)
+                tope = ed['tope'] if ed['tope'] is not None else col[j] * ed['fraccion']
+                col[j] = min(col[j], tope)
+            elif tipo == 'redirigir_cuota':
+                i, j = self._pais(ed['importador']), self._pais(ed['exportador'])
+                col = columna(i)
+                if ed['alternativas'] is None:
+                    alternativas = [k for k in np.flatnonzero(col) if k not in (i, j)]
+                else:
+                    alternativas = [self._pais(c) for c in ed['alternativas'] if self._pais(c) != j]
+                if not alternativas:
+                    raise ValueError(f"❌ {ed['importador']} no tiene proveedores alternativos a {ed['exportador']}")
+                movido = col[j] * ed['fraccion']
+                pesos = col[alternativas]
+                pesos = pesos / pesos.sum() if pesos.sum() > 0 else np.full(len(alternativas), 1.0 / len(alternativas))
+                col[j] -= movido
+                col[alternativas] += movido * pesos
+            else:
+                raise ValueError(f"❌ Tipo de edición desconocido: {tipo}")
+
+        return {i: col for i, col in columnas.items() if not np.array_equal(col, self.X[:, i])}
+
+    def simular(self, ediciones):
+        """
+        Dependencias tras aplicar las ediciones.
+
+        Returns:
+        --------
+        dict
+            'directa', 'indirecta', 'total' (n×n, [exportador, importador]), 'longitud',
+            'columnas' (importadores afectados), 'metodo' ('sin_cambios', 'bajo_rango'
+            o 'completo') y 'segundos'
+        """
+        inicio = time.perf_counter()
+        nuevas = self.aplicar(ediciones)
+        columnas = sorted(nuevas)
+        if not columnas:
+            res = dict(self.base, metodo='sin_cambios')
+            res['segundos'] = time.perf_counter() - inicio
+            return res
+
+        T = self.T.copy()
+        X_cols = np.column_stack([nuevas[i] for i in columnas])
+        T[:, columnas] = self._transicion(X_cols)
+
+        if self.productos is None:
+            metodo, productos = 'completo', None
+        elif len(columnas) > self.max_columnas:
+            metodo, productos = 'completo', productos_transicion(T, self.max_m)
+        else:
+            # Variación de D (T sin diagonal) en las columnas afectadas
+            dD = T[:, columnas] - self.T[:, columnas]
+            dD[columnas, np.arange(len(columnas))] = 0.0
+            metodo, productos = 'bajo_rango', actualizar_productos(self.productos, dD, columnas, self.max_m)
+
+        res = self._evaluar(T, productos)
+        res.update({'columnas': [self.country_names[i] for i in columnas], 'metodo': metodo,
+                    'segundos': time.perf_counter() - inicio})
+        return res
+
+    def diferencias(self, resultado, tolerancia=1e-9):
+        """
+        Pares cuya dependencia cambia respecto al escenario base, ordenados por el
+        cambio absoluto de la dependencia total.
+        """
+        d_dir = resultado['directa'] - self.base['directa']
+        d_ind = resultado['indirecta'] - self.base['indirecta']
+        d_tot = resultado['total'] - self.base['total']
+        mask = (np.abs(d_dir) > tolerancia) | (np.abs(d_ind) > tolerancia) | (np.abs(d_tot) > tolerancia)
+        np.fill_diagonal(mask, False)
+        j, i = np.nonzero(mask)
+        nombres = np.asarray(self.country_names, dtype=object)
+
+        df = pd.DataFrame({
+            'importador': nombres[i],
+            'exportador': nombres[j],
+            'directa_base': self.base['directa'][j, i],
+            'directa_escenario': resultado['directa'][j, i],
+            'indirecta_base': self.base['indirecta'][j, i],
+            'indirecta_escenario': resultado['indirecta'][j, i],
+            'total_base': self.base['total'][j, i],
+            'total_escenario': resultado['total'][j, i],
+            'delta_directa': d_dir[j, i],
+            'delta_indirecta': d_ind[j, i],
+            'delta_total': d_tot[j, i],
+            'longitud_base': self.base['longitud'][j, i],
+            'longitud_escenario': resultado['longitud'][j, i],
+        })
+        orden = np.argsort(-np.abs(df['delta_total'].to_numpy()), kind='stable')
+        return df.iloc[orden].reset_index(drop=True)
+
+    def barrer(self, escenarios, tolerancia=1e-9, n_jobs=1):
+        """
+        Simula un lote de escenarios sobre la misma base.
+
+        Parameters:
+        -----------
+        escenarios : dict
+            {nombre: [ediciones]} (p. ej. escenarios_sin_exportador(...))
+        n_jobs : int
+            Hilos (los productos de numpy liberan el GIL y la base se comparte sin copiar)
+
+        Returns:
+        --------
+        tuple
+            (resumen por escenario, diferencias en formato largo con columna 'escenario')
+        """
+        def uno(nombre, ediciones):
+            res = self.simular(ediciones)
+            dif = self.diferencias(res, tolerancia)
+            dif.insert(0, 'escenario', nombre)
+            resumen = {
+                'escenario': nombre,
+                'metodo': res['metodo'],
+                'importadores_afectados': len(res['columnas']),
+                'pares_afectados': len(dif),
+                'max_delta_total': float(dif['delta_total'].abs().max()) if len(dif) else 0.0,
+                'suma_delta_total': float(dif['delta_total'].sum()),
+                'segundos': res['segundos'],
+            }
+            return resumen, dif
+
+        salidas = Parallel(n_jobs=n_jobs, prefer="threads")(
+            delayed(uno)(nombre, ediciones) for nombre, ediciones in escenarios.items()
+        )
+        resumen = pd.DataFrame([r for r, _ in salidas])
+        difs = [d for _, d in salidas if len(d)]
+        diferencias = pd.concat(difs, ignore_index=True) if difs else pd.DataFrame()
+        return resumen, diferencias
+
+
+def verificar_escenarios(n=40, max_possible_length=4, density=0.5, seed=0, atol=1e-10):
+    """
+    Compara simular() (bajo rango y recálculo completo) con calculate_all_dependencies_matrix
+    sobre la matriz editada, para varias ediciones sobre una matriz aleatoria.
+
+    Returns:
+    --------
+    dict
+        Resumen de la comparación ('ok', escenarios, diferencia máxima)
+
+    Raises:
+    -------
+    AssertionError
+        Si alguna dependencia o longitud no coincide
+    """
+    from dependency_engine import calculate_all_dependencies_matrix
+
+    rng = np.random.default_rng(seed)
+    X = rng.pareto(1.5, size=(n, n))
+    X[rng.random((n, n)) > density] = 0.0
+    names = [f"C{k:02d}" for k in range(n)]
+    # Comercio doméstico de C12: quitar el exportador no debe tocarlo
+    X[12, 12] = max(X[12, 12], 1.0)
+    motor = MotorEscenarios(X, names, max_possible_length)
+
+    escenarios = {
+        'tope': [limitar_flujo('C03', 'C07', fraccion=0.2)],
+        'tope_absoluto': [limitar_flujo('C10', 'C01', tope=0.0)],
+        'redirigir': [redirigir_cuota('C05', 'C02', 0.6)],
+        'redirigir_a': [redirigir_cuota('C05', 'C02', 1.0, alternativas=['C08', 'C09'])],
+        'parcial': [quitar_exportador('C00', importadores=['C04', 'C11', 'C20'])],
+        'sin_exportador': [quitar_exportador('C12')],
+        'combinado': [limitar_flujo('C01', 'C02', fraccion=0.5), redirigir_cuota('C02', 'C03', 0.3)],
+    }
+    assert 12 not in motor.aplicar([quitar_exportador('C12')])
+
+    max_diff = 0.0
+    for nombre, ediciones in escenarios.items():
+        res = motor.simular(ediciones)
+        X_ed = X.copy()
+        for i, col in motor.aplicar(ediciones).items():
+            X_ed[:, i] = col
+        ref = calculate_all_dependencies_matrix(X_ed, names, max_possible_length=max_possible_length,
+                                                top_k_paths=0)
+        for d in ref['dependencies']:
+            i, j = motor.indice[d['importador']], motor.indice[d['exportador']]
+            assert d['longitud_optima'] == res['longitud'][j, i], (nombre, d)
+            for clave, matriz in (('dependencia_directa', 'directa'),
+                                  ('dependencia_indirecta', 'indirecta'),
+                                  ('dependencia_total', 'total')):
+                diff = abs(d[clave] - res[matriz][j, i])
+                assert diff <= atol, (nombre, clave, d, res[matriz][j, i])
+                max_diff = max(max_diff, diff)
+
+    return {'ok': True, 'escenarios': len(escenarios), 'max_diff': float(max_diff)}
@@ -0,0 +1,248 @@
+"""
+TABLAS ORDENADAS DE HISTORICO
+explorer_{año}.parquet y dependencies_{año}.parquet se escriben ordenadas por
+(importador, industria): cada row group contiene importadores completos y sus
+estadísticas min/max permiten descartar el resto sin leerlos. Junto a cada tabla se
+guarda un índice de desplazamientos ({tabla}_{año}_indice.parquet):
+
+    importer, industry, row_group, inicio, filas
+
+de modo que un país (o país + industria) se lee con una sola lectura de su row group en
+lugar de recorrer el fichero entero. Dentro de cada (importador, industria) se conserva
+el orden en que se escribieron las filas (orden estable), p. ej. por dependencia total.
+
+El panel multi-año (panel.py, data/processed/panel/) guarda sus pares con el mismo
+orden e índice; evolucion_panel() da a los builds del dashboard la evolución de todos
+los años en dos lecturas en lugar de abrir profiles_{año} y critical_{año} uno a uno.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Claves de orden de cada tabla (la primera define los row groups)
+CLAVES_ORDEN = {
+    "explorer": ("importer", "industry"),
+    "dependencies": ("dependent_country", "industry"),
+}
+MIN_FILAS_GRUPO = 1024  # Se cierran los row groups al superar estas filas (sin partir importadores)
+
+# Poda del explorador: ise_architect guarda los top_arquitecto proveedores por
+# (importador, industria) y marca con dashboard=True los que embebe build.py (los
+# top_proveedores con dep_total redondeada >= umbral); servidor.py usa los mismos umbrales
+PAIS_PRIORITARIO = "ESP"
+PODA_EXPLORADOR = {
+    "top_arquitecto": 20,    # Proveedores por importador e industria en explorer_{año}
+    "top_proveedores": 10,   # Dashboard: top 10 proveedores por importador/industria
+    "min_dep_esp": 0.01,     # Dashboard: 1% para España
+    "min_dep_mundo": 0.05,   # Dashboard: 5% para el resto del mundo
+}
+
+
+def ruta_indice(ruta):
+    """Índice de desplazamientos junto a la tabla: explorer_2022.parquet → explorer_2022_indice.parquet."""
+    ruta = Path(ruta)
+    return ruta.with_name(f"{ruta.stem}_indice.parquet")
+
+
+def _cortes(*columnas):
+    """Posiciones donde cambia alguna de las columnas (arrays numpy ya ordenados)."""
+    n = len(columnas[0])
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    cambio = np.zeros(n - 1, dtype=bool)
+    for col in columnas:
+        cambio |= col[1:] != col[:-1]
+    return np.flatnonzero(cambio) + 1
+
+
+def escribir_ordenado(tabla, ruta, claves, min_filas_grupo=MIN_FILAS_GRUPO):
+    """
+    Escribe la tabla ordenada (de forma estable) por claves, con row groups de
+    importadores completos, índice de páginas y el índice de desplazamientos.
+
+    Parameters:
+    -----------
+    tabla : pyarrow.Table o pandas.DataFrame
+    claves : tuple
+        (clave de país, clave de industria), p. ej. ("importer", "industry")
+
+    Returns:
+    --------
+    pandas.DataFrame
+        El índice escrito
+    """
+    if isinstance(tabla, pd.DataFrame):
+        tabla = pa.Table.from_pandas(tabla, preserve_index=False)
+    ruta = Path(ruta)
+    clave_pais, clave_ind = claves
+    columnas_indice = [clave_pais, clave_ind, "row_group", "inicio", "filas"]
+
+    temporal = ruta.with_name(ruta.name + ".tmp")
+    if not set(claves) <= set(tabla.column_names):
+        # Tabla vacía sin columnas (año sin datos): sin orden ni índice que calcular
+        pq.write_table(tabla, temporal)
+        temporal.replace(ruta)
+        indice = pd.DataFrame(columns=columnas_indice)
+        indice.to_parquet(ruta_indice(ruta), index=False)
+        return indice
+
+    tabla = tabla.sort_by([(clave_pais, "ascending"), (clave_ind, "ascending")])
+    paises = tabla.column(clave_pais).to_numpy(zero_copy_only=False)
+    industrias = tabla.column(clave_ind).to_numpy(zero_copy_only=False)
+
+    # Row groups: importadores completos hasta superar min_filas_grupo
+    inicios_pais = np.concatenate([[0], _cortes(paises)]).astype(np.int64)
+    grupos = [0]
+    for inicio in inicios_pais[1:].tolist():
+        if inicio - grupos[-1] >= min_filas_grupo:
+            grupos.append(inicio)
+    limites = grupos + [tabla.num_rows]
+
+    with pq.ParquetWriter(temporal, tabla.schema, write_page_index=True) as writer:
+        for a, b in zip(limites[:-1], limites[1:]):
+            if b > a or tabla.num_rows == 0:
+                writer.write_table(tabla.slice(a, b - a), row_group_size=max(b - a, 1))
+
+    # Índice: un registro por (país, industria) con su row group y desplazamiento
+    inicios = np.concatenate([[0], _cortes(paises, industrias)]).astype(np.int64)[:tabla.num_rows]
+    fines = np.concatenate([inicios[1:], [tabla.num_rows]]).astype(np.int64)
+    row_group = np.searchsorted(np.asarray(grupos), inicios, side="right") - 1
+    indice = pd.DataFrame({
+        clave_pais: paises[inicios],
+        clave_ind: industrias[inicios],
+        "row_group": row_group.astype(np.int32),
+        "inicio": (inicios - np.asarray(grupos)[row_group]).astype(np.int64),
+        "filas": (fines - inicios).astype(np.int64),
+    }, columns=columnas_indice)
+
+    temporal.replace(ruta)
+    indice.to_parquet(ruta_indice(ruta), index=False)
+    return indice
+
+
+def leer_indice(ruta):
+    """Índice de desplazamientos de una tabla, o None si es de una versión sin orden."""
+    indice = ruta_indice(ruta)
+    if not indice.exists():
+        return None
+    return pd.read_parquet(indice)
+
+
+def leer_ordenado(ruta, pais, industria=None, columns=None, indice=None):
+    """
+    Filas de un país (o país + industria) leyendo solo su row group.
+
+    Parameters:
+    -----------
+    ruta : Path
+        explorer_{año}.parquet o dependencies_{año}.parquet
+    indice : pandas.DataFrame, opcional
+        Índice ya cargado (leer_indice), para no releerlo en consultas repetidas
+
+    Returns:
+    --------
+    pandas.DataFrame
+    """
+    ruta = Path(ruta)
+    indice = leer_indice(ruta) if indice is None else indice
+    fichero = pq.ParquetFile(ruta, memory_map=True)
+    if indice is None:
+        # Tabla antigua sin índice: filtro de pyarrow sobre el fichero entero
+        clave_pais = "dependent_country" if "dependent_country" in fichero.schema_arrow.names else "importer"
+        filtros = [(clave_pais, "==", pais)]
+        if industria is not None:
+            filtros.append(("industry", "==", industria))
+        return pq.read_table(ruta, columns=columns, filters=filtros, memory_map=True).to_pandas()
+
+    clave_pais, clave_ind = indice.columns[:2]
+    sel = indice[indice[clave_pais] == pais]
+    if industria is not None:
+        sel = sel[sel[clave_ind] == industria]
+    if sel.empty:
+        return fichero.schema_arrow.empty_table().select(columns or fichero.schema_arrow.names).to_pandas()
+
+    grupos = sorted(sel["row_group"].unique().tolist())
+    tabla = fichero.read_row_groups(grupos, columns=columns)
+    # Desplazamientos dentro de la concatenación de los row groups leídos
+    base = dict(zip(grupos, np.cumsum([0] + [fichero.metadata.row_group(g).num_rows for g in grupos[:-1]]).tolist()))
+    trozos = [tabla.slice(base[g] + i, n) for g, i, n in zip(sel["row_group"], sel["inicio"], sel["filas"])]
+    return pa.concat_tables(trozos).to_pandas()
+
+
+def iterar_paises(ruta, columns=None):
+    """
+    Recorre una tabla ordenada row group a row group y devuelve (país, DataFrame) por
+    país, con memoria acotada a un row group.
+    """
+    ruta = Path(ruta)
+    fichero = pq.ParquetFile(ruta, memory_map=True)
+    indice = leer_indice(ruta)
+    if indice is None:
+        raise ValueError(f"❌ {ruta.name} no tiene índice: regenerar con ise_architect.py")
+    clave_pais = indice.columns[0]
+    if columns is not None and clave_pais not in columns:
+        columns = [clave_pais] + list(columns)
+    for k in range(fichero.metadata.num_row_groups):
+        df = fichero.read_row_group(k, columns=columns).to_pandas()
+        if df.empty:
+            continue
+        paises = df[clave_pais].to_numpy()
+        cortes = np.concatenate([[0], _cortes(paises), [len(df)]]).tolist()
+        for a, b in zip(cortes[:-1], cortes[1:]):
+            yield paises[a], df.iloc[a:b]
+
+
+# ==================== PANEL MULTI-AÑO ====================
+
+COLUMNAS_EVOLUCION = ["country", "year", "vulnerability", "importance", "global_rank"]
+
+
+def evolucion_panel(directorio, anios, historico=None, min_dep_critica=0.7):
+    """
+    Serie de perfiles y recuento anual de relaciones críticas desde el panel.
+
+    Parameters:
+    -----------
+    directorio : Path
+        Carpeta del panel (perfiles.parquet, pares.parquet, parametros.json)
+    anios : list
+        Años que debe cubrir exactamente el panel
+    historico : Path, opcional
+        Carpeta historico/: el panel no vale si algún profiles_/critical_ es posterior
+    min_dep_critica : float
+        Dependencia total mínima de las relaciones críticas
+
+    Returns:
+    --------
+    tuple o None
+        (evolution con COLUMNAS_EVOLUCION ordenada por año y país, critical_evolution
+        con columnas year y count), o None si hay que leer año a año
+    """
+    directorio = Path(directorio)
+    try:
+        with open(directorio / "parametros.json", encoding="utf-8") as f:
+            parametros = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    # Los pares del panel solo incluyen las relaciones con total >= min_dependencia
+    if sorted(parametros.get("anios", [])) != sorted(anios) or parametros.get("min_dependencia", 1.0) > min_dep_critica:
+        return None
+    ficheros = [directorio / "perfiles.parquet", directorio / "pares.parquet"]
+    if not all(f.exists() for f in ficheros):
+        return None
+    if historico is not None:
+        generado = min(f.stat().st_mtime for f in ficheros)
+        fuentes = [Path(historico) / f"{t}_{y}.parquet" for y in anios for t in ("profiles", "critical")]
+        if any(f.exists() and f.stat().st_mtime > generado for f in fuentes):
+            return None
+
+    evolucion = pd.read_parquet(ficheros[0], columns=COLUMNAS_EVOLUCION) \
+        .sort_values(["year", "country"], kind="stable").reset_index(drop=True)
+    criticas = pq.read_table(ficheros[1], columns=["year"],
+                             filters=[("en_matriz", "==", True), ("total", ">=", min_dep_critica)]).to_pandas()
+    criticas = criticas.groupby("year").size().reset_index(name="count")
+    return evolucion, criticas
@@ -0,0 +1,352 @@
+"""
+HUBS E INTERMEDIARIOS ISE
+Métricas de hubs (centralidad de los países como intermediarios) con reducciones
+agrupadas sobre una tabla plana de caminos, una fila por intermediario:
+
+    year, industry, camino, posicion, intermediario, fuerza
+
+- aplanar_caminos(): la tabla paths del almacén (lista de intermediarios por camino)
+  en ese formato, sin bucles de Python (list_flatten de Arrow).
+- intermediarios_por_industria(): frecuencia (apariciones) y fuerza
+  (Σ fuerza · 1/(posicion+1)) por (año, industria, país), las mismas sumas que
+  consolidar_resultados guarda en intermediaries del almacén.
+- metricas_hubs(): de esa tabla base, en una pasada, los hubs por industria, por año y
+  globales con el score de ise_architect (0.4 · freq_norm + 0.6 · strength_norm,
+  normalizadas por el máximo del grupo) y global_rank (method='min'). Los agregados
+  por año suman las filas de cada industria en su orden, como el bucle anterior de
+  ise_architect, así que hubs_{año} sale idéntico.
+
+    hubs = hubs_almacen([2020, 2021, 2022])
+    hubs["industria"], hubs["anual"], hubs["global"]
+
+    python hubs.py 2020 2021 2022 --desde-caminos
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from dependency_engine import PESO_FRECUENCIA, PESO_FUERZA
+from results_store import leer_arrow, ruta_resultados
+
+BASE_PATH = Path(__file__).resolve().parent.parent.parent
+HUBS_DIR = BASE_PATH / "data" / "processed" / "hubs"
+
+# Columnas de la tabla de caminos que se copian a cada fila de intermediario
+CLAVES_CAMINO = ("year", "industry", "exporter", "importer")
+NIVELES = ("industria", "anual", "global")
+
+
+def aplanar_caminos(paths, solo_significativos=True):
+    """
+    Tabla de caminos → una fila por (camino, intermediario).
+
+    Parameters:
+    -----------
+    paths : pyarrow.Table o DataFrame
+        Con fuerza e intermediarios (lista de países) y, opcionalmente, year,
+        industry, exporter, importer y significativo
+    solo_significativos : bool, default=True
+        Con la columna significativo, solo los caminos críticos (los que cuentan
+        para intermediaries)
+
+    Returns:
+    --------
+    DataFrame
+        Claves presentes de CLAVES_CAMINO, camino (fila en paths), posicion (0 = primer
+        intermediario tras el exportador), intermediario (categórica) y fuerza del camino
+    """
+    tabla = paths if isinstance(paths, pa.Table) else pa.Table.from_pandas(paths, preserve_index=False)
+    if solo_significativos and "significativo" in tabla.column_names:
+        tabla = tabla.filter(tabla.column("significativo"))
+    listas = tabla.column("intermediarios").combine_chunks()
+    longitudes = pc.list_value_length(listas).fill_null(0).to_numpy(zero_copy_only=False).astype(np.int64)
+    camino = np.repeat(np.arange(tabla.num_rows, dtype=np.int64), longitudes)
+    inicio = np.cumsum(longitudes) - longitudes
+    posicion = np.arange(len(camino), dtype=np.int64) - np.repeat(inicio, longitudes)
+
+    intermediarios = pc.list_flatten(listas)
+    if not pa.types.is_dictionary(intermediarios.type):
+        intermediarios = intermediarios.dictionary_encode()
+    indices = pa.array(camino)
+    planos = {c: tabla.column(c).take(indices).to_pandas() for c in CLAVES_CAMINO if c in tabla.column_names}
+    planos["camino"] = camino
+    planos["posicion"] = posicion.astype(np.int8)
+    planos["intermediario"] = intermediarios.to_pandas()
+    planos["fuerza"] = tabla.column("fuerza").take(indices).to_numpy().astype(np.float64)
+    return pd.DataFrame(planos)
+
+
+def _codigos(df, columnas):
+    """Código de grupo de cada fila (primera aparición) y las claves de cada grupo."""
+    codigos, valores = zip(*(pd.factorize(df[c], sort=False) for c in columnas))
+    if len(columnas) == 1:
+        return codigos[0].astype(np.int64), pd.DataFrame({columnas[0]: np.asarray(valores[0])})
+    combinado = np.ravel_multi_index(codigos, [len(v) for v in valores])
+    grupo, primeras = pd.factorize(combinado, sort=False)
+    partes = np.unravel_index(primeras, [len(v) for v in valores])
+    return grupo.astype(np.int64), pd.DataFrame({c: np.asarray(v)[p] for c, v, p in zip(columnas, valores, partes)})
+
+
+def _sumar(df, claves, frecuencia, fuerza):
+    """
+    Sumas de frecuencia y fuerza por claves + country. bincount acumula en el orden de
+    las filas, así que el resultado es el mismo que sumando fila a fila.
+    """
+    grupo, tabla = _codigos(df, [*claves, "country"])
+    tabla["frequency_total"] = np.bincount(grupo, weights=frecuencia, minlength=len(tabla)).astype(np.int64)
+    tabla["strength_total"] = np.bincount(grupo, weights=fuerza, minlength=len(tabla))
+    return tabla
+
+
+def intermediarios_por_industria(planos, paises=None):
+    """
+    Frecuencia y fuerza de cada país como intermediario por (year, industry) presentes.
+
+    Parameters:
+    -----------
+    planos : DataFrame
+        Salida de aplanar_caminos
+    paises : list, opcional
+        Países que aparecen en cada grupo aunque no intermedien ningún camino (con
+        frecuencia 0), p. ej. los country_names de la matriz limpia de la industria
+
+    Returns:
+    --------
+    DataFrame
+        Claves, country, frequency y strength (como la tabla intermediaries)
+    """
+    claves = [c for c in ("year", "industry") if c in planos.columns]
+    peso = planos["fuerza"].to_numpy() * (1.0 / (planos["posicion"].to_numpy(np.int64) + 1))
+    base = _sumar(planos.rename(columns={"intermediario": "country"}), claves,
+                  np.ones(len(planos)), peso)
+    base = base.rename(columns={"frequency_total": "frequency", "strength_total": "strength"})
+    base["country"] = base["country"].astype(str)
+    if paises is not None:
+        grupos = base[claves].drop_duplicates() if claves else pd.DataFrame(index=[0])
+        if grupos.empty and claves:
+            return base
+        rejilla = grupos.merge(pd.DataFrame({"country": [str(p) for p in paises]}), how="cross")
+        base = rejilla.merge(base, on=[*claves, "country"], how="left")
+        base["frequency"] = base["frequency"].fillna(0).astype(np.int64)
+        base["strength"] = base["strength"].fillna(0.0)
+    return base
+
+
+def puntuar_hubs(tabla, por=()):
+    """
+    Añade freq_norm, strength_norm, global_score y global_rank a una tabla con
+    frequency_total y strength_total, normalizando y ordenando dentro de cada grupo por.
+    """
+    por = list(por)
+    if tabla.empty:
+        return tabla
+    tabla = tabla.copy()
+    if por:
+        grupos = tabla.groupby(por, sort=False, observed=True)
+        max_f = grupos["frequency_total"].transform("max").to_numpy()
+        max_s = grupos["strength_total"].transform("max").to_numpy()
+    else:
+        max_f = tabla["frequency_total"].max()
+        max_s = tabla["strength_total"].max()
+    f = tabla["frequency_total"].to_numpy(np.float64)
+    s = tabla["strength_total"].to_numpy(np.float64)
+    tabla["freq_norm"] = np.divide(f, max_f, out=np.zeros_like(f), where=np.asarray(max_f) > 0)
+    tabla["strength_norm"] = np.divide(s, max_s, out=np.zeros_like(s), where=np.asarray(max_s) > 0)
+    tabla["global_score"] = (PESO_FRECUENCIA * tabla["freq_norm"]) + (PESO_FUERZA * tabla["strength_norm"])
+    if por:
+        rango = tabla.groupby(por, sort=False, observed=True)["global_score"].rank(ascending=False, method='min')
+        tabla["global_rank"] = rango.astype(int)
+        return tabla.sort_values([*por, "global_score"], ascending=[True] * len(por) + [False],
+                                 kind="stable").reset_index(drop=True)
+    tabla["global_rank"] = tabla["global_score"].rank(ascending=False, method='min').astype(int)
+    return tabla.sort_values("global_score", ascending=False)
+
+
+def metricas_hubs(base):
+    """
+    Hubs por industria, por año y globales a partir de la tabla base.
+
+    Parameters:
+    -----------
+    base : DataFrame
+        country, frequency, strength y, opcionalmente, year e industry (salida de
+        intermediarios_por_industria o la tabla intermediaries del almacén)
+
+    Returns:
+    --------
+    dict
+        'industria' (si hay industry), 'anual' (si hay year) y 'global': country,
+        frequency_total, strength_total, freq_norm, strength_norm, global_score y
+        global_rank, con el rango dentro de su (año, industria), año o en total
+    """
+    anual = "year" in base.columns
+    por_industria = "industry" in base.columns
+    frecuencia = base["frequency"].to_numpy(np.float64)
+    fuerza = base["strength"].to_numpy(np.float64)
+    metricas = {}
+    if por_industria:
+        claves = ["year", "industry"] if anual else ["industry"]
+        metricas["industria"] = puntuar_hubs(_sumar(base, claves, frecuencia, fuerza), claves)
+    if anual:
+        metricas["anual"] = puntuar_hubs(_sumar(base, ["year"], frecuencia, fuerza), ["year"])
+    metricas["global"] = puntuar_hubs(_sumar(base, [], frecuencia, fuerza)).reset_index(drop=True)
+    return metricas
+
+
+def hubs_almacen(years, results_dir=None, desde_caminos=False, filtros=None):
+    """
+    Hubs por industria, año y globales de los almacenes results_{año}.
+
+    Parameters:
+    -----------
+    years : list
+        Años con almacén
+    desde_caminos : bool, default=False
+        Recalcula la base desde la tabla paths (aplanar_caminos) en vez de leer la tabla
+        intermediaries; con filtros es la única opción (p. ej. solo los caminos hacia un
+        importador)
+    filtros : list, opcional
+        Filtros de pyarrow sobre paths, p. ej. [("importer", "==", "ESP")]
+    """
+    bases = []
+    for year in years:
+        directorio = ruta_resultados(year, results_dir)
+        if desde_caminos or filtros:
+            paths = leer_arrow(directorio, "paths",
+                               ["industry", "fuerza", "intermediarios", "significativo"], filtros)
+            base = intermediarios_por_industria(aplanar_caminos(paths))
+        else:
+            base = leer_arrow(directorio, "intermediaries",
+                              ["industry", "country", "frequency", "strength"]).to_pandas()
+            base["country"] = base["country"].astype(str)
+        base.insert(0, "year", year)
+        bases.append(base)
+    base = pd.concat(bases, ignore_index=True)
+    base["industry"] = base["industry"].astype(str)
+    return metricas_hubs(base)
+
+
+def guardar_hubs(metricas, directorio=None):
+    """Escribe hubs_{nivel}.parquet de cada nivel en directorio (por defecto data/processed/hubs/)."""
+    directorio = Path(directorio or HUBS_DIR)
+    directorio.mkdir(parents=True, exist_ok=True)
+    for nivel in NIVELES:
+        if nivel in metricas:
+            metricas[nivel].to_parquet(directorio / f"hubs_{nivel}.parquet", index=False)
+    return directorio
+
+
+def verificar_hubs(n=20, anios=(2016, 2017), industrias=3, density=0.4, seed=0, atol=1e-9):
+    """
+    Compara las métricas de la tabla plana con el motor y con el cálculo por bucles de
+    ise_architect sobre matrices aleatorias: frecuencia y fuerza por industria con
+    intermediary_frequency/intermediary_strength, el score por industria con
+    intermediary_centrality y los hubs por año (idénticos) con los contadores por país.
+
+    Returns:
+    --------
+    dict
+        Resumen de la comparación ('ok', filas por nivel)
+
+    Raises:
+    -------
+    AssertionError
+        Si alguna frecuencia, fuerza, score o rango no coincide
+    """
+    from collections import defaultdict
+
+    from dependency_engine import calculate_all_dependencies_matrix, eliminar_filas_columnas_cero
+
+    rng = np.random.default_rng(seed)
+    codigos = [f"C{k:02d}" for k in range(n)]
+    caminos, bases, resultados = [], [], {}
+    for year in anios:
+        for k in range(industrias):
+            X = rng.pareto(1.5, size=(n, n))
+            X[rng.random(X.shape) > density] = 0.0
+            limpia = eliminar_filas_columnas_cero(X, country_names=codigos)
+            r = calculate_all_dependencies_matrix(limpia.values, limpia.columns.tolist(), max_possible_length=4)
+            industria = f"Industria {k}"
+            resultados[(year, industria)] = r
+            paths = pd.DataFrame({
+                "fuerza": [c["fuerza"] for c in r["critical_paths"]],
+                "intermediarios": [list(c["intermediarios"]) for c in r["critical_paths"]],
+            }).assign(year=year, industry=industria, significativo=True)
+            caminos.append(paths)
+            bases.append(intermediarios_por_industria(aplanar_caminos(paths), limpia.columns.tolist()))
+
+    # Base por industria desde la tabla plana frente al motor
+    base = pd.concat(bases, ignore_index=True)
+    for (year, industria), r in resultados.items():
+        b = base[(base["year"] == year) & (base["industry"] == industria)].set_index("country")
+        assert set(b.index) == set(r["intermediary_frequency"]), (year, industria)
+        for pais, f in r["intermediary_frequency"].items():
+            assert b.loc[pais, "frequency"] == f, (year, industria, pais)
+            assert np.isclose(b.loc[pais, "strength"], r["intermediary_strength"][pais], rtol=1e-12, atol=atol)
+
+    # Todo junto: aplanar varias industrias y años de una vez da la misma base
+    junta = intermediarios_por_industria(aplanar_caminos(pd.concat(caminos, ignore_index=True)))
+    unida = base[base["frequency"] > 0].merge(junta, on=["year", "industry", "country"])
+    assert len(unida) == len(junta) == (base["frequency"] > 0).sum()
+    assert (unida["frequency_x"] == unida["frequency_y"]).all()
+    assert np.allclose(unida["strength_x"], unida["strength_y"], rtol=1e-12, atol=atol)
+
+    # Base del motor (como la tabla intermediaries): niveles frente a los cálculos de referencia
+    base = pd.DataFrame([
+        {"year": year, "industry": industria, "country": c, "frequency": f, "strength": s}
+        for (year, industria), r in resultados.items() for c, f, s, _ in r["intermediary_centrality"]
+    ])
+    metricas = metricas_hubs(base)
+    for (year, industria), r in resultados.items():
+        h = metricas["industria"]
+        h = h[(h["year"] == year) & (h["industry"] == industria)].set_index("country")
+        for c, _, _, score in r["intermediary_centrality"]:
+            assert np.isclose(h.loc[c, "global_score"], score, rtol=1e-12, atol=atol), (year, industria, c)
+
+    for year in anios:
+        frecuencia, fuerza = defaultdict(int), defaultdict(float)
+        for (y, _), r in resultados.items():
+            if y != year:
+                continue
+            for c, f, s, _ in r["intermediary_centrality"]:
+                frecuencia[c] += f
+                fuerza[c] += s
+        ref = pd.DataFrame({"country": list(frecuencia), "frequency_total": list(frecuencia.values()),
+                            "strength_total": [fuerza[c] for c in frecuencia]})
+        ref["global_rank"] = (PESO_FRECUENCIA * ref["frequency_total"] / ref["frequency_total"].max()
+                              + PESO_FUERZA * ref["strength_total"] / ref["strength_total"].max()
+                              ).rank(ascending=False, method='min').astype(int)
+        obt = metricas["anual"][metricas["anual"]["year"] == year].set_index("country").loc[ref["country"]]
+        assert (obt["frequency_total"].to_numpy() == ref["frequency_total"].to_numpy()).all(), year
+        assert (obt["strength_total"].to_numpy() == ref["strength_total"].to_numpy()).all(), year
+        assert (obt["global_rank"].to_numpy() == ref["global_rank"].to_numpy()).all(), year
+
+    total = metricas["global"].set_index("country")
+    por_pais = base.groupby("country")[["frequency", "strength"]].sum()
+    assert (total.loc[por_pais.index, "frequency_total"] == por_pais["frequency"]).all()
+    assert np.allclose(total.loc[por_pais.index, "strength_total"], por_pais["strength"], rtol=1e-12, atol=atol)
+    return {"ok": True, **{nivel: len(t) for nivel, t in metricas.items()}}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hubs por industria, año y globales de los almacenes del motor")
+    parser.add_argument("years", nargs="+", type=int)
+    parser.add_argument("--desde-caminos", action="store_true",
+                        help="Recalcula frecuencia y fuerza desde paths en lugar de leer intermediaries")
+    parser.add_argument("--importador", help="Solo los caminos hacia este importador (implica --desde-caminos)")
+    parser.add_argument("--exportador", help="Solo los caminos desde este exportador (implica --desde-caminos)")
+    parser.add_argument("--resultados", help="Carpeta de los almacenes results_{año}")
+    parser.add_argument("--salida", default=str(HUBS_DIR))
+    args = parser.parse_args()
+
+    filtros = [(c, "==", v) for c, v in (("importer", args.importador), ("exporter", args.exportador)) if v]
+    inicio = time.perf_counter()
+    metricas = hubs_almacen(args.years, args.resultados, args.desde_caminos, filtros or None)
+    destino = guardar_hubs(metricas, args.salida)
+    print(metricas["global"].head(10).to_string(index=False))
+    print(f"\n HUBS COMPLETADOS ({time.perf_counter() - inicio:.1f} s): {destino}")
@@ -1,37 +1,31 @@
-import pickle
 from pathlib import Path
 
-def analyze_esp_2022():
-    pkl_path = Path("../../data/processed/dependencias_consolidadas/all_results_2022.pkl")
-    if not pkl_path.exists():
-        print(f"File not found: {pkl_path}")
-        return
+from results_store import leer_tabla, convertir_pkl
 
-    with open(pkl_path, "rb") as f:
-        data = pickle.load(f)
+def analyze_esp_2022():
+    processed_dir = Path("../../data/processed/dependencias_consolidadas")
+    store_dir = processed_dir / "results_2022"
+    if not store_dir.exists():
+        pkl_path = processed_dir / "all_results_2022.pkl"
+        if not pkl_path.exists():
+            print(f"File not found: {store_dir}")
+            return
+        convertir_pkl(pkl_path, store_dir)
 
-    results = []
-    for industry, content in data.items():
-        deps = content.get('results', {}).get('dependencies', [])
-        for dep in deps:
-            if dep.get('importador') == 'ESP':
-                # Solo nos interesan donde el riesgo indirecto sea relevante (>2%)
-                if dep.get('dependencia_indirecta', 0) > 0.02:
-                    results.append({
-                        'industry': industry,
-                        'exporter': dep.get('exportador'),
-                        'direct': dep.get('dependencia_directa', 0),
-                        'indirect': dep.get('dependencia_indirecta', 0),
-                        'total': dep.get('dependencia_total', 0)
-                    })
+    # Solo las filas de ESP donde el riesgo indirecto sea relevante (>2%)
+    deps = leer_tabla(
+        store_dir, "pairs",
+        columns=["industry", "exporter", "direct", "indirect", "total"],
+        filters=[("importer", "==", "ESP"), ("indirect", ">", 0.02)],
+    )
 
     # Ordenar por el componente indirecto más fuerte
-    results.sort(key=lambda x: x['indirect'], reverse=True)
+    deps = deps.sort_values("indirect", ascending=False, kind="stable")
 
     print(f"{'Industria':<50} | {'Exp':<5} | {'Directa':<8} | {'Indirecta':<10} | {'Total':<8}")
     print("-" * 95)
-    for r in results[:40]:  # Mostrar los top 40 casos
-        print(f"{str(r['industry'])[:50]:<50} | {r['exporter']:<5} | {r['direct']:<8.4f} | {r['indirect']:<10.4f} | {r['total']:<8.4f}")
+    for r in deps.head(40).itertuples():  # Mostrar los top 40 casos
+        print(f"{str(r.industry)[:50]:<50} | {str(r.exporter):<5} | {r.direct:<8.4f} | {r.indirect:<10.4f} | {r.total:<8.4f}")
 
 if __name__ == "__main__":
     analyze_esp_2022()
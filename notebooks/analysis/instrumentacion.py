@@ -0,0 +1,312 @@
+"""
+INSTRUMENTACIÓN DEL PIPELINE ISE
+Registros estructurados por etapa e industria (tiempo real, CPU, memoria pico, forma
+de la matriz tras la limpieza, número de caminos, longitud de convergencia...) para
+saber dónde se van las horas y los gigas de una ejecución del motor o del arquitecto.
+
+Cada registro es un dict plano que se añade, según se produce, a un JSON Lines en
+data/processed/_instrumentacion/{nombre}_{fecha}.jsonl, de modo que una ejecución
+interrumpida conserva lo medido hasta ese momento:
+
+    {"etapa": "industria", "industria": "...", "estado": "ok", "segundos": 12.3,
+     "cpu_segundos": 11.9, "rss_pico_mb": 812.0, "forma": [187, 187], "caminos": 5123, ...}
+
+    instr = Instrumentacion(f"motor_{anio}")
+    with instr.medir("carga_anio", anio=anio) as reg:
+        data = cargar_itp_anio(anio)
+        reg["filas"] = len(data)
+    instr.imprimir_resumen()
+
+muestreo activa un perfilador de muestreo: un número (segundos entre muestras) usa el
+muestreador de pila incluido (solo el hilo que abre las etapas, sin dependencias); también
+vale cualquier objeto con start()/stop(), p. ej. pyinstrument.Profiler().
+"""
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows: sin getrusage, las mediciones van sin memoria pico
+    resource = None
+
+BASE_PATH = Path(__file__).resolve().parent.parent.parent
+INSTRUMENTACION_DIR = BASE_PATH / "data" / "processed" / "_instrumentacion"
+
+
+def rss_pico_mb():
+    """
+    Memoria residente pico del proceso (ru_maxrss; bytes en macOS, KiB en Linux), o None
+    si el sistema no la ofrece (Windows).
+    """
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1 << 20) if sys.platform == "darwin" else pico / 1024
+
+
+def rss_actual_mb():
+    """Memoria residente actual (Linux, /proc/self/statm); None si no está disponible."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@contextmanager
+def medicion(**campos):
+    """
+    Mide el bloque y rellena un registro (dict) con tiempo, CPU y memoria.
+
+    No necesita una Instrumentacion: los procesos del bucle de industrias miden con
+    medicion() y devuelven el registro al proceso principal. Si el bloque lanza una
+    excepción, el registro queda con estado "error", el mensaje y la traza, y la
+    excepción se propaga.
+    """
+    registro = dict(campos)
+    registro.setdefault("estado", "ok")
+    pico_antes = rss_pico_mb()
+    inicio = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield registro
+    except BaseException as e:
+        registro["estado"] = "error"
+        registro["error"] = f"{type(e).__name__}: {e}"
+        registro["traza"] = traceback.format_exc()
+        raise
+    finally:
+        registro["segundos"] = round(time.perf_counter() - inicio, 4)
+        registro["cpu_segundos"] = round(time.process_time() - cpu, 4)
+        pico = rss_pico_mb()
+        if pico is not None:
+            registro["rss_pico_mb"] = round(pico, 1)
+            # Crecimiento del pico durante el bloque (0 si no superó el pico anterior)
+            registro["rss_pico_delta_mb"] = round(max(0.0, pico - pico_antes), 1)
+        actual = rss_actual_mb()
+        if actual is not None:
+            registro["rss_actual_mb"] = round(actual, 1)
+        registro["pid"] = os.getpid()
+
+
+def etapa(instrumentacion, nombre, **campos):
+    """instrumentacion.medir(nombre) o, si es None, un bloque sin medir (el registro se descarta)."""
+    if instrumentacion is None:
+        return nullcontext(dict(campos))
+    return instrumentacion.medir(nombre, **campos)
+
+
+def metricas_resultados(entrada):
+    """
+    Tamaño de los resultados de una industria (entrada de all_results): forma de la
+    matriz limpia, pares, caminos críticos y longitudes de convergencia.
+    """
+    results = entrada["results"]
+    longitudes = np.fromiter((d["longitud_optima"] for d in results["dependencies"]), dtype=np.int64)
+    return {
+        "forma": list(entrada["matrix_shape"]),
+        "pares": len(results["dependencies"]),
+        "caminos": len(results["critical_paths"]),
+        "longitud_media": round(float(longitudes.mean()), 3) if len(longitudes) else None,
+        "longitud_max": int(longitudes.max()) if len(longitudes) else None,
+        "distribucion_longitud": np.asarray(results["length_distribution"]).astype(int).tolist(),
+    }
+
+
+class MuestreadorPila:
+    """
+    Perfilador de muestreo mínimo: un hilo lee cada intervalo la pila del hilo medido
+    (sys._current_frames) y cuenta, por etapa activa, la función en ejecución (propia) y
+    todas las de la pila (inclusiva).
+    """
+
+    def __init__(self, intervalo=0.005, hilo=None):
+        self.intervalo = intervalo
+        self.hilo = hilo if hilo is not None else threading.get_ident()
+        self.etiqueta = None
+        self.propias = Counter()
+        self.inclusivas = Counter()
+        self.muestras = Counter()
+        self._parar = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _nombre(frame):
+        code = frame.f_code
+        return f"{Path(code.co_filename).name}:{code.co_name}"
+
+    def _bucle(self):
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self.hilo)
+            etiqueta = self.etiqueta
+            if frame is None or etiqueta is None:
+                continue
+            self.muestras[etiqueta] += 1
+            self.propias[(etiqueta, self._nombre(frame))] += 1
+            vistas = set()
+            while frame is not None:
+                vistas.add(self._nombre(frame))
+                frame = frame.f_back
+            for nombre in vistas:
+                self.inclusivas[(etiqueta, nombre)] += 1
+
+    def start(self):
+        if self._thread is None:
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._bucle, name="muestreador_ise", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._parar.set()
+            self._thread.join()
+            self._thread = None
+
+    def top(self, etiqueta, n=5, inclusivo=False):
+        """[(función, fracción de muestras)] de una etapa."""
+        total = self.muestras.get(etiqueta, 0)
+        if not total:
+            return []
+        contador = self.inclusivas if inclusivo else self.propias
+        filas = [(nombre, c) for (e, nombre), c in contador.items() if e == etiqueta]
+        filas.sort(key=lambda x: -x[1])
+        return [(nombre, round(c / total, 3)) for nombre, c in filas[:n]]
+
+
+class Instrumentacion:
+    """
+    Colección de registros de una ejecución (motor de un año, arquitecto...).
+
+    Parameters:
+    -----------
+    nombre : str
+        Prefijo del fichero de registros (p. ej. "motor_2016")
+    directorio : Path, opcional
+        Carpeta del JSON Lines; guardar=False solo los conserva en memoria
+    muestreo : float u objeto con start()/stop(), opcional
+        Perfilador de muestreo durante las etapas medidas (ver docstring del módulo)
+    """
+
+    def __init__(self, nombre, directorio=None, guardar=True, muestreo=None):
+        self.nombre = nombre
+        self.registros = []
+        self.ruta = None
+        if guardar:
+            directorio = Path(directorio or INSTRUMENTACION_DIR)
+            directorio.mkdir(parents=True, exist_ok=True)
+            self.ruta = directorio / f"{nombre}_{datetime.now():%Y%m%d-%H%M%S}.jsonl"
+        if isinstance(muestreo, (int, float)) and not isinstance(muestreo, bool):
+            self.perfilador = MuestreadorPila(muestreo)
+        else:
+            self.perfilador = muestreo
+        self._pila = []
+        if self.perfilador is not None:
+            self.perfilador.start()
+
+    def registrar(self, registro):
+        """Añade un registro ya medido (p. ej. devuelto por un proceso del bucle de industrias)."""
+        registro = {"ejecucion": self.nombre, "instante": datetime.now().isoformat(timespec="seconds"), **registro}
+        self.registros.append(registro)
+        if self.ruta is not None:
+            with open(self.ruta, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+        return registro
+
+    @contextmanager
+    def medir(self, nombre, **campos):
+        """Mide un bloque como etapa nombre; el registro se guarda también si falla."""
+        self._pila.append(nombre)
+        if isinstance(self.perfilador, MuestreadorPila):
+            self.perfilador.etiqueta = nombre
+        registro = None
+        try:
+            with medicion(etapa=nombre, **campos) as registro:
+                yield registro
+        finally:
+            self._pila.pop()
+            if isinstance(self.perfilador, MuestreadorPila):
+                self.perfilador.etiqueta = self._pila[-1] if self._pila else None
+                if registro is not None:
+                    registro.setdefault("perfil", self.perfilador.top(nombre, 5))
+            if registro is not None:
+                self.registrar(registro)
+
+    def cerrar(self):
+        """Detiene el perfilador de muestreo (si lo hay)."""
+        if self.perfilador is not None:
+            self.perfilador.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        self.cerrar()
+
+    def dataframe(self):
+        return pd.DataFrame(self.registros)
+
+    def resumen(self, n=10):
+        """
+        Returns:
+        --------
+        dict
+            'etapas': tiempo, CPU y memoria agregados por etapa;
+            'industrias_lentas': las n industrias con más tiempo;
+            'errores': registros con estado "error"
+        """
+        df = self.dataframe()
+        if df.empty:
+            vacio = pd.DataFrame()
+            return {"etapas": vacio, "industrias_lentas": vacio, "errores": vacio}
+        agregados = {
+            "registros": ("segundos", "size"),
+            "segundos": ("segundos", "sum"),
+            "cpu_segundos": ("cpu_segundos", "sum"),
+        }
+        if "rss_pico_mb" in df.columns:  # sin resource (Windows) no hay memoria pico
+            agregados["rss_pico_mb"] = ("rss_pico_mb", "max")
+        etapas = df.groupby("etapa", sort=False).agg(**agregados).sort_values("segundos", ascending=False)
+
+        industrias = pd.DataFrame()
+        if "industria" in df.columns:
+            por_industria = df[df["industria"].notna()]
+            columnas = [c for c in ("etapa", "industria", "estado", "segundos", "cpu_segundos", "rss_pico_mb",
+                                    "forma", "densidad", "ruta_motor", "pares", "caminos",
+                                    "longitud_media") if c in por_industria.columns]
+            industrias = por_industria.nlargest(n, "segundos")[columnas].reset_index(drop=True)
+
+        errores = df[df["estado"] == "error"]
+        errores = errores[[c for c in ("etapa", "industria", "error") if c in errores.columns]].reset_index(drop=True)
+        return {"etapas": etapas, "industrias_lentas": industrias, "errores": errores}
+
+    def imprimir_resumen(self, n=10):
+        resumen = self.resumen(n)
+        print(f"\n{'='*80}\n⏱️  Instrumentación: {self.nombre}" + (f" ({self.ruta})" if self.ruta else ""))
+        if not resumen["etapas"].empty:
+            print("\nPor etapa:")
+            print(resumen["etapas"].round(2).to_string())
+        if not resumen["industrias_lentas"].empty:
+            print(f"\nIndustrias más lentas (top {n}):")
+            print(resumen["industrias_lentas"].to_string())
+        if not resumen["errores"].empty:
+            print(f"\n⚠️ Registros con error ({len(resumen['errores'])}):")
+            print(resumen["errores"].to_string())
+        print(f"{'='*80}")
+        return resumen
+
+
+def cargar_registros(ruta):
+    """Registros de un JSON Lines de instrumentación como DataFrame."""
+    with open(ruta, encoding="utf-8") as f:
+        return pd.DataFrame([json.loads(linea) for linea in f if linea.strip()])
@@ -1,277 +1,458 @@
 import pandas as pd
 import numpy as np
-import pickle
 from pathlib import Path
+import argparse
 import sys
-from collections import defaultdict
 
-def process_year(year):
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from joblib import Parallel, delayed
+
+from instrumentacion import Instrumentacion, etapa
+from manifiesto import Manifiesto
+from results_store import ruta_resultados, iterar_industrias, convertir_pkl, parametros_almacen
+from historico_store import CLAVES_ORDEN, PAIS_PRIORITARIO, PODA_EXPLORADOR, escribir_ordenado, ruta_indice
+import hubs as modulo_hubs
+from agregados import parciales_perfiles, perfiles_desde_parciales
+
+TABLAS_HISTORICO = ("hubs", "critical", "profiles", "dependencies", "bilateral", "explorer")
+
+def _texto(serie):
+    """Columna categórica del almacén → texto (como en las tablas históricas)."""
+    return serie.astype(str)
+
+class _EscritorHistorico:
+    """
+    Tabla de historico escrita por trozos (un row group por industria) y renombrada al
+    cerrar. Con claves, al cerrar se reescribe ordenada por (importador, industria) con
+    su índice de desplazamientos (historico_store.escribir_ordenado).
+    """
+
+    def __init__(self, path, claves=None):
+        self.path = Path(path)
+        self.temporal = self.path.with_name(self.path.name + ".parcial")
+        self.claves = claves
+        self.writer = None
+
+    def escribir(self, df):
+        if df.empty:
+            return
+        tabla = pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.temporal, tabla.schema)
+        else:
+            tabla = tabla.cast(self.writer.schema)
+        self.writer.write_table(tabla)
+
+    def cerrar(self, descartar=False):
+        if self.writer is not None:
+            self.writer.close()
+        elif not descartar:
+            pd.DataFrame().to_parquet(self.temporal, index=False)
+        if descartar:
+            self.temporal.unlink(missing_ok=True)
+        elif self.claves is not None:
+            # El explorador de un año son como mucho 20 proveedores por importador e
+            # industria: cabe en memoria para ordenarlo una vez
+            escribir_ordenado(pq.read_table(self.temporal), self.path, self.claves)
+            self.temporal.unlink()
+        else:
+            self.temporal.replace(self.path)
+
+# ==================== PERFILES DE PAS ====================
+
+def _hubs_desde_intermediarios(intermediarios, year):
+    """Tabla hubs del año a partir de las tablas intermediaries (Arrow) de cada industria."""
+    if not intermediarios:
+        return pd.DataFrame(columns=["country", "frequency_total", "strength_total"])
+    base = pa.concat_tables(intermediarios).to_pandas()
+    base["country"] = _texto(base["country"])
+    hubs = modulo_hubs.metricas_hubs(base)["global"]
+    hubs["year"] = year
+    return hubs
+
+def calcular_perfiles(pairs, year):
+    """
+    Perfiles de país (vulnerabilidad, share indirecto, proveedores efectivos, importancia).
+
+    Misma definición que la agregación original con groupby.apply, pero con sumas por
+    grupo sobre la tabla de pares (sin funciones Python por país ni por industria):
+    - vulnerability / indirect: medias ponderadas por trade_value del importador
+    - num_suppliers_effective: media de 1/HHI por industria ponderada por el comercio
+      total de la industria (HHI sobre las dependencias normalizadas del importador)
+    - importance: media de dependencia ponderada por trade_value del exportador
+    """
+    return perfiles_desde_parciales(*parciales_perfiles(pairs), year)
+
+# ==================== TABLAS DE UNA INDUSTRIA ====================
+
+def _top_por_grupo(grupo, valores, n_top):
+    """
+    Posiciones de las n_top filas de mayor valor de cada grupo, por grupo y valor
+    descendente con los empates en el orden de las filas: lo mismo que
+    sort_values([grupo, valor], kind="stable") + groupby(grupo).head(n_top), pero con
+    un argpartition por grupo (los grupos se colocan como filas de una matriz) y solo
+    las n_top elegidas de cada grupo se ordenan.
+
+    Returns:
+    --------
+    tuple
+        (posiciones en valores, puesto 0..n_top-1 de cada una dentro de su grupo)
+    """
+    if len(grupo) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    orden = np.argsort(grupo, kind="stable")
+    g = grupo[orden]
+    tam = np.bincount(g)
+    inicio = np.cumsum(tam) - tam
+    columna = np.arange(len(g)) - inicio[g]
+    matriz = np.full((len(tam), tam.max()), -np.inf)
+    matriz[g, columna] = valores[orden]
+    valida = np.zeros(matriz.shape, dtype=bool)
+    valida[g, columna] = True
+
+    if matriz.shape[1] > n_top:
+        # n_top-ésimo mayor de cada grupo: entran los mayores y, de los iguales, los primeros
+        umbral = -np.partition(-matriz, n_top - 1, axis=1)[:, n_top - 1:n_top]
+        mayor = matriz > umbral
+        igual = matriz == umbral
+        hueco = n_top - mayor.sum(axis=1, keepdims=True)
+        elegida = (mayor | (igual & (np.cumsum(igual, axis=1) <= hueco))) & valida
+    else:
+        elegida = valida
+    filas, columnas = np.nonzero(elegida)
+    orden_top = np.lexsort((columnas, -matriz[filas, columnas], filas))
+    filas, columnas = filas[orden_top], columnas[orden_top]
+    puesto = np.arange(len(filas)) - np.searchsorted(filas, filas)
+    return orden[inicio[filas] + columnas], puesto
+
+
+def _explorador_industria(pairs, meta, paths, has_best_paths, poda=PODA_EXPLORADOR):
+    """
+    Filas de explorer de una industria: HHI y proveedores efectivos por importador,
+    los top_arquitecto proveedores de cada uno y la ruta principal de cada par, todo
+    con operaciones por grupo sobre las columnas de pairs y paths. La poda del
+    dashboard (top_proveedores con dep_total >= 1% para España y 5% para el resto) se
+    marca en la misma pasada en la columna dashboard.
+    """
+    importador, importadores = pd.factorize(pairs["importer"], sort=False)
+    total = pairs["total"].to_numpy(np.float64)
+
+    # Concentración HHI por importador, solo sobre proveedores con dependencia > 0
+    valido = np.where(total > 0, total, 0.0)
+    total_imp = np.bincount(importador, weights=valido, minlength=len(importadores))
+    cuota = valido / np.where(total_imp > 0, total_imp, 1.0)[importador]
+    hhi = np.bincount(importador, weights=np.where(valido > 0, cuota ** 2, 0.0), minlength=len(importadores))
+    hhi = np.where(total_imp > 0, hhi, 1.0)
+
+    # Top proveedores por importador (orden estable por dependencia total)
+    filas, puesto = _top_por_grupo(importador, total, poda["top_arquitecto"])
+    exp_df = pairs.iloc[filas][["industry", "importer", "exporter", "direct", "indirect", "total"]] \
+        .reset_index(drop=True)
+
+    # Ruta principal por par: primera best_path (path_search) o, en almacenes sin
+    # best_paths, el primero de los caminos significativos más fuertes
+    claves = ["exporter", "importer"]
+    if has_best_paths:
+        top = meta[meta["mejor"]]
+        top = top[~top.duplicated(claves)]
+        posiciones = top.index.to_numpy()
+    else:
+        significativos = meta[meta["significativo"]]
+        posiciones = significativos.groupby(claves, sort=False)["fuerza"].idxmax().to_numpy()
+        top = meta.loc[posiciones]
+    intermediarios = pc.binary_join(paths.column("intermediarios").take(pa.array(posiciones, type=pa.int64())), "  ")
+    top = pd.DataFrame({
+        "exporter": top["exporter"].to_numpy(),
+        "importer": top["importer"].to_numpy(),
+        "fuerza": top["fuerza"].to_numpy(),
+        "top_intermediary": intermediarios.to_numpy(zero_copy_only=False),
+    })
+    exp_df = exp_df.merge(top, on=claves, how="left")
+
+    dep_total = exp_df["total"].round(4)
+    minimo = np.where(exp_df["importer"].to_numpy() == PAIS_PRIORITARIO, poda["min_dep_esp"], poda["min_dep_mundo"])
+    codigo = importador[filas]
+    return pd.DataFrame({
+        "importer": exp_df["importer"],
+        "exporter": exp_df["exporter"],
+        "industry": exp_df["industry"],
+        "dep_total": dep_total,
+        "dep_direct": exp_df["direct"].round(4),
+        "dep_indirect": exp_df["indirect"].round(4),
+        "top_intermediary": exp_df["top_intermediary"].fillna(""),
+        "path_strength": exp_df["fuerza"].fillna(0.0).round(4),
+        "hhi_sector": pd.Series(hhi[codigo]).round(4),
+        "eff_suppliers_sector": pd.Series(1.0 / hhi[codigo]).round(2),
+        "dashboard": (puesto < poda["top_proveedores"]) & (dep_total.to_numpy() >= minimo),
+    })
+
+
+def _tablas_industria(info, tablas, year):
+    """
+    Filas de critical, bilateral y explorer, candidatas del treemap y sumas parciales
+    de los perfiles de una industria del almacén.
+    """
+    industry = info["industry"]
+    pairs = tablas["pairs"].to_pandas()
+    for col in ("importer", "exporter"):
+        pairs[col] = _texto(pairs[col])
+    pairs["industry"] = industry
+
+    # Caminos por par (la lista de intermediarios solo se materializa para el explorador)
+    paths = tablas["paths"]
+    meta = paths.select(["exporter", "importer", "fuerza", "significativo", "mejor"]).to_pandas()
+    for col in ("exporter", "importer"):
+        meta[col] = _texto(meta[col])
+    num_paths_idx = meta[meta["significativo"]].groupby(["exporter", "importer"]).size()
+
+    def contar_caminos(df):
+        idx = pd.MultiIndex.from_arrays([df["exporter"], df["importer"]])
+        return num_paths_idx.reindex(idx, fill_value=0).to_numpy()
+
+    # 3. RELACIONES CRTICAS (Con Redundancia Real)
+    # Reconstruimos la lgica de criticidad: Dep >= 0.7 y Caminos < 3
+    # Broaden threshold for better distribution in chart (Dep >= 0.5, any paths)
+    crit = pairs[pairs["total"] >= 0.5]
+    num_paths = contar_caminos(crit)
+    df_critical = pd.DataFrame({
+        "year": year,
+        "industry": crit["industry"].to_numpy(),
+        "exportador": crit["exporter"].to_numpy(),
+        "importador": crit["importer"].to_numpy(),
+        "dependencia_total": crit["total"].to_numpy(),
+        "dependencia_directa": crit["direct"].to_numpy(),
+        "dependencia_indirecta": crit["indirect"].to_numpy(),
+        "hidden_risk_factor": crit["indirect"].to_numpy() / (crit["total"].to_numpy() + 1e-9),
+        "hidden_risk_abs": crit["total"].to_numpy() - crit["direct"].to_numpy(),
+        "caminos_alternativos": num_paths,
+        "criticidad": 1 - (np.minimum(num_paths, 3) / 3)
+    })
+
+    # 4. Top dependencias para Treemap: las 15 principales por pas de esta industria
+    # (el año entero solo puede quedarse con candidatas que ya estén en su top 15)
+    df_ind_deps = pd.DataFrame({
+        "dependent_country": pairs["importer"].to_numpy(),
+        "industry": pairs["industry"].to_numpy(),
+        "dependency_value": pairs["total"].to_numpy()
+    })
+    df_ind_deps = df_ind_deps.sort_values('dependency_value', ascending=False, kind="stable") \
+        .groupby('dependent_country').head(15)
+
+    # Bilat (solo si es significativa)
+    bilat = pairs[pairs["total"] > 0.05]
+    num_paths = contar_caminos(bilat)
+    df_bilat = pd.DataFrame({
+        "exporter": bilat["exporter"].to_numpy(),
+        "importer": bilat["importer"].to_numpy(),
+        "industry": bilat["industry"].to_numpy(),
+        "criticidad": np.where(bilat["total"].to_numpy() >= 0.7, 1 - (num_paths / 3), 0.0),
+        "dependency": bilat["total"].to_numpy()
+    })
+
+    # 4b. EXPLORADOR POR INDUSTRIA: Proveedores por importador con su ruta principal
+    df_explorer = _explorador_industria(pairs, meta, paths, info["has_best_paths"])
+
+    return {
+        "critical": df_critical,
+        "bilateral": df_bilat,
+        "explorer": df_explorer,
+        "dependencies": df_ind_deps,
+        "perfiles": parciales_perfiles(pairs),
+    }
+
+# ==================== AO COMPLETO ====================
+
+def process_year(year, forzar=False, instrumentacion=None, muestreo=None, bloques=None, neto_bloques=True):
+    """
+    Tablas de historico de un año desde su almacén results_{year}/.
+
+    bloques (nombres de bloques.BLOQUES o {bloque: países}) añade a profiles y hubs una
+    fila por bloque (is_bloc=True) calculada contrayendo las matrices de cada industria
+    (bloques.py); neto_bloques=False conserva los flujos internos del bloque.
+    """
     print(f"\n--- ARQUITECTO ISE: Procesando ao {year} ---")
-    
+
     # Buscar la raz del proyecto
     base_path = Path.cwd()
     while base_path.name != "Seguridad Economica" and base_path.parent != base_path:
         base_path = base_path.parent
+
+    # Registros por etapa e industria en data/processed/_instrumentacion/historico_{year}_*.jsonl
+    propia = instrumentacion is None
+    if propia:
+        instrumentacion = Instrumentacion(f"historico_{year}", base_path / "data" / "processed" / "_instrumentacion",
+                                          muestreo=muestreo)
+    try:
+        with instrumentacion.medir("arquitecto", anio=year) as registro:
+            registro["estado"] = _process_year(year, forzar, base_path, instrumentacion, bloques, neto_bloques)
+    finally:
+        if propia:
+            instrumentacion.cerrar()
+            instrumentacion.imprimir_resumen(5)
+    return registro["estado"] != "sin_resultados"
+
+
+def _process_year(year, forzar, base_path, instrumentacion, bloques=None, neto_bloques=True):
     processed_dir = base_path / "data" / "processed" / "dependencias_consolidadas"
     output_dir = base_path / "data" / "processed" / "historico"
     output_dir.mkdir(parents=True, exist_ok=True)
-    
-    # 1. Cargar el PKL oficial del motor
-    pkl_path = processed_dir / f"all_results_{year}.pkl"
-    if not pkl_path.exists():
-        # Fallback por si acaso
-        pkl_path = processed_dir / "all_results.pkl"
+
+    # 1. Abrir el almacén columnar del motor (results_{year}/)
+    store_dir = ruta_resultados(year, processed_dir)
+    if not store_dir.exists():
+        # PKL de ejecuciones anteriores: se migra una vez al almacén
+        pkl_path = processed_dir / f"all_results_{year}.pkl"
         if not pkl_path.exists():
-            print(f" Error: No se encuentra el archivo de resultados para {year}")
-            return False
-            
-    print(f"[*] Cargando {pkl_path}...")
-    with open(pkl_path, "rb") as f:
-        all_results = pickle.load(f)
-    print(f" Cargadas {len(all_results)} industrias")
-
-    # 2. Calcular HUBS GLOBALES (Frecuencia y Fuerza)
-    print("[*] Calculando Hubs...")
-    freq_counter = defaultdict(int)
-    strength_counter = defaultdict(float)
-    
-    for industry, data in all_results.items():
-        res = data.get('results', {})
-        for country, f in res.get('intermediary_frequency', {}).items():
-            freq_counter[country] += f
-        for country, s in res.get('intermediary_strength', {}).items():
-            strength_counter[country] += s
-            
-    hubs = pd.DataFrame({
-        "country": list(freq_counter.keys()),
-        "frequency_total": [freq_counter[c] for c in freq_counter.keys()],
-        "strength_total": [strength_counter[c] for c in freq_counter.keys()],
-    })
-    
-    # Normalizacin para el score de Hubs
-    if not hubs.empty:
-        max_f = hubs["frequency_total"].max()
-        max_s = hubs["strength_total"].max()
-        hubs["freq_norm"] = hubs["frequency_total"] / max_f if max_f > 0 else 0
-        hubs["strength_norm"] = hubs["strength_total"] / max_s if max_s > 0 else 0
-        hubs["global_score"] = (0.4 * hubs["freq_norm"]) + (0.6 * hubs["strength_norm"])
-        hubs["global_rank"] = hubs["global_score"].rank(ascending=False, method='min').astype(int)
-        hubs = hubs.sort_values("global_score", ascending=False)
-        hubs["year"] = year
-
-    # 3. Calcular RELACIONES CRTICAS (Con Redundancia Real)
-    print("[*] Identificando Relaciones de Riesgo...")
-    critical_links = []
-    
-    for industry, data in all_results.items():
-        # Reconstruimos la lgica de criticidad: Dep >= 0.7 y Caminos < 3
-        # El motor ya calcul dependencies y significant_paths
-        # Broaden threshold for better distribution in chart (Dep >= 0.5, any paths)
-        for dep in data['results']['dependencies']:
-            if dep['dependencia_total'] >= 0.5:
-                # Contar caminos alternativos
-                pair_key = f"{dep['exportador']}->{dep['importador']}"
-                num_paths = len(data['results']['critical_intermediaries'].get(pair_key, []))
-                
-                critical_links.append({
-                    "year": year,
-                    "industry": industry,
-                    "exportador": dep['exportador'],
-                    "importador": dep['importador'],
-                    "dependencia_total": dep['dependencia_total'],
-                    "dependencia_directa": dep['dependencia_directa'],
-                    "dependencia_indirecta": dep['dependencia_indirecta'],
-                    "hidden_risk_factor": dep['dependencia_indirecta'] / (dep['dependencia_total'] + 1e-9),
-                    "hidden_risk_abs": dep['dependencia_total'] - dep['dependencia_directa'],
-                    "caminos_alternativos": num_paths,
-                    "criticidad": 1 - (min(num_paths, 3) / 3)
-                })
-    
-    df_critical = pd.DataFrame(critical_links)
-
-    # 4. TRABAJO DE DETALLE: Dependencias por Industria y Bilaterales
-    print("[*] Extrayendo detalle por industria y bilateral...")
-    industry_deps = []
-    bilateral_risk = []
-    
-    for industry, data in all_results.items():
-        # Top dependencias para Treemap
-        for dep in data['results']['dependencies']:
-            industry_deps.append({
-                "dependent_country": dep['importador'],
-                "industry": industry,
-                "dependency_value": dep['dependencia_total']
-            })
-            
-            # Bilat (solo si es significativa)
-            if dep['dependencia_total'] > 0.05:
-                # Buscar si es crtica para el indicador de proveedores
-                pair_key = f"{dep['exportador']}->{dep['importador']}"
-                num_paths = len(data['results']['critical_intermediaries'].get(pair_key, []))
-                bilateral_risk.append({
-                    "exporter": dep['exportador'],
-                    "importer": dep['importador'],
-                    "industry": industry,
-                    "criticidad": 1 - (num_paths / 3) if dep['dependencia_total'] >= 0.7 else 0,
-                    "dependency": dep['dependencia_total']
-                })
-
-    df_ind_deps = pd.DataFrame(industry_deps)
-    # Nos quedamos solo con las 15 principales por pas para no saturar el JSON
-    df_ind_deps = df_ind_deps.sort_values('dependency_value', ascending=False).groupby('dependent_country').head(15)
-    
-    df_bilat = pd.DataFrame(bilateral_risk)
-
-    # 4b. EXPLORADOR POR INDUSTRIA: Proveedores por pas/industria con caminos
-    print("[*] Generando explorador por industria...")
-    industry_explorer = []
-    
-    for industry, data in all_results.items():
-        deps = data['results']['dependencies']
-        paths = data['results']['critical_paths']
-        
-        # Indexar caminos para bsqueda rpida: (importador, exportador) -> lista de caminos
-        paths_idx = defaultdict(list)
-        for p in paths:
-            paths_idx[(p['importador'], p['exportador'])].append(p)
-        
-        # Agrupar dependencias por importador
-        by_importer = defaultdict(list)
-        for dep in deps:
-            by_importer[dep['importador']].append(dep)
-        
-        # Para cada importador, calcular su HHI específico en esta industria
-        for importer, importer_deps in by_importer.items():
-            # Concentración HHI = suma de cuadrados de las cuotas de mercado (0-1)
-            # Solo sobre proveedores con dependencia > 0
-            valid_deps = [d['dependencia_total'] for d in importer_deps if d['dependencia_total'] > 0]
-            if valid_deps:
-                # Normalizar para que sumen 1 (análisis de cuota de mercado relativa de los proveedores)
-                total_cat = sum(valid_deps)
-                hhi = sum([(v/total_cat)**2 for v in valid_deps])
-                eff_suppliers = 1.0 / hhi
-            else:
-                hhi = 1.0
-                eff_suppliers = 1.0
-
-            importer_deps.sort(key=lambda x: x['dependencia_total'], reverse=True)
-            for dep in importer_deps[:20]:
-                pair_paths = paths_idx.get((importer, dep['exportador']), [])
-                top_path = ""
-                path_strength = 0.0
-                if pair_paths:
-                    best = max(pair_paths, key=lambda x: x['fuerza'])
-                    top_path = "  ".join(best['intermediarios'])
-                    path_strength = best['fuerza']
-                
-                industry_explorer.append({
-                    "importer": importer,
-                    "exporter": dep['exportador'],
-                    "industry": industry,
-                    "dep_total": round(dep['dependencia_total'], 4),
-                    "dep_direct": round(dep['dependencia_directa'], 4),
-                    "dep_indirect": round(dep['dependencia_indirecta'], 4),
-                    "top_intermediary": top_path,
-                    "path_strength": round(path_strength, 4),
-                    "hhi_sector": round(hhi, 4),
-                    "eff_suppliers_sector": round(eff_suppliers, 2)
-                })
-    
-    df_explorer = pd.DataFrame(industry_explorer)
-
-    # 5. Calcular PERFILES DE PAS (Vulnerabilidad e Importancia)
+            # Fallback por si acaso
+            pkl_path = processed_dir / "all_results.pkl"
+            if not pkl_path.exists():
+                print(f" Error: No se encuentra el archivo de resultados para {year}")
+                return "sin_resultados"
+        print(f"[*] Migrando {pkl_path} a {store_dir}...")
+        with etapa(instrumentacion, "arquitecto.migracion_pkl", anio=year):
+            convertir_pkl(pkl_path, store_dir)
+
+    # Nada que hacer si el almacén (por contenido) y este script no han cambiado desde la
+    # última ejecución y las seis tablas siguen como se escribieron
+    manifiesto = Manifiesto(f"historico_{year}", base_path / "data" / "processed" / "_manifiesto")
+    parametros = {"year": year, "poda_explorador": PODA_EXPLORADOR}
+    # Código que da forma a las tablas: este script, hubs, los perfiles (agregados), la
+    # escritura ordenada con índice (historico_store) y la lectura del almacén (results_store)
+    fuentes = [store_dir, Path(__file__).resolve(), Path(modulo_hubs.__file__).resolve(),
+               Path(__file__).resolve().with_name("agregados.py"),
+               Path(__file__).resolve().with_name("historico_store.py"),
+               Path(__file__).resolve().with_name("results_store.py")]
+    acumulador_bloques = None
+    if bloques:
+        # Import diferido: bloques.py solo se carga si se piden bloques
+        import bloques as modulo_bloques
+        mapeo = modulo_bloques.crear_mapeo(bloques)
+        acumulador_bloques = modulo_bloques.AcumuladorBloques(mapeo, neto_bloques, parametros_almacen(store_dir))
+        parametros["bloques"] = sorted(set(mapeo.values()))
+        parametros["neto_bloques"] = neto_bloques
+        fuentes.append(Path(modulo_bloques.__file__).resolve())
+    with etapa(instrumentacion, "arquitecto.manifiesto", anio=year) as registro:
+        entradas = manifiesto.huellas(fuentes)
+        salidas = [output_dir / f"{nombre}_{year}.parquet" for nombre in TABLAS_HISTORICO]
+        salidas += [ruta_indice(output_dir / f"{nombre}_{year}.parquet") for nombre in CLAVES_ORDEN]
+        registro["al_dia"] = not forzar and manifiesto.al_dia(entradas, parametros, salidas)
+    if registro["al_dia"]:
+        print(f" {year} al día (sin cambios en {store_dir.name}): se omite")
+        return "omitido"
+
+    # Una sola pasada por industria: cada row group del almacén alimenta las seis tablas.
+    # critical, bilateral y explorer se escriben según se calculan; del resto solo se
+    # guardan acumulados acotados (contadores de hubs, top 15 por país, sumas de perfiles)
+    print(f"[*] Recorriendo {store_dir} por industria...")
+    escritores = {
+        nombre: _EscritorHistorico(output_dir / f"{nombre}_{year}.parquet", CLAVES_ORDEN.get(nombre))
+        for nombre in ("critical", "bilateral", "explorer")
+    }
+    columnas = {
+        "pairs": ["importer", "exporter", "trade_value", "direct", "indirect", "total"],
+        "paths": ["exporter", "importer", "fuerza", "intermediarios", "significativo", "mejor"],
+        "intermediaries": ["country", "frequency", "strength"],
+    }
+    intermediarios = []
+    df_ind_deps = None
+    parciales_imp, parciales_exp = [], []
+    num_industrias = 0
+
+    try:
+        for info, tablas in iterar_industrias(store_dir, columnas, pandas=False):
+            num_industrias += 1
+            with etapa(instrumentacion, "arquitecto.industria", anio=year, industria=info["industry"],
+                       pares=tablas["pairs"].num_rows, caminos=tablas["paths"].num_rows):
+                # 2. HUBS GLOBALES (Frecuencia y Fuerza): se suman al final, todas las industrias a la vez
+                intermediarios.append(tablas["intermediaries"])
+
+                salida = _tablas_industria(info, tablas, year)
+                for nombre, escritor in escritores.items():
+                    escritor.escribir(salida[nombre])
+
+                # Nos quedamos solo con las 15 principales por pas para no saturar el JSON
+                if df_ind_deps is not None:
+                    salida["dependencies"] = pd.concat([df_ind_deps, salida["dependencies"]])
+                df_ind_deps = salida["dependencies"].sort_values('dependency_value', ascending=False, kind="stable") \
+                    .groupby('dependent_country').head(15)
+
+                imp, exp = salida["perfiles"]
+                parciales_imp.append(imp)
+                parciales_exp.append(exp)
+
+                if acumulador_bloques is not None:
+                    with etapa(instrumentacion, "arquitecto.bloques", anio=year, industria=info["industry"]):
+                        acumulador_bloques.agregar(info, tablas["pairs"])
+            print(f"\r Industrias procesadas: {num_industrias}", end="", flush=True)
+    except BaseException:
+        for escritor in escritores.values():
+            escritor.cerrar(descartar=True)
+        raise
+    print(f"\n Procesadas {num_industrias} industrias")
+
+    # Hubs del año: suma por país de las filas de intermediaries de cada industria (en
+    # orden de industria) y score 0.4 · freq_norm + 0.6 · strength_norm (hubs.metricas_hubs)
+    hubs = _hubs_desde_intermediarios(intermediarios, year)
+
+    # 5. PERFILES DE PAS (Vulnerabilidad e Importancia) a partir de las sumas por industria
     print("[*] Generando Perfiles de Pas...")
-    country_stats = []
-    
-    for industry, data in all_results.items():
-        for dep in data['results']['dependencies']:
-            # Dato para vulnerabilidad (importador)
-            # Calculamos HHI por industria/importador para agregar despues
-            country_stats.append({
-                "country": dep['importador'],
-                "industry": industry,
-                "vulnerability": dep['dependencia_total'],
-                "indirect": dep['dependencia_indirecta'],
-                "trade_weight": dep['trade_value'],
-                "role": "importer"
-            })
-            # Dato para importancia (exportador)
-            country_stats.append({
-                "country": dep['exportador'],
-                "importance": dep['dependencia_total'],
-                "trade_weight": dep['trade_value'],
-                "role": "exporter"
-            })
-
-    df_stats = pd.DataFrame(country_stats)
-    
-    # Agregacin por pas (Importador - Vulnerabilidad)
-    df_importers = df_stats[df_stats['role'] == "importer"]
-    
-    def agg_importer(x):
-        if x['trade_weight'].sum() == 0: 
-            return pd.Series([0, 0, 0], index=['vulnerability', 'indirect_share', 'num_suppliers_effective'])
-        
-        # 1. Vulnerabilidad media ponderada por el peso del comercio de la industria
-        vul = np.average(x['vulnerability'], weights=x['trade_weight'])
-        
-        # 2. Share indirecto
-        indirs = np.average(x['indirect'], weights=x['trade_weight'])
-        ind_share = indirs / vul if vul > 0 else 0
-        
-        # 3. PROVEEDORES EFECTIVOS (CORREGIDO):
-        # Primero calculamos el HHI por industria dentro de este país
-        def get_hhi_sector(sub):
-            # HHI = suma de cuadrados de dependencias normalizadas
-            if sub['vulnerability'].sum() == 0: return 1.0
-            norm_deps = sub['vulnerability'] / sub['vulnerability'].sum()
-            return (norm_deps**2).sum()
-        
-        # Calculamos HHI para cada industria
-        hhis_by_ind = x.groupby('industry').apply(get_hhi_sector)
-        # Invertimos para obtener proveedores efectivos y promediamos (ponderado por peso industria)
-        eff_suppliers_by_ind = 1.0 / hhis_by_ind
-        
-        # Promedio nacional de proveedores efectivos
-        weights = x.groupby('industry')['trade_weight'].sum()
-        # Asegurar coincidencia de indices
-        eff_suppliers_by_ind = eff_suppliers_by_ind.loc[weights.index]
-        avg_eff_suppliers = np.average(eff_suppliers_by_ind, weights=weights)
-        
-        return pd.Series([vul, ind_share, avg_eff_suppliers], 
-                        index=['vulnerability', 'indirect_share', 'num_suppliers_effective'])
-
-    profiles_vul = df_importers.groupby('country').apply(agg_importer)
-    
-    # Agregacin por pas (Exportador - Importancia)
-    profiles_imp = df_stats[df_stats['role'] == "exporter"].groupby('country').apply(
-        lambda x: np.average(x['importance'], weights=x['trade_weight']) if x['trade_weight'].sum() > 0 else 0
-    ).rename('importance')
-    
-    profiles = pd.concat([profiles_vul, profiles_imp], axis=1).fillna(0).reset_index()
-    profiles["year"] = year
-    profiles["global_rank"] = profiles["vulnerability"].rank(ascending=False).astype(int)
+    if parciales_imp:
+        profiles = perfiles_desde_parciales(pd.concat(parciales_imp), pd.concat(parciales_exp), year)
+    else:
+        profiles = pd.DataFrame()
+    if df_ind_deps is None:
+        df_ind_deps = pd.DataFrame()
+
+    # Bloques: una fila más por bloque en profiles y hubs, con su puesto entre los países
+    if acumulador_bloques is not None and not profiles.empty:
+        tablas_bloques = acumulador_bloques.tablas(year)
+        profiles, hubs = modulo_bloques.anadir_bloques(profiles, hubs, tablas_bloques["perfiles"],
+                                                       tablas_bloques["hubs"])
+        print(f"[*] Añadidos {len(tablas_bloques['perfiles'])} bloques a perfiles y hubs")
 
     # 6. GUARDAR RESULTADOS OFICIALES
-    hubs.to_parquet(output_dir / f"hubs_{year}.parquet", index=False)
-    df_critical.to_parquet(output_dir / f"critical_{year}.parquet", index=False)
-    profiles.to_parquet(output_dir / f"profiles_{year}.parquet", index=False)
-    df_ind_deps.to_parquet(output_dir / f"dependencies_{year}.parquet", index=False)
-    df_bilat.to_parquet(output_dir / f"bilateral_{year}.parquet", index=False)
-    df_explorer.to_parquet(output_dir / f"explorer_{year}.parquet", index=False)
-    df_explorer.to_parquet(output_dir / f"explorer_{year}.parquet", index=False)
-    
+    with etapa(instrumentacion, "arquitecto.escritura", anio=year, industrias=num_industrias):
+        hubs.to_parquet(output_dir / f"hubs_{year}.parquet", index=False)
+        profiles.to_parquet(output_dir / f"profiles_{year}.parquet", index=False)
+        # Ordenada por (país, industria) con índice, como el explorador
+        escribir_ordenado(df_ind_deps, output_dir / f"dependencies_{year}.parquet", CLAVES_ORDEN["dependencies"])
+        for escritor in escritores.values():
+            escritor.cerrar()
+    manifiesto.registrar(entradas, parametros, salidas)
+
     print(f"\n PROCESO COMPLETADO PARA {year}")
     print(f" Archivos guardados en: {output_dir}")
-    return True
+    return "ok"
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        years = [int(y) for y in sys.argv[1:]]
-    else:
+    parser = argparse.ArgumentParser(description="Arquitecto ISE: tablas de historico por año")
+    parser.add_argument("years", nargs="*", type=int)
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Años procesados a la vez en procesos separados (-1 = todos los núcleos)")
+    parser.add_argument("--forzar", action="store_true",
+                        help="Regenera los años aunque el manifiesto diga que están al día")
+    parser.add_argument("--muestreo", type=float, default=None,
+                        help="Perfilador de muestreo: segundos entre muestras (p. ej. 0.01)")
+    parser.add_argument("--bloques", nargs="+", default=None,
+                        help="Añade a profiles y hubs una fila por bloque (EU27, ASEAN, MERCOSUR, USMCA, G7, BRICS)")
+    parser.add_argument("--bloques-bruto", action="store_true",
+                        help="Conserva los flujos internos de cada bloque (por defecto se anulan)")
+    args = parser.parse_args()
+
+    if not args.years:
         # Por defecto, si no hay argumentos, buscar lo que haya
-        print("Uso: python ise_architect.py 2022 2021...")
+        print("Uso: python ise_architect.py 2022 2021... [--jobs N]")
         sys.exit(1)
-        
-    for y in years:
-        process_year(y)
+
+    if args.jobs != 1 and len(args.years) > 1:
+        # Cada año es independiente: un proceso por año, memoria acotada por industria en cada uno
+        completados = Parallel(n_jobs=args.jobs)(
+            delayed(process_year)(y, args.forzar, muestreo=args.muestreo, bloques=args.bloques,
+                                  neto_bloques=not args.bloques_bruto) for y in args.years
+        )
+    else:
+        completados = [process_year(y, args.forzar, muestreo=args.muestreo, bloques=args.bloques,
+                                    neto_bloques=not args.bloques_bruto) for y in args.years]
+    sys.exit(0 if all(completados) else 1)
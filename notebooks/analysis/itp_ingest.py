@@ -0,0 +1,284 @@
+"""
+INGESTA ITP → PARQUET
+Convierte una sola vez los ficheros ITPD_E_R03.csv.parteN.gz en un dataset Parquet
+particionado al estilo Hive (year=/industry_id=). Las partes se descomprimen en flujo
+y se leen por bloques con pyarrow, sin copia descomprimida en disco y con memoria
+acotada. Después, cargar un año es una lectura con filtro sobre las particiones.
+
+Uso:
+    python itp_ingest.py                  # ingesta con las rutas por defecto
+    python itp_ingest.py 2016 2022        # ingesta (si falta) y prueba de carga por año
+"""
+import gzip
+import io
+import json
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+
+BASE_PATH = Path(__file__).resolve().parent.parent.parent
+SOURCE_DIR = BASE_PATH / "data" / "raw" / "ITP" / "ITPD_E_R03"
+DATASET_DIR = BASE_PATH / "data" / "processed" / "ITPD_E_R03_parquet"
+PATRON_PARTES = "ITPD_E_R03.csv.parte*.gz"
+
+# Columnas que usa el pipeline y su tipo en el dataset
+USECOLS = [
+    "exporter_iso3",
+    "importer_iso3",
+    "year",
+    "trade",
+    "industry_id",
+    "industry_descr",
+    "importer_name",
+    "exporter_name",
+]
+TIPOS_CSV = {
+    "exporter_iso3": pa.string(),
+    "importer_iso3": pa.string(),
+    "year": pa.int32(),
+    "trade": pa.float64(),
+    "industry_id": pa.int32(),
+    "industry_descr": pa.string(),
+    "importer_name": pa.string(),
+    "exporter_name": pa.string(),
+}
+# Columnas de texto muy repetidas: se guardan con codificación de diccionario
+COLS_DICCIONARIO = ["exporter_iso3", "importer_iso3", "industry_descr", "importer_name", "exporter_name"]
+PARTICIONES = pa.schema([("year", pa.int32()), ("industry_id", pa.int32())])
+
+# Tipos con los que procesar_datos_itp entregaba el DataFrame del año
+DTYPES = {
+    "exporter_iso3": "string",
+    "importer_iso3": "string",
+    "year": "int32",
+    "trade": "float32",
+    "industry_id": "int32",
+    "industry_descr": "string",
+    "importer_name": "string",
+    "exporter_name": "string",
+}
+
+
+class _PartesGzip(io.RawIOBase):
+    """Flujo de lectura que concatena las partes .gz como si fueran un solo CSV."""
+
+    def __init__(self, rutas):
+        self._rutas = list(rutas)
+        self._actual = None
+        self.bytes_leidos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            if self._actual is None:
+                if not self._rutas:
+                    return 0
+                self._actual = gzip.open(self._rutas.pop(0), "rb")
+            n = self._actual.readinto(buffer)
+            if n:
+                self.bytes_leidos += n
+                return n
+            self._actual.close()
+            self._actual = None
+
+    def close(self):
+        if self._actual is not None:
+            self._actual.close()
+            self._actual = None
+        super().close()
+
+
+def listar_partes(source_directory=None):
+    """Partes comprimidas del ITP en orden (parte1, parte2, ..., parte10)."""
+    source_directory = Path(source_directory or SOURCE_DIR)
+    if not source_directory.exists():
+        raise FileNotFoundError(f"No se encuentra el directorio fuente: {source_directory}")
+
+    def _numero(ruta):
+        sufijo = ruta.name[len("ITPD_E_R03.csv.parte"):-len(".gz")]
+        return (int(sufijo) if sufijo.isdigit() else float("inf"), ruta.name)
+
+    partes = sorted(source_directory.glob(PATRON_PARTES), key=_numero)
+    if not partes:
+        raise FileNotFoundError(f"No se encontraron archivos .gz en {source_directory}")
+    return partes
+
+
+def _lotes_codificados(lector, schema):
+    """Lotes del CSV con las columnas de texto codificadas como diccionario."""
+    for lote in lector:
+        columnas = [
+            pc.dictionary_encode(lote.column(nombre)) if nombre in COLS_DICCIONARIO else lote.column(nombre)
+            for nombre in schema.names
+        ]
+        yield pa.RecordBatch.from_arrays(columnas, schema=schema)
+
+
+def ingestar_itp(source_directory=None, target_directory=None, block_size=64 << 20,
+                 max_open_files=256, min_rows_per_group=32_768, compression="zstd",
+                 verbose=True):
+    """
+    Ingesta única de las partes .gz del ITP en un dataset Parquet particionado.
+
+    El CSV se lee en bloques de block_size bytes descomprimidos y cada bloque se
+    reparte entre las particiones year=/industry_id=. La memoria queda acotada por
+    block_size y por las filas pendientes de cada fichero abierto
+    (max_open_files × min_rows_per_group). El dataset se escribe en un directorio
+    temporal y solo sustituye al anterior al terminar sin errores.
+
+    Parameters:
+    -----------
+    source_directory : Path, opcional
+        Carpeta con ITPD_E_R03.csv.parteN.gz (por defecto data/raw/ITP/ITPD_E_R03)
+    target_directory : Path, opcional
+        Carpeta del dataset (por defecto data/processed/ITPD_E_R03_parquet)
+    block_size : int
+        Bytes de CSV descomprimido por bloque de lectura
+    max_open_files : int
+        Ficheros Parquet abiertos a la vez durante la escritura
+    min_rows_per_group : int
+        Filas acumuladas por partición antes de escribir un row group
+    compression : str
+        Códec Parquet
+    verbose : bool
+        Imprime progreso y resumen
+
+    Returns:
+    --------
+    Path
+        Carpeta del dataset
+    """
+    partes = listar_partes(source_directory)
+    target_directory = Path(target_directory or DATASET_DIR)
+    temporal = target_directory.with_name(target_directory.name + ".tmp")
+    if temporal.exists():
+        shutil.rmtree(temporal)
+    target_directory.parent.mkdir(parents=True, exist_ok=True)
+
+    if verbose:
+        print(f"Ingestando {len(partes)} partes de {partes[0].parent}")
+        print(f"Destino: {target_directory}")
+
+    inicio = time.perf_counter()
+    flujo = _PartesGzip(partes)
+    lector = pa_csv.open_csv(
+        io.BufferedReader(flujo, buffer_size=1 << 20),
+        read_options=pa_csv.ReadOptions(block_size=block_size),
+        convert_options=pa_csv.ConvertOptions(include_columns=USECOLS, column_types=TIPOS_CSV),
+    )
+    schema = pa.schema([
+        pa.field(nombre, pa.dictionary(pa.int32(), tipo) if nombre in COLS_DICCIONARIO else tipo)
+        for nombre, tipo in ((nombre, lector.schema.field(nombre).type) for nombre in USECOLS)
+    ])
+
+    filas = 0
+    anios = set()
+
+    def _lotes():
+        nonlocal filas
+        for lote in _lotes_codificados(lector, schema):
+            filas += lote.num_rows
+            anios.update(pc.unique(lote.column("year")).to_pylist())
+            if verbose:
+                print(f"\r  {filas:,} filas · {flujo.bytes_leidos / 1e9:.1f} GB de CSV leídos", end="", flush=True)
+            yield lote
+
+    try:
+        ds.write_dataset(
+            _lotes(),
+            temporal,
+            schema=schema,
+            format="parquet",
+            partitioning=ds.partitioning(PARTICIONES, flavor="hive"),
+            existing_data_behavior="overwrite_or_ignore",
+            max_open_files=max_open_files,
+            min_rows_per_group=min_rows_per_group,
+            max_rows_per_group=max(min_rows_per_group, 1 << 20),
+            file_options=ds.ParquetFileFormat().make_write_options(compression=compression),
+        )
+    finally:
+        flujo.close()
+
+    with open(temporal / "_ingesta.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "partes": [{"nombre": p.name, "bytes": p.stat().st_size} for p in partes],
+            "filas": filas,
+            "anios": sorted(anios),
+            "columnas": USECOLS,
+        }, f, ensure_ascii=False, indent=2)
+
+    if target_directory.exists():
+        shutil.rmtree(target_directory)
+    temporal.rename(target_directory)
+
+    if verbose:
+        tamano = sum(p.stat().st_size for p in target_directory.rglob("*.parquet"))
+        print(f"\n✓ {filas:,} filas, años {min(anios)}–{max(anios)}" if anios else "\n✓ 0 filas")
+        print(f"✓ Dataset: {tamano / 1e6:,.1f} MB en {time.perf_counter() - inicio:,.1f} s")
+    return target_directory
+
+
+def abrir_dataset(dataset_directory=None):
+    """pyarrow.dataset del ITP con las particiones year/industry_id tipadas."""
+    dataset_directory = Path(dataset_directory or DATASET_DIR)
+    if not dataset_directory.exists():
+        raise FileNotFoundError(
+            f"No existe el dataset {dataset_directory}. Ejecuta antes: python itp_ingest.py"
+        )
+    return ds.dataset(
+        dataset_directory,
+        format="parquet",
+        partitioning=ds.partitioning(PARTICIONES, flavor="hive"),
+        exclude_invalid_files=False,
+        ignore_prefixes=["_", "."],
+    )
+
+
+def cargar_itp_anio(year, dataset_directory=None, columns=None, industrias=None):
+    """
+    Filas del ITP de un año (y opcionalmente de algunas industrias).
+
+    El filtro se resuelve sobre las carpetas year=/industry_id=, así que solo se
+    leen los ficheros del año pedido. Los tipos son los de DTYPES, los mismos que
+    devolvía la lectura con Dask.
+
+    Parameters:
+    -----------
+    year : int
+        Año a cargar
+    dataset_directory : Path, opcional
+        Carpeta del dataset
+    columns : list, opcional
+        Columnas a leer (por defecto USECOLS)
+    industrias : list, opcional
+        industry_id a conservar
+
+    Returns:
+    --------
+    pandas.DataFrame
+    """
+    columns = list(columns or USECOLS)
+    filtro = ds.field("year") == int(year)
+    if industrias is not None:
+        filtro = filtro & ds.field("industry_id").isin([int(i) for i in industrias])
+
+    tabla = abrir_dataset(dataset_directory).to_table(columns=columns, filter=filtro)
+    df = tabla.to_pandas()
+    return df.astype({c: t for c, t in DTYPES.items() if c in df.columns})
+
+
+if __name__ == "__main__":
+    if not DATASET_DIR.exists():
+        ingestar_itp()
+    for y in [int(a) for a in sys.argv[1:]]:
+        t0 = time.perf_counter()
+        df = cargar_itp_anio(y)
+        print(f"{y}: {len(df):,} filas en {time.perf_counter() - t0:.2f} s")
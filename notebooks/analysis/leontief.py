@@ -0,0 +1,238 @@
+"""
+DEPENDENCIA TOTAL SIN TRUNCAR (LEONTIEF) ISE
+El motor corta la dependencia indirecta en max_possible_length (3 por defecto) porque
+enumerar caminos más largos no es viable, así que las cadenas de suministro profundas
+quedan infracontadas y el resultado depende del corte. Este módulo calcula, junto a las
+cifras truncadas del almacén, la dependencia total de todas las longitudes de cada par
+(dependency_engine.dependencia_total_ilimitada): la suma de los caminos de cualquier
+longitud de j a i con intermediarios distintos de i y de j, resuelta con inversas por
+lotes de importadores en lugar de enumerar caminos.
+
+Las matrices limpias se reconstruyen desde el almacén del motor (results_{año}/,
+results_store.matriz_desde_pares), como en bloques.py, sin volver a leer el ITP. Salida
+por año, leontief_{año}.parquet (ordenada por importador e industria con índice de
+desplazamientos, como explorer), con una fila por par del almacén:
+
+- direct, indirect, total, longitud y dep_L1..dep_L{max}: las cifras truncadas del motor
+- total_leontief / indirect_leontief: dependencia total e indirecta de todas las longitudes
+- cobertura: total / total_leontief, la parte que recoge el corte en max_possible_length
+
+    python leontief.py 2022 --jobs 4
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from dependency_engine import dependencia_total_ilimitada
+from historico_store import escribir_ordenado
+from instrumentacion import Instrumentacion, medicion
+from results_store import iterar_industrias, matriz_desde_pares, parametros_almacen, ruta_resultados
+
+BASE_PATH = Path(__file__).resolve().parent.parent.parent
+LEONTIEF_DIR = BASE_PATH / "data" / "processed" / "leontief"
+CLAVES_LEONTIEF = ("importer", "industry")
+
+
+def _leontief_industria(info, pares, amortiguacion=1.0, min_dependencia=0.0):
+    """
+    Dependencia total sin truncar de los pares de una industria del almacén.
+
+    Parameters:
+    -----------
+    info : dict
+        Fila de industries (industry, country_names)
+    pares : pandas.DataFrame
+        pairs de la industria
+
+    Returns:
+    --------
+    dict
+        'pares' (DataFrame) y 'registro' (instrumentación: condición e importadores amortiguados)
+    """
+    industria, codigos = info["industry"], list(info["country_names"])
+    with medicion(etapa="leontief.industria", industria=industria, paises=len(codigos)) as registro:
+        X = matriz_desde_pares(pares, codigos)
+        denom = X.sum(axis=0)
+        denom[denom == 0.0] = np.inf
+        total, diagnostico = dependencia_total_ilimitada(X / denom, amortiguacion)
+        registro["condicion"] = diagnostico["condicion"]
+        registro["amortiguados"] = [codigos[k] for k in diagnostico["amortiguados"]]
+
+        salida = pares.drop(columns=["trade_value"]).rename(columns={"longitud_optima": "longitud"})
+        for columna in ("importer", "exporter"):
+            salida[columna] = salida[columna].astype(str)
+        salida["industry"] = industria
+        posicion = pd.Index(codigos)
+        i, j = posicion.get_indexer(salida["importer"]), posicion.get_indexer(salida["exporter"])
+        salida["total_leontief"] = total[j, i]
+        salida["indirect_leontief"] = salida["total_leontief"] - salida["direct"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            salida["cobertura"] = np.where(salida["total_leontief"] > 0,
+                                           salida["total"] / salida["total_leontief"], np.nan)
+        salida = salida[salida["total_leontief"] >= min_dependencia]
+    return {"pares": salida.reset_index(drop=True), "registro": registro}
+
+
+def calcular_leontief(year, store_dir=None, amortiguacion=1.0, min_dependencia=0.0, n_jobs=1,
+                      instrumentacion=None, verbose=True):
+    """
+    Dependencia total sin truncar de un año desde su almacén results_{year}/.
+
+    Parameters:
+    -----------
+    store_dir : Path, opcional
+        Almacén del motor (por defecto ruta_resultados(year))
+    amortiguacion : float
+        Peso de cada intermediario adicional (1.0 = Leontief sin amortiguar)
+    min_dependencia : float
+        total_leontief mínima para que un par entre en la salida
+    n_jobs : int
+        Industrias calculadas a la vez en procesos separados
+
+    Returns:
+    --------
+    dict
+        DataFrame 'pares' y 'parametros'
+    """
+    store_dir = Path(store_dir or ruta_resultados(year))
+    parametros_motor = parametros_almacen(store_dir)
+    trabajos = (
+        delayed(_leontief_industria)(info, tablas["pairs"], amortiguacion, min_dependencia)
+        for info, tablas in iterar_industrias(store_dir, {"pairs": None})
+    )
+    if n_jobs == 1:
+        salidas = (f(*a, **kw) for f, a, kw in trabajos)
+    else:
+        salidas = Parallel(n_jobs=n_jobs, return_as="generator")(trabajos)
+
+    pares, amortiguados = [], {}
+    for num, salida in enumerate(salidas, start=1):
+        if instrumentacion is not None:
+            instrumentacion.registrar(salida["registro"])
+        if salida["registro"]["amortiguados"]:
+            amortiguados[salida["registro"]["industria"]] = salida["registro"]["amortiguados"]
+        pares.append(salida["pares"])
+        if verbose:
+            print(f"\r Industrias procesadas: {num}", end="", flush=True)
+    if verbose:
+        print()
+        if amortiguados:
+            print(f"[!] {len(amortiguados)} industrias con sistemas singulares resueltos amortiguados")
+
+    pares = pd.concat(pares, ignore_index=True) if pares else pd.DataFrame()
+    parametros = {
+        "year": year, "amortiguacion": amortiguacion, "min_dependencia": min_dependencia,
+        "max_possible_length": parametros_motor.get("max_possible_length"),
+        "threshold_pct": parametros_motor.get("threshold_pct"), "amortiguados": amortiguados,
+    }
+    return {"pares": pares, "parametros": parametros}
+
+
+def guardar_leontief(salida, directorio=None):
+    """
+    Escribe leontief_{año}.parquet (ordenada por importador e industria, con índice) y
+    leontief_{año}.json con los parámetros en directorio (por defecto data/processed/leontief/).
+    """
+    directorio = Path(directorio or LEONTIEF_DIR)
+    directorio.mkdir(parents=True, exist_ok=True)
+    year = salida["parametros"]["year"]
+    escribir_ordenado(salida["pares"], directorio / f"leontief_{year}.parquet", CLAVES_LEONTIEF)
+    with open(directorio / f"leontief_{year}.json", "w", encoding="utf-8") as f:
+        json.dump(salida["parametros"], f, ensure_ascii=False, indent=2)
+    return directorio
+
+
+def verificar_leontief(n=9, max_possible_length=4, density=0.6, seed=0, atol=1e-9):
+    """
+    Compara dependencia_total_ilimitada con su definición par a par (un sistema sin i ni
+    j por cada par), con la serie de Neumann de los caminos sumada longitud a longitud y
+    con el motor truncado (nunca mayor), sobre una matriz aleatoria pequeña y sobre una
+    con un grupo de países que solo se compran entre sí (sistemas singulares).
+
+    Returns:
+    --------
+    dict
+        Resumen de la comparación ('ok', diferencia máxima)
+
+    Raises:
+    -------
+    AssertionError
+        Si alguna dependencia no coincide o queda fuera de [total truncada, 1]
+    """
+    from dependency_engine import calculate_all_dependencies_matrix
+
+    rng = np.random.default_rng(seed)
+    X = rng.pareto(1.5, size=(n, n))
+    X[rng.random((n, n)) > density] = 0.0
+    # Comercio doméstico, como en las matrices del almacén (sin él puede haber grupos cerrados)
+    np.fill_diagonal(X, rng.pareto(1.5, size=n) + 0.1)
+    denom = X.sum(axis=0)
+    denom[denom == 0.0] = np.inf
+    T = X / denom
+    total, info = dependencia_total_ilimitada(T)
+    assert not info["amortiguados"], info
+
+    D = T.copy()
+    np.fill_diagonal(D, 0.0)
+    max_diff = 0.0
+    for i in range(n):
+        for j in range(n):
+            if i == j:
+                continue
+            resto = [x for x in range(n) if x not in (i, j)]
+            esperado = D[j, i] + D[j, resto] @ np.linalg.solve(np.eye(n - 2) - D[np.ix_(resto, resto)], D[resto, i])
+            # Neumann: caminos de k intermediarios = D[j, resto] · D_resto^(k-1) · D[resto, i]
+            serie, termino = D[j, i], D[j, resto]
+            for _ in range(500):
+                serie += termino @ D[resto, i]
+                termino = termino @ D[np.ix_(resto, resto)]
+            assert np.isclose(total[j, i], esperado, rtol=1e-9, atol=atol), (j, i, total[j, i], esperado)
+            assert np.isclose(serie, esperado, rtol=1e-6, atol=1e-9), (j, i, serie, esperado)
+            max_diff = max(max_diff, abs(total[j, i] - esperado))
+
+    nombres = [f"C{k}" for k in range(n)]
+    r = calculate_all_dependencies_matrix(X, nombres, convergence_threshold=0.0,
+                                          max_possible_length=max_possible_length)
+    for d in r["dependencies"]:
+        i, j = nombres.index(d["importador"]), nombres.index(d["exportador"])
+        assert d["dependencia_total"] <= total[j, i] + atol, (d, total[j, i])
+    assert total.max() <= 1.0 + atol
+
+    # 0 y 1 solo se compran entre sí: desde 2 se llega a 0 por 0, por 1 (que solo compra
+    # a 0) o por 3 (que compra a 0, 1 y 2 por igual): 1/4 + 1/4 + 1/2 · 1/2
+    X = np.array([[0, 5, 1, 1], [5, 0, 1, 1], [0, 0, 0, 2], [0, 0, 2, 0]], dtype=np.float64)
+    total, info = dependencia_total_ilimitada(X / X.sum(axis=0))
+    assert info["amortiguados"] and np.isclose(total[0, 2], 0.75, atol=1e-5), (total, info)
+    return {'ok': True, 'pares': n * (n - 1), 'max_diff': max_diff}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dependencia total sin truncar (Leontief) del almacén del motor")
+    parser.add_argument("years", nargs="+", type=int)
+    parser.add_argument("--amortiguacion", type=float, default=1.0,
+                        help="Peso de cada intermediario adicional (1.0 = sin amortiguar)")
+    parser.add_argument("--min-dependencia", type=float, default=0.0,
+                        help="total_leontief mínima para entrar en leontief_{año}.parquet")
+    parser.add_argument("--jobs", type=int, default=1, help="Industrias en paralelo (-1 = todos los núcleos)")
+    parser.add_argument("--salida", default=str(LEONTIEF_DIR))
+    args = parser.parse_args()
+
+    for year in args.years:
+        instr = Instrumentacion(f"leontief_{year}")
+        try:
+            inicio = time.perf_counter()
+            salida = calcular_leontief(year, amortiguacion=args.amortiguacion, min_dependencia=args.min_dependencia,
+                                       n_jobs=args.jobs, instrumentacion=instr)
+            destino = guardar_leontief(salida, args.salida)
+        finally:
+            instr.cerrar()
+        pares = salida["pares"]
+        if len(pares):
+            print(f" {year}: cobertura mediana del corte {pares['cobertura'].median():.3f}, "
+                  f"total_leontief media {pares['total_leontief'].mean():.4f} vs truncada {pares['total'].mean():.4f}")
+        print(f" LEONTIEF {year} COMPLETADO ({time.perf_counter() - inicio:.1f} s): {destino}")
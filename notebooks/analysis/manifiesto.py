@@ -0,0 +1,147 @@
+"""
+MANIFIESTO DE RECONSTRUCCIÓN ISE
+Registra, para cada artefacto del pipeline (motor → arquitecto → dashboard), la huella
+de sus entradas y de los parámetros con que se generó. Una nueva ejecución solo
+recalcula los años, industrias y salidas cuya huella ha cambiado.
+
+Cada artefacto tiene su propio JSON en data/processed/_manifiesto/ (escritura atómica,
+de modo que varios procesos, p. ej. ise_architect.py --jobs, no se pisan):
+
+    {"clave": sha256(entradas + parámetros), "entradas": {ruta: {bytes, mtime_ns, sha256}},
+     "parametros": {...}, "salidas": {ruta: {bytes, mtime_ns, sha256}}, "partes": {...}}
+
+Las huellas de fichero son de contenido (sha256); el tamaño y mtime guardados solo
+evitan volver a leer un fichero que no ha cambiado desde la última vez.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+BASE_PATH = Path(__file__).resolve().parent.parent.parent
+MANIFIESTO_DIR = BASE_PATH / "data" / "processed" / "_manifiesto"
+
+
+def huella_valores(valores):
+    """sha256 de un objeto JSON (parámetros, listas de claves...)."""
+    texto = json.dumps(valores, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def huella_matriz(matriz, etiquetas=None):
+    """sha256 del contenido de una matriz (dtype, forma y bytes) y sus etiquetas."""
+    matriz = np.ascontiguousarray(np.asarray(matriz))
+    h = hashlib.sha256()
+    h.update(f"{matriz.dtype.str}{matriz.shape}".encode())
+    h.update(matriz.data)
+    if etiquetas is not None:
+        h.update(json.dumps([str(e) for e in etiquetas]).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _ficheros(ruta):
+    ruta = Path(ruta)
+    if ruta.is_dir():
+        return sorted(p for p in ruta.rglob("*") if p.is_file())
+    return [ruta]
+
+
+def huella_fichero(ruta, previa=None, bloque=1 << 22):
+    """
+    {bytes, mtime_ns, sha256} de un fichero o de todos los de una carpeta.
+
+    Si previa (la entrada registrada antes) coincide en tamaño y mtime, se reutiliza su
+    sha256 sin releer el contenido.
+    """
+    ficheros = _ficheros(ruta)
+    if not all(p.exists() for p in ficheros):
+        return None
+    estados = [p.stat() for p in ficheros]
+    bytes_ = sum(s.st_size for s in estados)
+    mtime = max((s.st_mtime_ns for s in estados), default=0)
+    if previa and previa.get("bytes") == bytes_ and previa.get("mtime_ns") == mtime:
+        return dict(previa)
+
+    h = hashlib.sha256()
+    raiz = Path(ruta)
+    for p in ficheros:
+        if raiz.is_dir():
+            h.update(p.relative_to(raiz).as_posix().encode("utf-8"))
+        with open(p, "rb") as f:
+            for trozo in iter(lambda: f.read(bloque), b""):
+                h.update(trozo)
+    return {"bytes": bytes_, "mtime_ns": mtime, "sha256": h.hexdigest()}
+
+
+class Manifiesto:
+    """
+    Entrada del manifiesto de un artefacto.
+
+        m = Manifiesto("historico_2016")
+        entradas = m.huellas([store_dir])
+        if not m.al_dia(entradas, parametros, salidas):
+            ...  # regenerar
+            m.registrar(entradas, parametros, salidas)
+    """
+
+    def __init__(self, artefacto, directory=None):
+        self.artefacto = artefacto
+        self.path = Path(directory or MANIFIESTO_DIR) / f"{artefacto}.json"
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.registro = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.registro = {}
+
+    def huellas(self, rutas):
+        """Huellas actuales de las rutas (reutilizando las registradas si no cambiaron)."""
+        previas = self.registro.get("entradas", {})
+        return {str(r): huella_fichero(r, previas.get(str(r))) for r in rutas}
+
+    @staticmethod
+    def clave(entradas, parametros):
+        """Huella conjunta del contenido de las entradas (en orden, sin rutas) y los parámetros."""
+        contenido = [(h or {}).get("sha256") for h in entradas.values()]
+        return huella_valores({"entradas": contenido, "parametros": parametros})
+
+    def al_dia(self, entradas, parametros, salidas=()):
+        """True si la clave coincide con la registrada y las salidas siguen intactas."""
+        if any(h is None for h in entradas.values()):
+            return False
+        if self.registro.get("clave") != self.clave(entradas, parametros):
+            return False
+        return self.salidas_intactas(salidas)
+
+    def salidas_intactas(self, salidas):
+        """True si las salidas existen y su contenido es el registrado."""
+        registradas = self.registro.get("salidas", {})
+        for ruta in salidas:
+            previa = registradas.get(str(ruta))
+            actual = huella_fichero(ruta, previa)
+            if previa is None or actual is None or actual["sha256"] != previa.get("sha256"):
+                return False
+        return True
+
+    def parte(self, nombre):
+        """Clave registrada de una parte del artefacto (p. ej. una industria)."""
+        return self.registro.get("partes", {}).get(nombre)
+
+    def registrar(self, entradas, parametros, salidas=(), partes=None):
+        """Guarda la huella del artefacto recién generado."""
+        self.registro = {
+            "artefacto": self.artefacto,
+            "clave": self.clave(entradas, parametros),
+            "entradas": entradas,
+            "parametros": parametros,
+            "salidas": {str(r): huella_fichero(r) for r in salidas},
+        }
+        if partes is not None:
+            self.registro["partes"] = partes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporal = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(self.registro, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(temporal, self.path)
+        return self.registro["clave"]
@@ -0,0 +1,445 @@
+"""
+PANEL MULTI-AÑO ISE
+Calcula las dependencias de varios años en una sola ejecución, sin editar `anio` en el
+notebook ni pasar por un all_results por año, y emite tablas de panel con las
+variaciones respecto al año anterior:
+
+- pares.parquet: por (importador, exportador, industria, año) dependencia directa,
+  indirecta y total, el puesto del exportador entre los proveedores del importador
+  (rank), el hub_score del exportador en la industria y sus delta_* frente al año
+  anterior del panel. Solo los pares con dependencia total >= min_dependencia en algún
+  año (todos sus años). Ordenada por (importador, industria) con índice de
+  desplazamientos, como explorer (historico_store.leer_ordenado).
+- perfiles.parquet: profiles de cada año (mismas definiciones que ise_architect.py)
+  con delta_vulnerability, delta_importance, delta_global_rank...
+- hubs.parquet: hubs de cada año (score 0.4 · frecuencia + 0.6 · fuerza) con deltas.
+
+Los tensores de comercio de todos los años se cargan una vez, con los mismos países en
+todos (la unión de los importadores de cada año, en orden alfabético). Por industria,
+cada año se limpia como en el motor (eliminar_filas_columnas_cero) y se coloca en esa
+rejilla común; los países eliminados quedan como filas y columnas a cero, que no
+contribuyen a ningún camino, así que los productos de T, la convergencia, los rangos y
+las diferencias se calculan a la vez para todos los años sobre una pila (años, n, n).
+Las rutas (para hubs) se buscan por año.
+
+    python panel.py 2016 2017 2018 2019 2020 2021 2022 --jobs 4
+"""
+import argparse
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from agregados import (
+    caminos_planos,
+    contar_intermediarios,
+    parciales_perfiles,
+    perfiles_desde_parciales,
+    tabla_hubs,
+)
+from dependency_engine import (
+    PESO_FRECUENCIA,
+    PESO_FUERZA,
+    calcular_dependencias_por_longitud,
+    calcular_longitudes_convergencia,
+    eliminar_filas_columnas_cero,
+)
+from historico_store import escribir_ordenado
+from instrumentacion import Instrumentacion, etapa, medicion
+from itp_ingest import cargar_itp_anio
+from path_search import buscar_caminos_desde, vecinos_ordenados
+from trade_tensor import crear_tensor_comercio
+
+BASE_PATH = Path(__file__).resolve().parent.parent.parent
+PANEL_DIR = BASE_PATH / "data" / "processed" / "panel"
+CLAVES_PANEL = ("importer", "industry")
+
+
+def cargar_tensores_panel(anios, dataset_directory=None):
+    """
+    Tensores de comercio de todos los años sobre los mismos países e industrias.
+
+    Cada año conserva la selección del notebook: sus países son los importadores de
+    ese año (los flujos de exportadores que no importan ese año se descartan), de modo
+    que tras la limpieza cada matriz es la misma que en el cálculo año a año.
+
+    Returns:
+    --------
+    dict
+        'tensor' float32 (años, industrias, n, n), 'anios', 'industrias' y 'codigos'
+    """
+    anios = sorted(int(a) for a in anios)
+    # Primera pasada (dos columnas): países e industrias de todo el panel
+    codigos_anio, industrias = {}, set()
+    for year in anios:
+        df = cargar_itp_anio(year, dataset_directory, columns=["importer_iso3", "industry_descr"])
+        codigos_anio[year] = set(df["importer_iso3"].dropna().unique().tolist())
+        industrias.update(df["industry_descr"].dropna().unique().tolist())
+    codigos = sorted(set().union(*codigos_anio.values()))
+    industrias = sorted(industrias)
+
+    tensor = np.zeros((len(anios), len(industrias), len(codigos), len(codigos)), dtype=np.float32)
+    for k, year in enumerate(anios):
+        df = cargar_itp_anio(year, dataset_directory)
+        df = df[df["exporter_iso3"].isin(codigos_anio[year])]
+        tensor[k], _ = crear_tensor_comercio(df, codigos, industrias)
+        del df
+    return {"tensor": tensor, "anios": anios, "industrias": industrias, "codigos": codigos}
+
+
+def _diferencia_anual(a):
+    """a[t] - a[t-1] a lo largo del primer eje (NaN en el primer año)."""
+    d = np.full(a.shape, np.nan, dtype=np.float64)
+    d[1:] = a[1:] - a[:-1]
+    return d
+
+
+def _panel_industria(industria, bloque, codigos, anios, threshold_pct=0.005, convergence_threshold=0.01,
+                     max_possible_length=3, path_strength_threshold=0.001, min_dependencia=0.05):
+    """
+    Todos los años de una industria.
+
+    Parameters:
+    -----------
+    bloque : numpy.ndarray
+        Comercio (años, n, n) de la industria, exportador × importador
+
+    Returns:
+    --------
+    dict o None
+        'pares' (DataFrame del panel), 'perfiles' {año: parciales de perfiles}, 'hubs'
+        {año: (frecuencia, fuerza, presentes)} sobre codigos, y 'registro' (instrumentación)
+    """
+    n_anios, n = bloque.shape[0], bloque.shape[1]
+    nombres = np.asarray(codigos, dtype=object)
+    posicion = pd.Index(codigos)
+
+    with medicion(etapa="panel.industria", industria=industria) as registro:
+        # Limpieza año a año (como el motor) sobre la rejilla común de países
+        X = np.zeros(bloque.shape, dtype=bloque.dtype)
+        denom = np.full((n_anios, n), np.inf)
+        presentes = np.zeros((n_anios, n), dtype=bool)
+        for y in range(n_anios):
+            limpia = eliminar_filas_columnas_cero(bloque[y], threshold_pct=threshold_pct, country_names=codigos)
+            if limpia.shape[0] < 2:
+                continue
+            idx = posicion.get_indexer(limpia.columns)
+            X[y][np.ix_(idx, idx)] = limpia.values
+            # Mismas sumas que el motor sobre la matriz limpia (sin los ceros de relleno)
+            d = limpia.values.sum(axis=0, dtype=np.float64)
+            d[d == 0.0] = np.inf
+            denom[y, idx] = d
+            presentes[y, idx] = True
+        registro["paises_medios"] = round(float(presentes.sum(axis=1).mean()), 1)
+        if not presentes.any():
+            registro["estado"] = "saltada"
+            return None
+
+        # Todos los años a la vez: productos de T y convergencia sobre la pila (años, n, n)
+        direct = X / denom[:, None, :]  # direct[y, j, i]
+        dependencias = calcular_dependencias_por_longitud(direct, max_possible_length)
+        indirect, length = calcular_longitudes_convergencia(direct, dependencias, max_possible_length,
+                                                            convergence_threshold)
+        del dependencias
+        total = direct + indirect
+        validos = presentes[:, :, None] & presentes[:, None, :] & ~np.eye(n, dtype=bool)
+
+        # Caminos significativos por año → frecuencia y fuerza de intermediarios
+        hubs = {}
+        L = max(max_possible_length, 1)
+        for y in np.flatnonzero(presentes.any(axis=1)):
+            caminos = [{} for _ in range(n)]
+            if max_possible_length >= 3 or (max_possible_length >= 2 and path_strength_threshold > 0):
+                orden_filas, pesos_filas = vecinos_ordenados(direct[y])
+                for j in np.flatnonzero(presentes[y]):
+                    caminos[j] = buscar_caminos_desde(direct[y], j, max_possible_length, path_strength_threshold,
+                                                      top_k=0, longitudes_j=length[y, j], orden_filas=orden_filas,
+                                                      pesos_filas=pesos_filas)
+            _, _, c_lon, c_fuerza, c_interms = caminos_planos(caminos, n, L)
+            sig = (c_fuerza > path_strength_threshold) & ((c_lon > 2) | (path_strength_threshold > 0))
+            hubs[int(anios[y])] = (*contar_intermediarios(c_interms[sig], c_fuerza[sig], n), presentes[y])
+
+        # Hub score de cada país en la industria y año (normalización de ise_architect)
+        frecuencia = np.zeros((n_anios, n))
+        fuerza = np.zeros((n_anios, n))
+        for y, year in enumerate(anios):
+            if year in hubs:
+                frecuencia[y], fuerza[y], _ = hubs[year]
+        max_f = frecuencia.max(axis=1, keepdims=True)
+        max_s = fuerza.max(axis=1, keepdims=True)
+        hub_score = PESO_FRECUENCIA * np.divide(frecuencia, max_f, out=np.zeros_like(frecuencia), where=max_f > 0) \
+            + PESO_FUERZA * np.divide(fuerza, max_s, out=np.zeros_like(fuerza), where=max_s > 0)
+
+        # Puesto del exportador entre los proveedores del importador (1 = mayor dependencia)
+        proveedor = validos & (total > 0)
+        orden = np.argsort(np.where(proveedor, -total, np.inf), axis=1, kind="stable")
+        rank = np.empty((n_anios, n, n), dtype=np.int32)
+        np.put_along_axis(rank, orden, np.arange(1, n + 1, dtype=np.int32)[None, :, None], axis=1)
+        rank[~proveedor] = 0
+
+        # Sumas parciales de perfiles por año: todos los pares de la matriz limpia
+        perfiles = {}
+        for y, year in enumerate(anios):
+            idx = np.flatnonzero(presentes[y])
+            if len(idx) < 2:
+                continue
+            ii, jj = np.nonzero(~np.eye(len(idx), dtype=bool))
+            i, j = idx[ii], idx[jj]
+            pares_anio = pd.DataFrame({
+                "importer": nombres[i],
+                "exporter": nombres[j],
+                "industry": industria,
+                "trade_value": X[y, j, i],
+                "direct": direct[y, j, i],
+                "indirect": indirect[y, j, i],
+            })
+            pares_anio["total"] = pares_anio["direct"] + pares_anio["indirect"]
+            perfiles[int(year)] = parciales_perfiles(pares_anio)
+
+        # Panel de pares: los que superan min_dependencia en algún año, con todos sus años
+        jj, ii = np.nonzero(np.where(validos, total, 0.0).max(axis=0) >= min_dependencia)
+        rank_f = np.where(rank > 0, rank, np.nan)
+
+        def por_par(a):
+            # (años, k) → filas ordenadas por par y, dentro, por año
+            return a[:, jj, ii].T.ravel()
+
+        k = len(jj)
+        pares = pd.DataFrame({
+            "importer": np.repeat(nombres[ii], n_anios),
+            "exporter": np.repeat(nombres[jj], n_anios),
+            "industry": industria,
+            "year": np.tile(np.asarray(anios, dtype=np.int32), k),
+            "en_matriz": por_par(validos),
+            "trade_value": por_par(X),
+            "direct": por_par(direct),
+            "indirect": por_par(indirect),
+            "total": por_par(total),
+            "longitud": por_par(length).astype(np.int8),
+            "rank": por_par(rank),
+            "hub_score": hub_score[:, jj].T.ravel(),
+            "delta_direct": por_par(_diferencia_anual(direct)),
+            "delta_indirect": por_par(_diferencia_anual(indirect)),
+            "delta_total": por_par(_diferencia_anual(total)),
+            "delta_rank": por_par(_diferencia_anual(rank_f)),
+            "delta_hub_score": _diferencia_anual(hub_score)[:, jj].T.ravel(),
+        })
+        registro["pares_panel"] = k
+    return {"pares": pares, "perfiles": perfiles, "hubs": hubs, "registro": registro}
+
+
+def _con_deltas(df, clave, columnas):
+    """Añade delta_{col} = valor - valor del año anterior del mismo país (NaN en su primer año)."""
+    df = df.sort_values([clave, "year"], kind="stable").reset_index(drop=True)
+    grupos = df.groupby(clave, sort=False)
+    for col in columnas:
+        df[f"delta_{col}"] = grupos[col].diff()
+    return df
+
+
+def calcular_panel(datos, threshold_pct=0.005, convergence_threshold=0.01, max_possible_length=3,
+                   path_strength_threshold=0.001, min_dependencia=0.05, industrias=None, n_jobs=1,
+                   instrumentacion=None, verbose=True):
+    """
+    Panel de todos los años de cargar_tensores_panel.
+
+    Parameters:
+    -----------
+    datos : dict
+        Salida de cargar_tensores_panel
+    min_dependencia : float
+        Dependencia total mínima (en algún año) para que un par entre en pares
+    industrias : list, opcional
+        Solo estas industrias (por defecto todas)
+    n_jobs : int
+        Industrias calculadas a la vez en procesos separados
+
+    Returns:
+    --------
+    dict
+        DataFrames 'pares', 'perfiles', 'hubs' y 'parametros'
+    """
+    anios, codigos = datos["anios"], datos["codigos"]
+    seleccion = [(k, ind) for k, ind in enumerate(datos["industrias"]) if industrias is None or ind in industrias]
+    parametros = {
+        "anios": anios, "threshold_pct": threshold_pct, "convergence_threshold": convergence_threshold,
+        "max_possible_length": max_possible_length, "path_strength_threshold": path_strength_threshold,
+        "min_dependencia": min_dependencia,
+    }
+    if verbose:
+        print(f"[*] Panel ISE: {len(anios)} años × {len(seleccion)} industrias × {len(codigos)} países")
+
+    trabajos = (
+        delayed(_panel_industria)(ind, datos["tensor"][:, k], codigos, anios, threshold_pct,
+                                  convergence_threshold, max_possible_length, path_strength_threshold,
+                                  min_dependencia)
+        for k, ind in seleccion
+    )
+    if n_jobs == 1:
+        salidas = (f(*a, **kw) for f, a, kw in trabajos)
+    else:
+        salidas = Parallel(n_jobs=n_jobs, return_as="generator")(trabajos)
+
+    pares = []
+    parciales = defaultdict(lambda: ([], []))
+    frecuencia = defaultdict(lambda: np.zeros(len(codigos), dtype=np.int64))
+    fuerza = defaultdict(lambda: np.zeros(len(codigos), dtype=np.float64))
+    presentes = defaultdict(lambda: np.zeros(len(codigos), dtype=bool))
+    with etapa(instrumentacion, "panel", anios=len(anios), industrias=len(seleccion)):
+        for num, salida in enumerate(salidas, start=1):
+            if salida is not None:
+                if instrumentacion is not None:
+                    instrumentacion.registrar(salida["registro"])
+                pares.append(salida["pares"])
+                for year, (imp, exp) in salida["perfiles"].items():
+                    parciales[year][0].append(imp)
+                    parciales[year][1].append(exp)
+                for year, (f, s, p) in salida["hubs"].items():
+                    frecuencia[year] += f
+                    fuerza[year] += s
+                    presentes[year] |= p
+            if verbose:
+                print(f"\r Industrias procesadas: {num}/{len(seleccion)}", end="", flush=True)
+    if verbose:
+        print()
+
+    pares = pd.concat(pares, ignore_index=True) if pares else pd.DataFrame()
+    perfiles = [perfiles_desde_parciales(pd.concat(imp), pd.concat(exp), year)
+                for year, (imp, exp) in sorted(parciales.items())]
+    perfiles = _con_deltas(pd.concat(perfiles, ignore_index=True), "country",
+                           ["vulnerability", "indirect_share", "num_suppliers_effective", "importance",
+                            "global_rank"]) if perfiles else pd.DataFrame()
+    hubs = []
+    for year in sorted(frecuencia):
+        # Solo los países de alguna matriz limpia del año (los intermediarios del almacén)
+        p = np.flatnonzero(presentes[year])
+        hubs.append(tabla_hubs(dict(zip([codigos[i] for i in p], frecuencia[year][p].tolist())),
+                                dict(zip([codigos[i] for i in p], fuerza[year][p].tolist())), year))
+    hubs = _con_deltas(pd.concat(hubs, ignore_index=True), "country", ["global_score", "global_rank"]) \
+        if hubs else pd.DataFrame()
+    return {"pares": pares, "perfiles": perfiles, "hubs": hubs, "parametros": parametros}
+
+
+def guardar_panel(panel, directorio=None):
+    """
+    Escribe pares (ordenada por importador e industria, con índice), perfiles, hubs y
+    parametros.json en directorio (por defecto data/processed/panel/).
+    """
+    directorio = Path(directorio or PANEL_DIR)
+    directorio.mkdir(parents=True, exist_ok=True)
+    escribir_ordenado(panel["pares"], directorio / "pares.parquet", CLAVES_PANEL)
+    panel["perfiles"].to_parquet(directorio / "perfiles.parquet", index=False)
+    panel["hubs"].to_parquet(directorio / "hubs.parquet", index=False)
+    # Último en escribirse: su presencia marca un panel completo (historico_store.evolucion_panel)
+    with open(directorio / "parametros.json", "w", encoding="utf-8") as f:
+        json.dump(panel["parametros"], f, ensure_ascii=False, indent=2)
+    return directorio
+
+
+def verificar_panel(n=25, anios=(2016, 2017, 2018), industrias=2, density=0.4, seed=0, atol=1e-9):
+    """
+    Compara el panel con calculate_all_dependencies_matrix año a año (pares, perfiles
+    y frecuencia/fuerza de intermediarios) sobre tensores aleatorios en los que cada año
+    le faltan algunos países.
+
+    Returns:
+    --------
+    dict
+        Resumen de la comparación ('ok', años, diferencia máxima)
+
+    Raises:
+    -------
+    AssertionError
+        Si alguna dependencia, longitud, perfil o hub no coincide
+    """
+    from dependency_engine import calculate_all_dependencies_matrix
+    from ise_architect import calcular_perfiles
+
+    rng = np.random.default_rng(seed)
+    codigos = [f"C{k:02d}" for k in range(n)]
+    nombres_ind = [f"Industria {k}" for k in range(industrias)]
+    tensor = rng.pareto(1.5, size=(len(anios), industrias, n, n)).astype(np.float32)
+    tensor[rng.random(tensor.shape) > density] = 0.0
+    for y in range(len(anios)):
+        fuera = rng.choice(n, size=3, replace=False)
+        tensor[y][:, fuera, :] = 0.0
+        tensor[y][:, :, fuera] = 0.0
+    datos = {"tensor": tensor, "anios": list(anios), "industrias": nombres_ind, "codigos": codigos}
+    panel = calcular_panel(datos, max_possible_length=4, min_dependencia=0.0, verbose=False)
+    pares = panel["pares"].set_index(["importer", "exporter", "industry", "year"])
+
+    max_diff = 0.0
+    for y, year in enumerate(anios):
+        filas, frecuencia, fuerza = [], defaultdict(int), defaultdict(float)
+        for k, industria in enumerate(nombres_ind):
+            limpia = eliminar_filas_columnas_cero(tensor[y, k], country_names=codigos)
+            r = calculate_all_dependencies_matrix(limpia.values, limpia.columns.tolist(), max_possible_length=4)
+            for d in r["dependencies"]:
+                fila = pares.loc[(d["importador"], d["exportador"], industria, year)]
+                assert fila["en_matriz"] and fila["longitud"] == d["longitud_optima"], (d, fila)
+                assert np.isclose(fila["total"], d["dependencia_total"], rtol=1e-9, atol=atol), (d, fila)
+                max_diff = max(max_diff, abs(fila["total"] - d["dependencia_total"]))
+            filas.append(pd.DataFrame({
+                "importer": [d["importador"] for d in r["dependencies"]],
+                "exporter": [d["exportador"] for d in r["dependencies"]],
+                "industry": industria,
+                "trade_value": np.asarray([d["trade_value"] for d in r["dependencies"]], dtype=np.float32),
+                "direct": [d["dependencia_directa"] for d in r["dependencies"]],
+                "indirect": [d["dependencia_indirecta"] for d in r["dependencies"]],
+                "total": [d["dependencia_total"] for d in r["dependencies"]],
+            }))
+            for pais, f in r["intermediary_frequency"].items():
+                frecuencia[pais] += f
+                fuerza[pais] += r["intermediary_strength"][pais]
+
+        ref = calcular_perfiles(pd.concat(filas, ignore_index=True), year).set_index("country")
+        obt = panel["perfiles"][panel["perfiles"]["year"] == year].set_index("country").loc[ref.index]
+        for col in ("vulnerability", "indirect_share", "num_suppliers_effective", "importance"):
+            assert np.allclose(ref[col], obt[col], rtol=1e-9, atol=atol), (year, col)
+        assert (ref["global_rank"] == obt["global_rank"]).all(), year
+
+        hubs = panel["hubs"][panel["hubs"]["year"] == year].set_index("country")
+        assert set(hubs.index) == set(frecuencia), year
+        for pais, f in frecuencia.items():
+            assert hubs.loc[pais, "frequency_total"] == f, (year, pais)
+            assert np.isclose(hubs.loc[pais, "strength_total"], fuerza[pais], rtol=1e-9, atol=atol), (year, pais)
+
+    # Deltas: diferencia con la fila del año anterior del mismo par
+    p = panel["pares"]
+    previo = p.groupby(["importer", "exporter", "industry"])["total"].shift()
+    assert np.allclose(p["delta_total"], p["total"] - previo, equal_nan=True)
+    return {'ok': True, 'anios': len(anios), 'max_diff': max_diff}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Panel multi-año del motor ISE")
+    parser.add_argument("years", nargs="+", type=int)
+    parser.add_argument("--threshold-pct", type=float, default=0.005)
+    parser.add_argument("--longitud", type=int, default=3, help="max_possible_length")
+    parser.add_argument("--convergencia", type=float, default=0.01, help="convergence_threshold")
+    parser.add_argument("--umbral-caminos", type=float, default=0.001, help="path_strength_threshold")
+    parser.add_argument("--min-dependencia", type=float, default=0.05,
+                        help="Dependencia total mínima (en algún año) para entrar en pares.parquet")
+    parser.add_argument("--jobs", type=int, default=1, help="Industrias en paralelo (-1 = todos los núcleos)")
+    parser.add_argument("--salida", default=str(PANEL_DIR))
+    args = parser.parse_args()
+
+    instr = Instrumentacion(f"panel_{min(args.years)}_{max(args.years)}")
+    try:
+        inicio = time.perf_counter()
+        with instr.medir("panel.carga", anios=len(args.years)) as registro:
+            datos = cargar_tensores_panel(args.years)
+            registro["forma_tensor"] = list(datos["tensor"].shape)
+        panel = calcular_panel(datos, args.threshold_pct, args.convergencia, args.longitud, args.umbral_caminos,
+                               args.min_dependencia, n_jobs=args.jobs, instrumentacion=instr)
+        del datos
+        with instr.medir("panel.escritura", pares=len(panel["pares"])):
+            destino = guardar_panel(panel, args.salida)
+    finally:
+        instr.cerrar()
+    instr.imprimir_resumen(5)
+    print(f"\n PANEL COMPLETADO ({time.perf_counter() - inicio:.1f} s): {destino}")
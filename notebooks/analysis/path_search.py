@@ -0,0 +1,215 @@
+"""
+BÚSQUEDA DE RUTAS ISE
+Búsqueda best-first (tipo Dijkstra sobre -log T) de las rutas exportador → importador
+más fuertes de una industria. Sustituye la enumeración exhaustiva de combinaciones
+para obtener los critical_paths: el coste depende del número de rutas por encima de
+la fuerza mínima, no de C(n, L-1), por lo que las longitudes 4 y 5 son asequibles.
+"""
+import heapq
+from collections import defaultdict
+
+import numpy as np
+
+# Tipos de entrada en la cola de prioridad
+_CIERRE = 0   # prefijo + salto final al importador (ruta completa)
+_PREFIJO = 1  # cadena de intermediarios pendiente de extender
+
+
+def vecinos_ordenados(T):
+    """
+    (orden_filas, pesos_filas) para buscar_caminos_desde.
+
+    Con T densa: np.argsort(-T) por filas y sin pesos (se leen de T). Con T dispersa
+    (scipy.sparse): por cada fila solo sus flujos no nulos, ordenados por peso
+    decreciente (empates por índice, como el argsort estable), y sus pesos; la búsqueda
+    nunca visita los ceros.
+    """
+    if isinstance(T, np.ndarray):
+        return np.argsort(-T, axis=1, kind="stable"), None
+    T = T.tocsr()
+    T.sort_indices()
+    # Un solo lexsort (estable) por (fila, -peso) y corte por indptr
+    filas = np.repeat(np.arange(T.shape[0]), np.diff(T.indptr))
+    posiciones = np.lexsort((-T.data, filas))
+    cortes = T.indptr[1:-1]
+    return np.split(T.indices[posiciones], cortes), np.split(T.data[posiciones], cortes)
+
+
+def buscar_caminos_desde(T, j, max_possible_length=3, path_strength_threshold=0.001,
+                         top_k=3, min_fuerza=None, longitudes_j=None, orden_creciente=True,
+                         orden_filas=None, pesos_filas=None):
+    """
+    Rutas más fuertes desde el exportador j hacia todos los importadores.
+
+    La fuerza de una ruta es el producto de T a lo largo del camino, de modo que
+    maximizarla equivale a minimizar la suma de -log T. Como T <= 1 (costes no
+    negativos), las rutas salen de la cola en orden de fuerza decreciente: en cuanto
+    la fuerza extraída cae por debajo del umbral y todos los importadores tienen ya
+    sus top_k rutas, la búsqueda se detiene. Los sucesores se generan de forma
+    perezosa (hijo más fuerte primero y luego su siguiente hermano), por lo que el
+    trabajo es proporcional a las rutas que realmente se extraen.
+
+    Parameters:
+    -----------
+    T : numpy.ndarray o scipy.sparse
+        Matriz de transición (n×n); si es dispersa, orden_filas y pesos_filas son
+        obligatorios (vecinos_ordenados)
+    j : int
+        Índice del exportador
+    max_possible_length : int
+        Longitud máxima de las rutas (número de saltos)
+    path_strength_threshold : float
+        Se devuelven TODAS las rutas con fuerza > path_strength_threshold
+    top_k : int
+        Además, al menos las top_k rutas más fuertes de cada par (si existen)
+    min_fuerza : float, opcional
+        Fuerza mínima explorada para completar el top_k. Por defecto
+        path_strength_threshold / 100
+    longitudes_j : numpy.ndarray, opcional
+        Longitud máxima por importador (p. ej. la longitud de convergencia del motor)
+    orden_creciente : bool, default=True
+        True reproduce la definición del motor (intermediarios de combinations, en
+        orden creciente de índice); False admite cualquier camino simple
+    orden_filas : numpy.ndarray o lista de arrays, opcional
+        np.argsort(-T, axis=1) precalculado (se reutiliza entre exportadores), o por
+        fila solo los vecinos no nulos (vecinos_ordenados de una T dispersa)
+    pesos_filas : lista de arrays, opcional
+        T[fila, orden_filas[fila]] para cada fila (con orden_filas por vecinos)
+
+    Returns:
+    --------
+    dict
+        {i: [(longitud, intermediarios, fuerza), ...]} por fuerza descendente
+    """
+    n = T.shape[0]
+    if min_fuerza is None:
+        min_fuerza = path_strength_threshold / 100.0
+    if orden_filas is None:
+        orden_filas = np.argsort(-T, axis=1, kind="stable")
+
+    if longitudes_j is None:
+        limites = np.full(n, max_possible_length, dtype=np.int64)
+    else:
+        limites = np.minimum(np.asarray(longitudes_j, dtype=np.int64), max_possible_length)
+    limites = limites.copy()
+    limites[j] = 0
+    max_len = int(limites.max()) if n > 0 else 0
+
+    caminos = defaultdict(list)
+    if max_len < 2:
+        return caminos
+
+    cuenta = np.zeros(n, dtype=np.int64)
+    pendientes = int(np.count_nonzero(limites >= 2)) if top_k > 0 else 0
+
+    heap = []
+    seq = 0
+
+    def _siguiente_hijo(interms, p, r):
+        """Empuja el siguiente intermediario válido (rango >= r) del prefijo."""
+        nonlocal seq
+        last = interms[-1] if interms else j
+        fila = orden_filas[last]
+        pesos = None if pesos_filas is None else pesos_filas[last]
+        while r < len(fila):
+            a = int(fila[r])
+            w = T[last, a] if pesos is None else pesos[r]
+            if w == 0.0 or p * w <= min_fuerza:
+                return
+            if a != j and a not in interms and not (orden_creciente and interms and a <= last):
+                heapq.heappush(heap, (-(p * w), seq, _PREFIJO, interms + (a,), p, r))
+                seq += 1
+                return
+            r += 1
+
+    def _siguiente_cierre(interms, p, r):
+        """Empuja el siguiente importador válido (rango >= r) al que cerrar la ruta."""
+        nonlocal seq
+        last = interms[-1]
+        fila = orden_filas[last]
+        pesos = None if pesos_filas is None else pesos_filas[last]
+        L = len(interms) + 1
+        while r < len(fila):
+            i = int(fila[r])
+            w = T[last, i] if pesos is None else pesos[r]
+            if w == 0.0 or p * w <= min_fuerza:
+                return
+            if limites[i] >= L and i not in interms:
+                heapq.heappush(heap, (-(p * w), seq, _CIERRE, interms, p, r))
+                seq += 1
+                return
+            r += 1
+
+    _siguiente_hijo((), 1.0, 0)
+
+    while heap:
+        neg_valor, _, tipo, interms, p, r = heapq.heappop(heap)
+        valor = -neg_valor
+        if valor <= path_strength_threshold and pendientes == 0:
+            break
+
+        if tipo == _CIERRE:
+            last = interms[-1]
+            i = int(orden_filas[last][r])
+            if valor > path_strength_threshold or cuenta[i] < top_k:
+                caminos[i].append((len(interms) + 1, interms, float(valor)))
+                cuenta[i] += 1
+                if cuenta[i] == top_k:
+                    pendientes -= 1
+            _siguiente_cierre(interms, p, r + 1)
+            continue
+
+        # Prefijo: hermano siguiente del padre, primer hijo y primer cierre
+        padre = interms[:-1]
+        _siguiente_hijo(padre, p, r + 1)
+        nuevo_p = valor
+        if len(interms) + 2 <= max_len:
+            _siguiente_hijo(interms, nuevo_p, 0)
+        _siguiente_cierre(interms, nuevo_p, 0)
+
+    for i in caminos:
+        caminos[i].sort(key=lambda c: (-c[2], c[0], c[1]))
+    return caminos
+
+
+def buscar_mejores_caminos(T, country_names, max_possible_length=3, path_strength_threshold=0.001,
+                           top_k=3, min_fuerza=None, longitudes=None, orden_creciente=True):
+    """
+    Rutas más fuertes de todos los pares de una industria.
+
+    Parameters:
+    -----------
+    T : numpy.ndarray
+        Matriz de transición (n×n)
+    country_names : list
+        Nombres de los países en el orden de la matriz
+    longitudes : numpy.ndarray, opcional
+        Matriz n×n con la longitud máxima por par [j, i]
+    (resto de parámetros: ver buscar_caminos_desde)
+
+    Returns:
+    --------
+    dict
+        {'EXP->IMP': [path_dict, ...]} con el mismo formato que critical_paths
+        ('exportador', 'importador', 'intermediarios', 'fuerza', 'longitud')
+    """
+    n = T.shape[0]
+    orden_filas = np.argsort(-T, axis=1, kind="stable")
+    rutas = {}
+    for j in range(n):
+        caminos = buscar_caminos_desde(
+            T, j, max_possible_length, path_strength_threshold, top_k, min_fuerza,
+            None if longitudes is None else longitudes[j], orden_creciente, orden_filas
+        )
+        for i in sorted(caminos):
+            rutas[f"{country_names[j]}->{country_names[i]}"] = [
+                {
+                    'exportador': country_names[j],
+                    'importador': country_names[i],
+                    'intermediarios': [country_names[x] for x in interms],
+                    'fuerza': fuerza,
+                    'longitud': L
+                }
+                for L, interms, fuerza in caminos[i]
+            ]
+    return rutas
@@ -0,0 +1,653 @@
+"""
+ALMACÉN DE RESULTADOS ISE
+Sustituto columnar de all_results_{año}.pkl. El motor escribe cada industria en cuanto
+termina en una carpeta results_{año}/ con cuatro tablas Parquet (un row group por
+industria, países e industrias codificados como diccionario):
+
+    pairs.parquet          industry, importer, exporter, trade_value, direct, indirect,
+                           total, longitud_optima, dep_L1..dep_L{max}
+    paths.parquet          industry, exporter, importer, longitud, fuerza, intermediarios,
+                           significativo (critical_paths), mejor (best_paths)
+    intermediaries.parquet industry, country, frequency, strength, centrality
+    industries.parquet     industry, country_names, matrix_shape, max_possible_length,
+                           has_best_paths
+
+Los consumidores leen solo las columnas y filas que necesitan (memory_map + filtros).
+cargar_all_results() reconstruye el dict antiguo para los notebooks heredados.
+
+Durante el cálculo, PuntosControl guarda cada industria en cuanto termina en
+results_{año}.puntos/ para poder reanudar el año tras un fallo sin repetir lo ya hecho.
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from dependency_engine import calculate_intermediary_centrality, parametros_motor
+
+BASE_PATH = Path(__file__).resolve().parent.parent.parent
+RESULTS_DIR = BASE_PATH / "data" / "processed" / "dependencias_consolidadas"
+
+TABLAS = ("pairs", "paths", "intermediaries", "industries")
+_DICT = pa.dictionary(pa.int32(), pa.string())
+
+
+def ruta_resultados(year, results_dir=None):
+    """Carpeta del almacén de un año (junto a all_results_{año}.pkl)."""
+    return Path(results_dir or RESULTS_DIR) / f"results_{year}"
+
+
+def _esquemas(max_possible_length, trade_type):
+    pares = pa.schema(
+        [
+            ("industry", _DICT),
+            ("importer", _DICT),
+            ("exporter", _DICT),
+            ("trade_value", trade_type),
+            ("direct", pa.float64()),
+            ("indirect", pa.float64()),
+            ("total", pa.float64()),
+            ("longitud_optima", pa.int8()),
+        ]
+        + [(f"dep_L{L}", pa.float64()) for L in range(1, max_possible_length + 1)]
+    )
+    caminos = pa.schema([
+        ("industry", _DICT),
+        ("exporter", _DICT),
+        ("importer", _DICT),
+        ("longitud", pa.int8()),
+        ("fuerza", pa.float64()),
+        ("intermediarios", pa.list_(pa.string())),
+        ("significativo", pa.bool_()),
+        ("mejor", pa.bool_()),
+    ])
+    intermediarios = pa.schema([
+        ("industry", _DICT),
+        ("country", _DICT),
+        ("frequency", pa.int64()),
+        ("strength", pa.float64()),
+        ("centrality", pa.float64()),
+    ])
+    industrias = pa.schema([
+        ("industry", pa.string()),
+        ("country_names", pa.list_(pa.string())),
+        ("matrix_shape", pa.list_(pa.int32())),
+        ("max_possible_length", pa.int8()),
+        ("has_best_paths", pa.bool_()),
+    ])
+    return {"pairs": pares, "paths": caminos, "intermediaries": intermediarios, "industries": industrias}
+
+
+def _tabla(columnas, schema):
+    """Tabla Arrow con las columnas de texto codificadas como diccionario."""
+    arrays = []
+    for campo in schema:
+        valores = columnas[campo.name]
+        if pa.types.is_dictionary(campo.type):
+            arrays.append(pa.array(valores, pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(valores, campo.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _columnas_industria(industry, entrada, max_possible_length):
+    """Convierte la entrada de all_results de una industria en columnas de las cuatro tablas."""
+    results = entrada['results']
+    deps = results['dependencies']
+    ci = results['critical_intermediaries']
+    best = results.get('best_paths') or {}
+
+    pares = {c: [] for c in ("importer", "exporter", "trade_value", "direct", "indirect",
+                             "total", "longitud_optima")}
+    por_longitud = [[] for _ in range(max_possible_length)]
+    caminos = {c: [] for c in ("exporter", "importer", "longitud", "fuerza", "intermediarios",
+                               "significativo", "mejor")}
+
+    for dep in deps:
+        pares["importer"].append(dep['importador'])
+        pares["exporter"].append(dep['exportador'])
+        pares["trade_value"].append(dep['trade_value'])
+        pares["direct"].append(dep['dependencia_directa'])
+        pares["indirect"].append(dep['dependencia_indirecta'])
+        pares["total"].append(dep['dependencia_total'])
+        pares["longitud_optima"].append(dep['longitud_optima'])
+        por_l = dep['dependencias_por_longitud']
+        for L in range(1, max_possible_length + 1):
+            por_longitud[L - 1].append(por_l.get(L))
+
+        # Caminos del par: primero las best_paths (prefijo de las rutas del motor) y
+        # después las significativas que no estén entre ellas, en su orden
+        pair_key = f"{dep['exportador']}->{dep['importador']}"
+        significativos = ci.get(pair_key, [])
+        mejores = best.get(pair_key, [])
+        claves_sig = {(p['longitud'], tuple(p['intermediarios'])) for p in significativos}
+        claves_mej = {(p['longitud'], tuple(p['intermediarios'])) for p in mejores}
+        restantes = [p for p in significativos
+                     if (p['longitud'], tuple(p['intermediarios'])) not in claves_mej]
+        for p in mejores + restantes:
+            clave = (p['longitud'], tuple(p['intermediarios']))
+            caminos["exporter"].append(p['exportador'])
+            caminos["importer"].append(p['importador'])
+            caminos["longitud"].append(p['longitud'])
+            caminos["fuerza"].append(p['fuerza'])
+            caminos["intermediarios"].append(list(p['intermediarios']))
+            caminos["significativo"].append(clave in claves_sig)
+            caminos["mejor"].append(clave in claves_mej)
+
+    pares["industry"] = [industry] * len(deps)
+    for L in range(1, max_possible_length + 1):
+        pares[f"dep_L{L}"] = por_longitud[L - 1]
+    caminos["industry"] = [industry] * len(caminos["exporter"])
+
+    country_names = list(entrada['country_names'])
+    score = {c: s for c, _, _, s in results.get('intermediary_centrality', [])}
+    intermediarios = {
+        "industry": [industry] * len(country_names),
+        "country": country_names,
+        "frequency": [results['intermediary_frequency'].get(c, 0) for c in country_names],
+        "strength": [results['intermediary_strength'].get(c, 0.0) for c in country_names],
+        "centrality": [score.get(c, 0.0) for c in country_names],
+    }
+    industria = {
+        "industry": [industry],
+        "country_names": [country_names],
+        "matrix_shape": [list(entrada['matrix_shape'])],
+        "max_possible_length": [max_possible_length],
+        "has_best_paths": ['best_paths' in results],
+    }
+    return {"pairs": pares, "paths": caminos, "intermediaries": intermediarios, "industries": industria}
+
+
+class EscritorResultados:
+    """
+    Escribe el almacén de un año industria a industria (un row group por industria).
+
+    Se usa como context manager; los ficheros se escriben en una carpeta temporal
+    que sustituye a la definitiva solo al cerrar sin errores.
+
+        with EscritorResultados(ruta_resultados(anio)) as escritor:
+            escritor.agregar_industria(industry, all_results[industry])
+    """
+
+    def __init__(self, directory, parametros=None, compression="zstd"):
+        self.directory = Path(directory)
+        self.temporal = self.directory.with_name(self.directory.name + ".tmp")
+        self.respaldo = self.directory.with_name(self.directory.name + ".old")
+        if self.respaldo.exists() and not self.directory.exists():
+            # Una publicación anterior se cortó entre los dos renombrados: se recupera el almacén
+            os.replace(self.respaldo, self.directory)
+        self.parametros = dict(parametros or {})
+        self.compression = compression
+        self.industrias = []
+        self._writers = None
+        self._esquemas = None
+        self._max_len = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        self.cerrar(descartar=tipo is not None)
+        return False
+
+    def _abrir(self, max_possible_length, trade_type):
+        if self.temporal.exists():
+            shutil.rmtree(self.temporal)
+        self.temporal.mkdir(parents=True)
+        self._max_len = max_possible_length
+        self._esquemas = _esquemas(max_possible_length, trade_type)
+        self._writers = {
+            nombre: pq.ParquetWriter(self.temporal / f"{nombre}.parquet", schema,
+                                     compression=self.compression)
+            for nombre, schema in self._esquemas.items()
+        }
+
+    def agregar_industria(self, industry, entrada):
+        """Añade la entrada de all_results de una industria."""
+        results = entrada['results']
+        if self._writers is None:
+            deps = results['dependencies']
+            trade_type = (pa.from_numpy_dtype(np.asarray(deps[0]['trade_value']).dtype)
+                          if deps else pa.float64())
+            self._abrir(len(results['length_distribution']), trade_type)
+
+        columnas = _columnas_industria(industry, entrada, self._max_len)
+        for nombre, writer in self._writers.items():
+            tabla = _tabla(columnas[nombre], self._esquemas[nombre])
+            # Exactamente un row group por industria (también vacío) en todas las tablas
+            writer.write_table(tabla, row_group_size=max(tabla.num_rows, 1))
+        self.industrias.append(industry)
+
+    def copiar_industria(self, industry, origen=None):
+        """
+        Copia tal cual una industria de otro almacén (por defecto, el que esta escritura
+        va a sustituir). Es la vía de la reconstrucción incremental para las industrias
+        cuya huella no ha cambiado (ver manifiesto.py).
+        """
+        origen = Path(origen or self.directory)
+        industrias = pq.read_table(origen / "industries.parquet", columns=["industry"]) \
+            .column("industry").to_pylist()
+        if industry not in industrias:
+            raise KeyError(f"La industria '{industry}' no está en {origen}")
+        if self._writers is None:
+            info = pq.read_table(origen / "industries.parquet",
+                                 filters=[("industry", "==", industry)]).to_pylist()[0]
+            trade_type = pq.read_schema(origen / "pairs.parquet").field("trade_value").type
+            self._abrir(info["max_possible_length"], trade_type)
+
+        tablas = _leer_industria(origen, industrias.index(industry), industry, TABLAS)
+        for nombre, writer in self._writers.items():
+            tabla = tablas[nombre].cast(self._esquemas[nombre])
+            writer.write_table(tabla, row_group_size=max(tabla.num_rows, 1))
+        self.industrias.append(industry)
+
+    def leer_industria(self, industry, origen=None):
+        """Entrada de all_results de una industria del almacén que se va a sustituir."""
+        return cargar_all_results(origen or self.directory, [industry])[industry]
+
+    def cerrar(self, descartar=False):
+        """Cierra los ficheros y publica la carpeta (o la descarta si hubo error)."""
+        if self._writers is not None:
+            for writer in self._writers.values():
+                writer.close()
+            self._writers = None
+        if descartar:
+            if self.temporal.exists():
+                shutil.rmtree(self.temporal)
+            return
+        if not self.temporal.exists():
+            # Año sin industrias: almacén vacío pero válido
+            self._abrir(1, pa.float64())
+            for writer in self._writers.values():
+                writer.close()
+            self._writers = None
+
+        with open(self.temporal / "_meta.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "industrias": len(self.industrias),
+                "max_possible_length": self._max_len,
+                "parametros": self.parametros,
+            }, f, ensure_ascii=False, indent=2)
+
+        # Publicación: el almacén anterior se aparta antes de colocar el nuevo y solo se
+        # borra después, así que en ningún momento queda el año sin almacén publicado
+        if self.respaldo.exists():
+            shutil.rmtree(self.respaldo)
+        if self.directory.exists():
+            os.replace(self.directory, self.respaldo)
+        os.replace(self.temporal, self.directory)
+        if self.respaldo.exists():
+            shutil.rmtree(self.respaldo)
+
+
+def guardar_resultados(all_results, directory, parametros=None):
+    """Escribe un all_results completo en el almacén columnar."""
+    with EscritorResultados(directory, parametros) as escritor:
+        for industry, entrada in all_results.items():
+            escritor.agregar_industria(industry, entrada)
+    return Path(directory)
+
+
+def convertir_pkl(pkl_path, directory=None):
+    """Migra un all_results_{año}.pkl existente al almacén columnar."""
+    pkl_path = Path(pkl_path)
+    if directory is None:
+        directory = pkl_path.with_name(pkl_path.stem.replace("all_results", "results"))
+    with open(pkl_path, "rb") as f:
+        all_results = pickle.load(f)
+    return guardar_resultados(all_results, directory)
+
+
+def leer_arrow(directory, tabla, columns=None, filters=None):
+    """Como leer_tabla, pero devuelve la tabla Arrow (sin convertir a pandas)."""
+    if tabla not in TABLAS:
+        raise ValueError(f"❌ tabla debe ser una de {TABLAS}. Recibido: {tabla}")
+    ruta = Path(directory) / f"{tabla}.parquet"
+    if not ruta.exists():
+        raise FileNotFoundError(f"No existe {ruta}")
+    return pq.read_table(ruta, columns=columns, filters=filters, memory_map=True)
+
+
+def leer_tabla(directory, tabla, columns=None, filters=None):
+    """
+    Lee una tabla del almacén como DataFrame, solo con las columnas y filas pedidas.
+
+    Parameters:
+    -----------
+    directory : Path
+        Carpeta results_{año}
+    tabla : str
+        "pairs", "paths", "intermediaries" o "industries"
+    columns : list, opcional
+        Columnas a leer
+    filters : list, opcional
+        Filtros de pyarrow, p. ej. [("importer", "==", "ESP")]; descartan row groups
+        por estadísticas antes de leer
+    """
+    return leer_arrow(directory, tabla, columns, filters).to_pandas()
+
+
+def _leer_industria(directory, k, industry, columns):
+    """Tablas Arrow de la industria k: su row group si el almacén está alineado, si no un filtro."""
+    directory = Path(directory)
+    if not isinstance(columns, dict):
+        columns = {nombre: None for nombre in columns}
+    num_industrias = pq.ParquetFile(directory / "industries.parquet").metadata.num_rows
+    tablas = {}
+    for nombre, cols in columns.items():
+        fichero = pq.ParquetFile(directory / f"{nombre}.parquet", memory_map=True)
+        if fichero.metadata.num_row_groups == num_industrias:
+            tablas[nombre] = fichero.read_row_group(k, columns=cols)
+        else:
+            # Almacén escrito con otros row groups: filtro por industria
+            tablas[nombre] = leer_arrow(directory, nombre, cols, [("industry", "==", industry)])
+    return tablas
+
+
+def iterar_industrias(directory, columns=None, pandas=True):
+    """
+    Recorre el almacén industria a industria sin cargar el año entero.
+
+    Parameters:
+    -----------
+    directory : Path
+        Carpeta results_{año}
+    columns : dict, opcional
+        {tabla: [columnas]} de "pairs", "paths" e "intermediaries" (por defecto todas)
+    pandas : bool, default=True
+        False devuelve las tablas Arrow (útil para columnas de listas como intermediarios)
+
+    Yields:
+    -------
+    tuple
+        (fila de industries como dict, {tabla: DataFrame (o tabla Arrow) de esa industria})
+    """
+    directory = Path(directory)
+    columns = columns or {nombre: None for nombre in TABLAS if nombre != "industries"}
+    industrias = pq.read_table(directory / "industries.parquet").to_pylist()
+    ficheros = {nombre: pq.ParquetFile(directory / f"{nombre}.parquet", memory_map=True)
+                for nombre in columns}
+    alineado = all(f.metadata.num_row_groups == len(industrias) for f in ficheros.values())
+
+    for k, info in enumerate(industrias):
+        if alineado:
+            tablas = {nombre: f.read_row_group(k, columns=columns[nombre])
+                      for nombre, f in ficheros.items()}
+        else:
+            # Almacén escrito con otros row groups: filtro por industria
+            tablas = {nombre: leer_arrow(directory, nombre, columns[nombre],
+                                         [("industry", "==", info["industry"])])
+                      for nombre in ficheros}
+        yield info, ({nombre: t.to_pandas() for nombre, t in tablas.items()} if pandas else tablas)
+
+
+def parametros_almacen(directory):
+    """Parámetros del motor con que se escribió el almacén (_meta.json), completados con los de por defecto."""
+    parametros = parametros_motor()
+    try:
+        with open(Path(directory) / "_meta.json", encoding="utf-8") as f:
+            parametros.update(json.load(f).get("parametros") or {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    return parametros
+
+
+def matriz_desde_pares(pares, country_names):
+    """
+    Matriz limpia X (exportador × importador, float64) de una industria del almacén.
+
+    Fuera de la diagonal es trade_value; la diagonal (comercio doméstico, que cuenta en
+    el denominador d_i pero no está en pairs) sale de d_i = trade_value / direct de
+    cualquier par con direct > 0 menos lo importado del resto. Un importador sin
+    ningún proveedor con dependencia positiva se queda sin comercio doméstico.
+
+    Parameters:
+    -----------
+    pares : pyarrow.Table o pandas.DataFrame
+        Columnas importer, exporter, trade_value y direct de la industria
+    country_names : list
+        Países de la matriz limpia (columna country_names de industries)
+    """
+    if not isinstance(pares, pa.Table):
+        pares = pa.Table.from_pandas(pares[["importer", "exporter", "trade_value", "direct"]], preserve_index=False)
+    etiquetas = pa.array(list(country_names), pa.string())
+
+    def posiciones(columna):
+        columna = pares.column(columna)
+        if pa.types.is_dictionary(columna.type):
+            columna = columna.cast(pa.string())
+        return pc.index_in(columna, value_set=etiquetas).to_numpy(zero_copy_only=False)
+
+    n = len(etiquetas)
+    i, j = posiciones("importer"), posiciones("exporter")
+    valor = pares.column("trade_value").to_numpy().astype(np.float64)
+    direct = pares.column("direct").to_numpy().astype(np.float64)
+
+    X = np.zeros((n, n), dtype=np.float64)
+    X[j, i] = valor
+    denom = np.zeros(n, dtype=np.float64)
+    con = direct > 0
+    denom[i[con]] = valor[con] / direct[con]
+    X[np.arange(n), np.arange(n)] = np.maximum(denom - X.sum(axis=0), 0.0)
+    return X
+
+
+def cargar_all_results(directory, industrias=None):
+    """
+    Reconstruye el dict all_results del PKL (solo para notebooks heredados).
+
+    Los valores son los mismos; los escalares vuelven como float/int de Python.
+    """
+    directory = Path(directory)
+    filtro = [("industry", "in", list(industrias))] if industrias is not None else None
+    tablas = {
+        nombre: pq.read_table(directory / f"{nombre}.parquet", filters=filtro).to_pylist()
+        for nombre in TABLAS
+    }
+
+    pares_por_ind, caminos_por_ind, interm_por_ind = {}, {}, {}
+    for fila in tablas["pairs"]:
+        pares_por_ind.setdefault(fila["industry"], []).append(fila)
+    for fila in tablas["paths"]:
+        caminos_por_ind.setdefault(fila["industry"], {}).setdefault(
+            f"{fila['exporter']}->{fila['importer']}", []).append(fila)
+    for fila in tablas["intermediaries"]:
+        interm_por_ind.setdefault(fila["industry"], []).append(fila)
+
+    all_results = {}
+    for info in tablas["industries"]:
+        industry = info["industry"]
+        max_len = info["max_possible_length"]
+        country_names = info["country_names"]
+        caminos = caminos_por_ind.get(industry, {})
+
+        results = {
+            'dependencies': [],
+            'top_dependencies': [],
+            'avg_dependencies': {},
+            'length_distribution': np.zeros(max_len),
+            'critical_intermediaries': {},
+            'intermediary_frequency': {},
+            'critical_paths': [],
+            'intermediary_strength': {}
+        }
+        best_paths = {}
+        sumas = {}
+        for fila in pares_por_ind.get(industry, []):
+            imp, exp = fila["importer"], fila["exporter"]
+            L_opt = fila["longitud_optima"]
+            dep = {
+                'importador': imp,
+                'exportador': exp,
+                'trade_value': fila["trade_value"],
+                'dependencia_directa': fila["direct"],
+                'dependencia_indirecta': fila["indirect"],
+                'dependencia_total': fila["total"],
+                'longitud_optima': L_opt,
+                'dependencias_por_longitud': {
+                    L: fila[f"dep_L{L}"] for L in range(1, max_len + 1) if fila[f"dep_L{L}"] is not None
+                }
+            }
+            results['dependencies'].append(dep)
+            results['top_dependencies'].append(
+                (imp, exp, fila["direct"], fila["indirect"], fila["total"], L_opt))
+            if L_opt > 1:
+                results['length_distribution'][L_opt - 1] += 1
+            total, num = sumas.get(imp, (0.0, 0))
+            sumas[imp] = (total + fila["total"], num + 1)
+
+            pair_key = f"{exp}->{imp}"
+            rutas = [
+                ({'exportador': c["exporter"], 'importador': c["importer"],
+                  'intermediarios': c["intermediarios"], 'fuerza': c["fuerza"],
+                  'longitud': c["longitud"]}, c["significativo"], c["mejor"])
+                for c in caminos.get(pair_key, [])
+            ]
+            results['critical_intermediaries'][pair_key] = [r for r, sig, _ in rutas if sig]
+            results['critical_paths'].extend(results['critical_intermediaries'][pair_key])
+            mejores = [dict(r) for r, _, mej in rutas if mej]
+            if mejores:
+                best_paths[pair_key] = mejores
+
+        for country in country_names:
+            total, num = sumas.get(country, (0.0, 0))
+            results['avg_dependencies'][country] = total / num if num > 0 else 0
+        for fila in interm_por_ind.get(industry, []):
+            results['intermediary_frequency'][fila["country"]] = fila["frequency"]
+            results['intermediary_strength'][fila["country"]] = fila["strength"]
+
+        results['top_dependencies'].sort(key=lambda x: x[4], reverse=True)
+        results['top_dependencies'] = results['top_dependencies'][:90]
+        results['critical_paths'].sort(key=lambda x: x['fuerza'], reverse=True)
+        results['intermediary_centrality'] = calculate_intermediary_centrality(
+            results['intermediary_frequency'], results['intermediary_strength'], country_names
+        )
+        if info["has_best_paths"]:
+            results['best_paths'] = best_paths
+
+        all_results[industry] = {
+            'results': results,
+            'country_names': country_names,
+            'matrix_shape': tuple(info["matrix_shape"]),
+        }
+    return all_results
+
+
+class ResultadosAlmacen(Mapping):
+    """
+    all_results de solo lectura sobre el almacén: cada industria se carga al pedirla
+    (cargar_all_results de una sola industria), de modo que recorrer .items() mantiene
+    en memoria una industria cada vez en lugar del año entero.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._industrias = pq.read_table(self.directory / "industries.parquet", columns=["industry"]) \
+            .column("industry").to_pylist()
+        self._ultima = (None, None)
+
+    def __getitem__(self, industry):
+        if industry not in self._industrias:
+            raise KeyError(industry)
+        if self._ultima[0] != industry:
+            self._ultima = (industry, cargar_all_results(self.directory, [industry])[industry])
+        return self._ultima[1]
+
+    def __iter__(self):
+        return iter(self._industrias)
+
+    def __len__(self):
+        return len(self._industrias)
+
+
+# ============================================================
+# PUNTOS DE CONTROL POR INDUSTRIA (reanudación tras un fallo)
+# ============================================================
+
+def ruta_puntos_control(directory):
+    """Carpeta de puntos de control junto al almacén: results_2016 → results_2016.puntos."""
+    directory = Path(directory)
+    return directory.with_name(directory.name + ".puntos")
+
+
+class PuntosControl:
+    """
+    Guarda cada industria en cuanto termina, como un mini almacén propio
+    ({carpeta}/{huella del nombre}/, escrito con EscritorResultados: carpeta temporal
+    renombrada al cerrar), y anota en _fallos.json las industrias que fallaron o se
+    saltaron. Si el proceso muere (OOM, reinicio del kernel), la siguiente ejecución
+    reanuda con las industrias ya guardadas cuya clave (clave_industria) coincide.
+
+        puntos = PuntosControl(ruta_puntos_control(results_dir))
+        calcular_todas_las_industrias(..., escritor=escritor, puntos_control=puntos)
+        puntos.limpiar()  # tras publicar el almacén del año
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._ruta_fallos = self.directory / "_fallos.json"
+
+    def ruta(self, industry):
+        nombre = hashlib.sha256(str(industry).encode("utf-8")).hexdigest()[:20]
+        return self.directory / nombre
+
+    def guardar(self, industry, entrada, clave=None):
+        """Persiste la entrada de all_results de una industria (y borra su fallo previo)."""
+        guardar_resultados({industry: entrada}, self.ruta(industry), {"industry": industry, "clave": clave})
+        fallos = self.fallos()
+        if fallos.pop(industry, None) is not None:
+            self._escribir_fallos(fallos)
+
+    def completadas(self):
+        """{industria: clave} de las industrias guardadas (las carpetas a medio escribir se ignoran)."""
+        hechas = {}
+        for meta in self.directory.glob("*/_meta.json"):
+            if meta.parent.name.endswith(".tmp"):
+                continue
+            with open(meta, encoding="utf-8") as f:
+                parametros = json.load(f)["parametros"]
+            hechas[parametros["industry"]] = parametros.get("clave")
+        return hechas
+
+    def leer(self, industry):
+        return cargar_all_results(self.ruta(industry), [industry])[industry]
+
+    def fallos(self):
+        """{industria: {"estado": "error" | "saltada", "error", "clave"}}"""
+        try:
+            with open(self._ruta_fallos, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def registrar_fallo(self, industry, estado, error=None, clave=None):
+        fallos = self.fallos()
+        fallos[industry] = {"estado": estado, "error": error, "clave": clave}
+        self._escribir_fallos(fallos)
+
+    def _escribir_fallos(self, fallos):
+        temporal = self._ruta_fallos.with_name(f"{self._ruta_fallos.name}.{os.getpid()}.tmp")
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(fallos, f, ensure_ascii=False, indent=2)
+        os.replace(temporal, self._ruta_fallos)
+
+    def limpiar(self, conservar_fallos=True):
+        """
+        Borra las industrias guardadas (ya están en el almacén publicado). Con
+        conservar_fallos, _fallos.json se mantiene para que un reintento recalcule solo
+        las industrias que fallaron o se saltaron.
+        """
+        for ruta in self.directory.iterdir():
+            if ruta.is_dir():
+                shutil.rmtree(ruta)
+        if not conservar_fallos or not self.fallos():
+            shutil.rmtree(self.directory)
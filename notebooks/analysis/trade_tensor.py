@@ -0,0 +1,86 @@
+"""
+TENSOR DE COMERCIO ISE
+Construye todas las matrices de comercio bilateral de un año como un único array
+float32 (industrias, n, n) en una sola pasada vectorizada (códigos enteros + bincount),
+en lugar de un pivot_table por industria. Las matrices por industria son vistas del
+tensor y los totales de importación salen de una única suma por eje.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _codigos(valores, categorias):
+    """Índice entero de cada valor en categorias (-1 si no está)."""
+    return pd.Index(categorias).get_indexer(valores)
+
+
+def crear_tensor_comercio(df, codigos_paises, industrias=None, industry_col="industry_descr",
+                          trade_col="trade", exporter_col="exporter_iso3", importer_col="importer_iso3"):
+    """
+    Tensor de flujos exportador → importador de todas las industrias.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Registros del ITP de un año
+    codigos_paises : list
+        Países (ISO3) que forman filas y columnas de cada matriz, en ese orden
+    industrias : list, opcional
+        Industrias (valores de industry_col) en el orden del tensor. Por defecto las
+        presentes en df ordenadas, igual que las claves de df.groupby(industry_col)
+    industry_col, trade_col, exporter_col, importer_col : str
+        Columnas de industria, valor de comercio, exportador e importador
+
+    Returns:
+    --------
+    tuple
+        (tensor, industrias) con tensor float32 de forma (len(industrias), n, n) y
+        tensor[k, e, i] = comercio de e hacia i en la industria k (duplicados sumados)
+    """
+    if industrias is None:
+        industrias = sorted(df[industry_col].dropna().unique().tolist())
+    k, n = len(industrias), len(codigos_paises)
+
+    ind = _codigos(df[industry_col], industrias)
+    exp = _codigos(df[exporter_col], codigos_paises)
+    imp = _codigos(df[importer_col], codigos_paises)
+    valor = df[trade_col].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    # Fuera de la lista de países/industrias o sin valor: no cuentan
+    validas = (ind >= 0) & (exp >= 0) & (imp >= 0) & ~np.isnan(valor)
+    plano = (ind[validas].astype(np.int64) * n + exp[validas]) * n + imp[validas]
+
+    tensor = np.bincount(plano, weights=valor[validas], minlength=k * n * n)
+    return tensor.astype(np.float32).reshape(k, n, n), industrias
+
+
+def matrices_desde_tensor(tensor, industrias, codigos_paises):
+    """
+    {industria: DataFrame(exportadores × importadores)} sin copiar datos.
+
+    Cada DataFrame envuelve la vista tensor[k]; eliminar_filas_columnas_cero y el motor
+    trabajan directamente sobre ellas.
+    """
+    return {
+        industria: pd.DataFrame(tensor[k], index=codigos_paises, columns=codigos_paises, copy=False)
+        for k, industria in enumerate(industrias)
+    }
+
+
+def totales_importacion(tensor, industrias, codigos_paises):
+    """
+    Totales importados por país e industria (suma por exportadores).
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Columnas pais, industria, valor_importado; industria por industria y, dentro,
+        en el orden de codigos_paises
+    """
+    totales = tensor.sum(axis=1)
+    k, n = totales.shape
+    return pd.DataFrame({
+        "pais": np.tile(np.asarray(codigos_paises, dtype=object), k),
+        "industria": np.repeat(np.asarray(industrias, dtype=object), n),
+        "valor_importado": totales.ravel().astype(np.float64),
+    })
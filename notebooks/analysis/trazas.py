@@ -0,0 +1,481 @@
+"""
+TRAZAS DE DEPENDENCIA ISE
+Explica de dónde sale la dependencia de un par (p. ej. CHN → ESP en baterías) como
+datos, sin el informe impreso de analizar_dependencia_trazable ni repetir en cada
+llamada la limpieza, T y la enumeración de combinations:
+
+    servicio = ServicioTrazas()
+    traza = servicio.trazar(2022, "Accumulators primary cells and batteries", "CHN", "ESP")
+    traza["resumen"]["desglose_por_longitud"]     # {1: directa, 2: ..., 3: ...}
+    traza["caminos"][0]["desglose_pasos"]         # X, importaciones y T de cada salto
+
+    trazas = servicio.trazar_lote(pares_df)       # columnas year, industry, exporter, importer
+    tabla_trazas(trazas)                          # una fila por par
+
+Por (año, industria) se guardan en una caché LRU acotada en bytes la matriz limpia X,
+los denominadores, T y las dependencias por longitud de todos los pares (los mismos
+productos de matrices del motor), así que tras la primera consulta de una industria
+cada traza es una lectura de esas matrices más una búsqueda best-first de las rutas del
+par (path_search). Las matrices salen del almacén del motor (results_{año}/, leído por
+memory map y reconstruido con results_store.matriz_desde_pares) o de las
+matrices_comercio del notebook (registrar_matrices). Las sumas siguen el criterio de
+convergencia del motor (también en L=2), de modo que coinciden con los resultados
+guardados.
+"""
+import threading
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from dependency_engine import (
+    calcular_dependencias_por_longitud,
+    calcular_longitudes_convergencia,
+    eliminar_filas_columnas_cero,
+    parametros_motor,
+)
+from path_search import buscar_caminos_desde
+from results_store import RESULTS_DIR, _leer_industria, matriz_desde_pares, parametros_almacen, ruta_resultados
+
+CACHE_MB = 256  # Tamaño por defecto de la caché de matrices por (año, industria)
+
+
+def _desglose(camino, X, denom, nombres):
+    """Pasos de un camino: comercio, importaciones totales del destino y T de cada salto."""
+    pasos = []
+    for a, b in zip(camino[:-1], camino[1:]):
+        x_ab, d_b = float(X[a, b]), float(denom[b])
+        t_ab = x_ab / d_b if d_b > 0 else 0.0
+        pasos.append({
+            'de': nombres[a],
+            'a': nombres[b],
+            'valor_X': x_ab,
+            'importaciones_totales': d_b,
+            'T_valor': t_ab,
+            'formula': f'{x_ab:.10f} / {d_b:.10f} = {t_ab:.10f}',
+        })
+    return pasos
+
+
+class ServicioTrazas:
+    """
+    Trazas de pares exportador → importador con caché de matrices por (año, industria).
+
+    Parameters:
+    -----------
+    results_dir : Path, opcional
+        Carpeta con los almacenes results_{año}/ (por defecto la del motor)
+    max_mb : float
+        Memoria máxima de la caché; se descartan primero las industrias usadas hace más tiempo
+    """
+
+    def __init__(self, results_dir=None, max_mb=CACHE_MB):
+        self.results_dir = Path(results_dir or RESULTS_DIR)
+        self.max_bytes = int(max_mb * (1 << 20))
+        self._cache = OrderedDict()
+        self._bytes = 0
+        self._anios = {}
+        self._registradas = {}
+        # El candado solo protege la caché y los metadatos; la carga y los productos de T
+        # de una industria se calculan fuera, con un Event por clave en curso para que
+        # dos peticiones de la misma industria no la calculen dos veces
+        self._lock = threading.Lock()
+        self._en_curso = {}
+        self._generacion = {}
+        self.aciertos = 0
+        self.fallos = 0
+
+    # ---------- fuentes ----------
+
+    def registrar_matrices(self, year, matrices_comercio, threshold_pct=0.005, **parametros):
+        """
+        Usa las matrices_comercio del notebook (sin limpiar) como fuente de year en lugar
+        del almacén. parametros sustituye a los del motor por defecto (max_possible_length...).
+        """
+        with self._lock:
+            self._registradas[year] = (matrices_comercio, threshold_pct, {**parametros_motor(), **parametros})
+            self._descartar_anio(year)
+
+    def _anio(self, year):
+        """Industrias, parámetros y huella del almacén de year (se relee si ha cambiado)."""
+        store_dir = ruta_resultados(year, self.results_dir)
+        try:
+            huella = tuple((s.st_size, s.st_mtime_ns) for s in
+                           ((store_dir / f).stat() for f in ("industries.parquet", "pairs.parquet")))
+        except FileNotFoundError:
+            raise ValueError(f"No hay almacén de resultados para {year} ({store_dir})") from None
+        actual = self._anios.get(year)
+        if actual is None or actual["huella"] != huella:
+            self._descartar_anio(year)
+            filas = pq.read_table(store_dir / "industries.parquet",
+                                  columns=["industry", "country_names", "max_possible_length"]).to_pylist()
+            actual = {
+                "huella": huella,
+                "store_dir": store_dir,
+                "industrias": {f["industry"]: (k, f) for k, f in enumerate(filas)},
+                "parametros": parametros_almacen(store_dir),
+            }
+            self._anios[year] = actual
+        return actual
+
+    def _descartar_anio(self, year):
+        # Las entradas de year que se estén calculando ya no se guardarán en la caché
+        self._generacion[year] = self._generacion.get(year, 0) + 1
+        for clave in [c for c in self._cache if c[0] == year]:
+            self._bytes -= self._cache.pop(clave)["bytes"]
+        self._anios.pop(year, None)
+
+    def industrias(self, year):
+        """Industrias disponibles de year."""
+        with self._lock:
+            if year in self._registradas:
+                return list(self._registradas[year][0])
+            return list(self._anio(year)["industrias"])
+
+    def _fuente(self, year):
+        """Fuente de year: matrices registradas o metadatos del almacén (con el candado)."""
+        if year in self._registradas:
+            return ("registradas", self._registradas[year])
+        return ("almacen", self._anio(year))
+
+    @staticmethod
+    def _cargar(fuente, year, industry):
+        """(X limpia float64, países, parámetros) de industry en la fuente de year (sin el candado)."""
+        tipo, datos = fuente
+        if tipo == "registradas":
+            matrices, threshold_pct, parametros = datos
+            if industry not in matrices:
+                raise ValueError(f"Industria '{industry}' no encontrada en {year}")
+            limpia = eliminar_filas_columnas_cero(matrices[industry], threshold_pct=threshold_pct)
+            return limpia.to_numpy(dtype=np.float64), limpia.columns.tolist(), parametros
+        anio = datos
+        if industry not in anio["industrias"]:
+            raise ValueError(f"Industria '{industry}' no encontrada en {year}")
+        k, info = anio["industrias"][industry]
+        pares = _leer_industria(anio["store_dir"], k, industry,
+                                {"pairs": ["importer", "exporter", "trade_value", "direct"]})["pairs"]
+        nombres = list(info["country_names"])
+        parametros = {**anio["parametros"], "max_possible_length": info["max_possible_length"]}
+        return matriz_desde_pares(pares, nombres), nombres, parametros
+
+    def matriz(self, year, industry):
+        """
+        Entrada de la caché de (year, industry).
+
+        Returns:
+        --------
+        dict
+            'paises', 'posicion' {país: índice}, 'X', 'denom' (importaciones totales), 'T',
+            'dependencias' {L: n×n}, 'indirecta' y 'longitud' (convergencia del motor),
+            'parametros'
+        """
+        clave = (year, industry)
+        while True:
+            with self._lock:
+                fuente = self._fuente(year)
+                if clave in self._cache:
+                    self._cache.move_to_end(clave)
+                    self.aciertos += 1
+                    return self._cache[clave]
+                en_curso = self._en_curso.get(clave)
+                if en_curso is None:
+                    en_curso = self._en_curso[clave] = threading.Event()
+                    generacion = self._generacion.get(year, 0)
+                    self.fallos += 1
+                    break
+            # Otra petición está calculando la misma industria: se espera y se vuelve a
+            # mirar la caché (si falló, esta petición lo intenta por su cuenta)
+            en_curso.wait()
+
+        try:
+            entrada = self._calcular_entrada(*self._cargar(fuente, year, industry))
+            with self._lock:
+                if self._generacion.get(year, 0) == generacion:
+                    self._cache[clave] = entrada
+                    self._bytes += entrada["bytes"]
+                    # La entrada recién cargada se conserva aunque supere sola el límite
+                    while self._bytes > self.max_bytes and len(self._cache) > 1:
+                        _, vieja = self._cache.popitem(last=False)
+                        self._bytes -= vieja["bytes"]
+            return entrada
+        finally:
+            with self._lock:
+                self._en_curso.pop(clave, None)
+            en_curso.set()
+
+    @staticmethod
+    def _calcular_entrada(X, nombres, parametros):
+        """Transición, dependencias por longitud y convergencia (como calculate_all_dependencies_matrix)."""
+        denom = X.sum(axis=0, dtype=np.float64)
+        d = denom.copy()
+        d[d == 0.0] = np.inf
+        T = X / d
+        L = parametros["max_possible_length"]
+        dependencias = calcular_dependencias_por_longitud(T, L)
+        indirecta, longitud = calcular_longitudes_convergencia(T, dependencias, L,
+                                                               parametros["convergence_threshold"])
+        entrada = {
+            "paises": nombres,
+            "posicion": {p: k for k, p in enumerate(nombres)},
+            "X": X, "denom": denom, "T": T,
+            "dependencias": dependencias, "indirecta": indirecta, "longitud": longitud,
+            "orden_filas": np.argsort(-T, axis=1, kind="stable"),
+            "parametros": parametros,
+        }
+        entrada["bytes"] = sum(v.nbytes for v in (X, denom, T, indirecta, longitud, entrada["orden_filas"])) \
+            + sum(v.nbytes for v in dependencias.values())
+        return entrada
+
+    def info_cache(self):
+        return {"entradas": len(self._cache), "mb": round(self._bytes / (1 << 20), 2),
+                "max_mb": round(self.max_bytes / (1 << 20), 2), "aciertos": self.aciertos, "fallos": self.fallos}
+
+    # ---------- trazas ----------
+
+    def _indices(self, entrada, industry, exportador, importador):
+        posicion = entrada["posicion"]
+        if exportador not in posicion:
+            raise ValueError(f"Exportador '{exportador}' no en industria '{industry}'")
+        if importador not in posicion:
+            raise ValueError(f"Importador '{importador}' no en industria '{industry}'")
+        if exportador == importador:
+            raise ValueError("Exportador e importador deben ser distintos")
+        return posicion[exportador], posicion[importador]
+
+    def _traza(self, year, industry, entrada, j, i, rutas, top):
+        X, denom, nombres = entrada["X"], entrada["denom"], entrada["paises"]
+        parametros = entrada["parametros"]
+        umbral = parametros["path_strength_threshold"]
+        longitud = int(entrada["longitud"][j, i])
+        directa = float(entrada["T"][j, i])
+        indirecta = float(entrada["indirecta"][j, i])
+
+        desglose = {1: directa}
+        for L in range(2, longitud + 1):
+            desglose[L] = float(entrada["dependencias"][L][j, i])
+
+        caminos = []
+        for L, interms, fuerza in rutas[:top]:
+            camino = (j,) + tuple(interms) + (i,)
+            caminos.append({
+                'camino': ' → '.join(nombres[k] for k in camino),
+                'longitud': L,
+                'intermediarios': [nombres[k] for k in interms],
+                'fuerza': fuerza,
+                'significativo': fuerza > umbral and (L > 2 or umbral > 0),
+                'desglose_pasos': _desglose(camino, X, denom, nombres),
+            })
+        return {
+            'year': year,
+            'industry': industry,
+            'exportador': nombres[j],
+            'importador': nombres[i],
+            'resumen': {
+                'valor_comercio': float(X[j, i]),
+                'importaciones_totales': float(denom[i]),
+                'dependencia_directa': directa,
+                'dependencia_indirecta_total': indirecta,
+                'dependencia_total': directa + indirecta,
+                'longitud_optima': longitud,
+                'desglose_por_longitud': desglose,
+                'num_caminos_significativos': sum(1 for L, _, f in rutas if f > umbral and (L > 2 or umbral > 0)),
+            },
+            'caminos': caminos,
+            'parametros': {k: parametros[k] for k in
+                           ("convergence_threshold", "max_possible_length", "path_strength_threshold")},
+        }
+
+    def _rutas(self, entrada, j, importadores, top):
+        """Rutas desde j hacia los importadores pedidos (hasta su longitud de convergencia)."""
+        parametros = entrada["parametros"]
+        limites = np.zeros(len(entrada["paises"]), dtype=np.int64)
+        limites[importadores] = entrada["longitud"][j, importadores]
+        return buscar_caminos_desde(entrada["T"], j, parametros["max_possible_length"],
+                                    parametros["path_strength_threshold"], top_k=top, longitudes_j=limites,
+                                    orden_filas=entrada["orden_filas"])
+
+    def trazar(self, year, industry, exportador, importador, top=5):
+        """
+        Traza de un par: resumen (directa, indirecta, total, longitud de convergencia,
+        suma de cada longitud, caminos significativos) y las top rutas más fuertes con el
+        desglose X / importaciones / T de cada salto.
+
+        Raises:
+        -------
+        ValueError
+            Si el año, la industria o alguno de los países no está en la matriz limpia
+        """
+        entrada = self.matriz(year, industry)
+        j, i = self._indices(entrada, industry, exportador, importador)
+        rutas = self._rutas(entrada, j, [i], top)
+        return self._traza(year, industry, entrada, j, i, rutas.get(i, []), top)
+
+    def trazar_lote(self, pares, year=None, top=5):
+        """
+        Trazas de muchos pares: una carga por industria y una búsqueda de rutas por
+        (industria, exportador) para todos sus importadores.
+
+        Parameters:
+        -----------
+        pares : pandas.DataFrame o iterable
+            Columnas (o tuplas) year, industry, exporter, importer; sin year si se da year
+
+        Returns:
+        --------
+        list
+            Trazas en el orden de pares; los pares que no se pueden trazar llevan 'error'
+        """
+        if isinstance(pares, pd.DataFrame):
+            columnas = ["industry", "exporter", "importer"] if year is not None else \
+                ["year", "industry", "exporter", "importer"]
+            filas = list(pares[columnas].itertuples(index=False, name=None))
+        else:
+            filas = [tuple(p) for p in pares]
+        if year is not None:
+            filas = [(year, *f) for f in filas]
+
+        trazas = [None] * len(filas)
+        grupos = defaultdict(lambda: defaultdict(list))
+        for pos, (y, industry, exportador, importador) in enumerate(filas):
+            grupos[(y, industry)][exportador].append((pos, importador))
+
+        for (y, industry), por_exportador in grupos.items():
+            try:
+                entrada = self.matriz(y, industry)
+            except ValueError as e:
+                for pedidos in por_exportador.values():
+                    for pos, importador in pedidos:
+                        trazas[pos] = self._error(filas[pos], e)
+                continue
+            for exportador, pedidos in por_exportador.items():
+                validos = []
+                for pos, importador in pedidos:
+                    try:
+                        validos.append((pos, *self._indices(entrada, industry, exportador, importador)))
+                    except ValueError as e:
+                        trazas[pos] = self._error(filas[pos], e)
+                if not validos:
+                    continue
+                j = validos[0][1]
+                rutas = self._rutas(entrada, j, [i for _, _, i in validos], top)
+                for pos, _, i in validos:
+                    trazas[pos] = self._traza(y, industry, entrada, j, i, rutas.get(i, []), top)
+        return trazas
+
+    @staticmethod
+    def _error(fila, error):
+        y, industry, exportador, importador = fila
+        return {'year': y, 'industry': industry, 'exportador': exportador, 'importador': importador,
+                'error': str(error)}
+
+
+def tabla_trazas(trazas):
+    """
+    Una fila por traza: dependencias, longitud, suma de cada longitud (dep_L1...), número
+    de caminos significativos, ruta principal y error (si no se pudo trazar).
+    """
+    filas = []
+    for t in trazas:
+        fila = {'year': t['year'], 'industry': t['industry'], 'exporter': t['exportador'],
+                'importer': t['importador']}
+        if 'error' in t:
+            fila['error'] = t['error']
+        else:
+            r = t['resumen']
+            fila.update({
+                'trade_value': r['valor_comercio'],
+                'direct': r['dependencia_directa'],
+                'indirect': r['dependencia_indirecta_total'],
+                'total': r['dependencia_total'],
+                'longitud': r['longitud_optima'],
+                **{f'dep_L{L}': v for L, v in r['desglose_por_longitud'].items()},
+                'caminos_significativos': r['num_caminos_significativos'],
+                'camino_principal': t['caminos'][0]['camino'] if t['caminos'] else None,
+                'fuerza_principal': t['caminos'][0]['fuerza'] if t['caminos'] else None,
+            })
+        filas.append(fila)
+    df = pd.DataFrame(filas)
+    # Las longitudes de convergencia varían por par: dep_L1... juntas tras longitud
+    por_longitud = sorted((c for c in df.columns if c.startswith('dep_L')), key=lambda c: int(c[5:]))
+    resto = [c for c in df.columns if c not in por_longitud and c != 'error']
+    if 'longitud' in resto:
+        k = resto.index('longitud') + 1
+        resto[k:k] = por_longitud
+    return df[resto + (['error'] if 'error' in df.columns else [])]
+
+
+def verificar_trazas(n=15, max_possible_length=4, density=0.5, seed=0, atol=1e-9):
+    """
+    Compara las trazas (desde el almacén y desde matrices registradas) con un almacén
+    escrito por el motor: directa, indirecta, longitud, dep_L de cada longitud y la
+    fuerza de los caminos críticos.
+
+    Returns:
+    --------
+    dict
+        Resumen de la comparación ('ok', pares, diferencia máxima)
+
+    Raises:
+    -------
+    AssertionError
+        Si alguna traza no coincide con el motor
+    """
+    import tempfile
+
+    from dependency_engine import calculate_all_dependencies_matrix
+    from results_store import guardar_resultados
+
+    rng = np.random.default_rng(seed)
+    codigos = [f"C{k:02d}" for k in range(n)]
+    matrices, all_results = {}, {}
+    for k in range(2):
+        X = rng.pareto(1.5, size=(n, n))
+        X[rng.random((n, n)) > density] = 0.0
+        matrices[f"Industria {k}"] = pd.DataFrame(X, index=codigos, columns=codigos)
+        limpia = eliminar_filas_columnas_cero(X, country_names=codigos)
+        all_results[f"Industria {k}"] = {
+            "results": calculate_all_dependencies_matrix(limpia.values, limpia.columns.tolist(),
+                                                         max_possible_length=max_possible_length),
+            "matrix_shape": limpia.shape, "country_names": limpia.columns.tolist(),
+        }
+
+    max_diff, num = 0.0, 0
+    with tempfile.TemporaryDirectory(prefix="ise_trazas_") as tmp:
+        guardar_resultados(all_results, ruta_resultados(2016, Path(tmp)),
+                           parametros=parametros_motor(max_possible_length=max_possible_length))
+        servicio = ServicioTrazas(tmp, max_mb=1)
+        registradas = ServicioTrazas(tmp)
+        registradas.registrar_matrices(2017, matrices, max_possible_length=max_possible_length)
+        for industria, entrada in all_results.items():
+            deps = entrada["results"]["dependencies"]
+            pedidos = [(industria, d["exportador"], d["importador"]) for d in deps]
+            for trazas in (servicio.trazar_lote(pedidos, year=2016), registradas.trazar_lote(pedidos, year=2017)):
+                for d, t in zip(deps, trazas):
+                    r = t["resumen"]
+                    assert r["longitud_optima"] == d["longitud_optima"], (d, r)
+                    for valor, ref in ((r["dependencia_directa"], d["dependencia_directa"]),
+                                       (r["dependencia_indirecta_total"], d["dependencia_indirecta"]),
+                                       (r["dependencia_total"], d["dependencia_total"])):
+                        assert np.isclose(valor, ref, rtol=1e-9, atol=atol), (d, r)
+                        max_diff = max(max_diff, abs(valor - ref))
+                    for L, ref in d["dependencias_por_longitud"].items():
+                        if int(L) <= d["longitud_optima"]:
+                            assert np.isclose(r["desglose_por_longitud"][int(L)], ref, rtol=1e-9, atol=atol), (d, r)
+                    num += 1
+
+            # Caminos críticos del motor: mismas fuerzas que los significativos de la traza
+            criticos = defaultdict(list)
+            for c in entrada["results"]["critical_paths"]:
+                criticos[(c["exportador"], c["importador"])].append(c["fuerza"])
+            for (exportador, importador), fuerzas in list(criticos.items())[:20]:
+                t = servicio.trazar(2016, industria, exportador, importador, top=len(fuerzas))
+                assert t["resumen"]["num_caminos_significativos"] == len(fuerzas), (exportador, importador)
+                assert np.allclose(sorted(fuerzas, reverse=True), [c["fuerza"] for c in t["caminos"]],
+                                   rtol=1e-9, atol=atol), (exportador, importador)
+                for c in t["caminos"]:
+                    assert np.isclose(np.prod([p["T_valor"] for p in c["desglose_pasos"]]), c["fuerza"],
+                                      rtol=1e-9, atol=atol), c
+        assert servicio.info_cache()["entradas"] >= 1
+    return {'ok': True, 'pares': num, 'max_diff': max_diff}